@@ -263,21 +263,11 @@ def connect(site=None, db_name=None, set_admin_as_user=True):
 
 
 def connect_replica():
-	from vmraid.database import get_db
-
-	user = local.conf.db_name
-	password = local.conf.db_password
-	port = local.conf.replica_db_port
-
-	if local.conf.different_credentials_for_replica:
-		user = local.conf.replica_db_name
-		password = local.conf.replica_db_password
-
-	local.replica_db = get_db(host=local.conf.replica_host, user=user, password=password, port=port)
+	from vmraid.database.replica import connect_replica_db
 
 	# swap db connections
 	local.primary_db = local.db
-	local.db = local.replica_db
+	local.db = connect_replica_db()
 
 
 def get_site_config(sites_path=None, site_path=None):
@@ -339,6 +329,9 @@ def destroy():
 	if db:
 		db.close()
 
+	if replica_db := getattr(local, "replica_db", None):
+		replica_db.close()
+
 	release_local(local)
 
 
@@ -754,19 +747,15 @@ def is_whitelisted(method):
 
 
 def read_only():
+	"""Decorator: Read from the replica database, if `read_from_replica` is set in site config
+	or if reads can be routed to the replica (see `vmraid.database.replica`)."""
+
 	def innfn(fn):
 		def wrapper_fn(*args, **kwargs):
-			if conf.read_from_replica:
-				connect_replica()
+			from vmraid.database.replica import use_replica
 
-			try:
-				retval = fn(*args, **get_newargs(fn, kwargs))
-			finally:
-				if local and hasattr(local, "primary_db"):
-					local.db.close()
-					local.db = local.primary_db
-
-			return retval
+			with use_replica(force=bool(conf.read_from_replica)):
+				return fn(*args, **get_newargs(fn, kwargs))
 
 		return wrapper_fn
 
@@ -779,11 +768,11 @@ def write_only():
 		def wrapper_fn(*args, **kwargs):
 			primary_db = getattr(local, "primary_db", None)
 			replica_db = getattr(local, "replica_db", None)
-			in_read_only = getattr(local, "db", None) != primary_db
+			in_read_only = bool(primary_db) and getattr(local, "db", None) is not primary_db
 
 			# switch to primary connection
-			if in_read_only and primary_db:
-				local.db = local.primary_db
+			if in_read_only:
+				local.db = primary_db
 
 			try:
 				retval = fn(*args, **get_newargs(fn, kwargs))
@@ -851,6 +840,7 @@ def clear_cache(user=None, doctype=None):
 		vmraid.cache_manager.clear_domain_cache()
 		translate.clear_cache()
 		reset_metadata_version()
+		cache().clear_process_cache()
 		local.cache = {}
 		local.new_doc_templates = {}
 
@@ -1116,6 +1106,54 @@ def get_doc(*args, **kwargs):
 	return doc
 
 
+def get_docs(doctype, names, for_update=False):
+	"""Return a list of `vmraid.model.document.Document` objects of the given names,
+	loaded with a few batched queries instead of one query per document and child table.
+
+	:param doctype: DocType name.
+	:param names: List of document names.
+	:param for_update: [optional] select documents for update.
+
+	Example:
+
+	        todos = vmraid.get_docs("ToDo", ["TD0001", "TD0002"])
+
+	"""
+	import vmraid.model.document
+
+	return vmraid.model.document.get_docs(doctype, names, for_update=for_update)
+
+
+def insert_many(
+	docs, ignore_permissions=None, ignore_links=None, ignore_if_duplicate=False, ignore_mandatory=None
+):
+	"""Insert many new documents, batching the database writes in multi-row INSERT statements.
+
+	Documents are named, validated and run through the same hooks as `Document.insert`.
+
+	:param docs: List of document dicts or `Document` objects.
+	:param ignore_permissions: Do not check permissions if True.
+	:param ignore_if_duplicate: Skip documents whose name already exists.
+
+	Example:
+
+	        vmraid.insert_many([
+	                {"doctype": "ToDo", "description": "first"},
+	                {"doctype": "ToDo", "description": "second"},
+	        ])
+
+	"""
+	import vmraid.model.document
+
+	return vmraid.model.document.insert_many(
+		docs,
+		ignore_permissions=ignore_permissions,
+		ignore_links=ignore_links,
+		ignore_if_duplicate=ignore_if_duplicate,
+		ignore_mandatory=ignore_mandatory,
+	)
+
+
 def get_last_doc(doctype, filters=None, order_by="creation desc"):
 	"""Get last created document of this type."""
 	d = get_all(doctype, filters=filters, limit_page_length=1, order_by=order_by, pluck="name")
@@ -1734,6 +1772,8 @@ def get_list(doctype, *args, **kwargs):
 	:param order_by: Order By e.g. `modified desc`.
 	:param limit_start: Start results at record #. Default 0.
 	:param limit_page_length: No of records in the page. Default 20.
+	:param cursor: Keyset pagination, `""` for the first page, else `next_cursor` of the previous page.
+	        Returns a `CursorPage` (a list with `next_cursor`, None on the last page).
 
 	Example usage:
 
@@ -1761,6 +1801,8 @@ def get_all(doctype, *args, **kwargs):
 	:param order_by: Order By e.g. `modified desc`.
 	:param limit_start: Start results at record #. Default 0.
 	:param limit_page_length: No of records in the page. Default 20.
+	:param as_iterator: Return a generator that streams rows from a server side cursor, see
+	        `vmraid.db.sql_iter` for how uncommitted writes are read.
 
 	Example usage:
 
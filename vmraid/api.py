@@ -9,6 +9,7 @@ import vmraid
 import vmraid.client
 import vmraid.handler
 from vmraid import _
+from vmraid.model.db_query import CursorPage
 from vmraid.utils.data import sbool
 from vmraid.utils.response import build_response
 
@@ -27,6 +28,7 @@ def handle():
 	        - `?filters=[["Task", "name", "like", "%005"]]`
 	        - `?limit_start=0`
 	        - `?limit_page_length=20`
+	        - `?cursor=` to page with `next_cursor` tokens instead of `limit_start`
 
 	`/api/resource/{doctype}/{name}` will point to a resource
 	        `GET` will return doclist
@@ -128,6 +130,8 @@ def handle():
 
 					# set vmraid.get_list result to response
 					vmraid.local.response.update({"data": data})
+					if isinstance(data, CursorPage):
+						vmraid.local.response["next_cursor"] = data.next_cursor
 
 				if vmraid.local.request.method == "POST":
 					# fetch data from from dict
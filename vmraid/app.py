@@ -15,7 +15,9 @@ import vmraid
 import vmraid.api
 import vmraid.auth
 import vmraid.handler
+import vmraid.metrics
 import vmraid.monitor
+import vmraid.profiler
 import vmraid.rate_limiter
 import vmraid.recorder
 import vmraid.utils.response
@@ -54,6 +56,8 @@ def application(request):
 
 		vmraid.recorder.record()
 		vmraid.monitor.start()
+		vmraid.metrics.start()
+		vmraid.profiler.start()
 		vmraid.rate_limiter.apply()
 		vmraid.api.validate_auth()
 
@@ -95,6 +99,8 @@ def application(request):
 			vmraid.db.rollback()
 
 		vmraid.rate_limiter.update()
+		vmraid.profiler.stop()
+		vmraid.metrics.stop()
 		vmraid.monitor.stop(response)
 		vmraid.recorder.dump()
 
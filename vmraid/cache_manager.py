@@ -57,10 +57,10 @@ user_cache_keys = (
 	"has_role:Page",
 	"has_role:Report",
 	"desk_sidebar_items",
+	"permission_match_conditions",
 )
 
 doctype_cache_keys = (
-	"meta",
 	"form_meta",
 	"table_columns",
 	"last_modified",
@@ -79,13 +79,11 @@ def clear_user_cache(user=None):
 	clear_notifications(user)
 
 	if user:
-		for name in user_cache_keys:
-			cache.hdel(name, user)
+		cache.hdel_names(user_cache_keys, user)
 		cache.delete_keys("user:" + user)
 		clear_defaults_cache(user)
 	else:
-		for name in user_cache_keys:
-			cache.delete_key(name)
+		cache.delete_value(user_cache_keys)
 		clear_defaults_cache()
 		clear_global_cache()
 
@@ -108,27 +106,31 @@ def clear_global_cache():
 
 def clear_defaults_cache(user=None):
 	if user:
-		for p in [user] + common_default_keys:
-			vmraid.cache().hdel("defaults", p)
+		vmraid.cache().hdel_many("defaults", [user] + common_default_keys)
 	elif vmraid.flags.in_install != "vmraid":
 		vmraid.cache().delete_key("defaults")
 
 
 def clear_doctype_cache(doctype=None):
+	from vmraid.model.meta import bump_meta_version
+
 	clear_controller_cache(doctype)
 	cache = vmraid.cache()
 
 	if getattr(vmraid.local, "meta_cache") and (doctype in vmraid.local.meta_cache):
 		del vmraid.local.meta_cache[doctype]
 
-	for key in ("is_table", "doctype_modules", "document_cache"):
-		cache.delete_value(key)
+	# compiled match conditions depend on DocPerms and link fields of doctypes
+	cache.delete_value(
+		("is_table", "doctype_modules", "document_cache", "permission_match_conditions")
+	)
 
 	vmraid.local.document_cache = {}
 
 	def clear_single(dt):
-		for name in doctype_cache_keys:
-			cache.hdel(name, dt)
+		# cached meta is versioned, bumping the version invalidates it in all processes
+		bump_meta_version(dt)
+		cache.hdel_names(doctype_cache_keys, dt)
 
 	if doctype:
 		clear_single(doctype)
@@ -145,8 +147,8 @@ def clear_doctype_cache(doctype=None):
 
 	else:
 		# clear all
-		for name in doctype_cache_keys:
-			cache.delete_value(name)
+		bump_meta_version()
+		cache.delete_value(doctype_cache_keys)
 
 
 def clear_controller_cache(doctype=None):
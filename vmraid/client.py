@@ -30,6 +30,7 @@ def get_list(
 	debug=False,
 	as_dict=True,
 	or_filters=None,
+	cursor=None,
 ):
 	"""Returns a list of records by filters, fields, ordering and limit
 
@@ -38,7 +39,8 @@ def get_list(
 	:param filters: filter list by this dict
 	:param order_by: Order by this fieldname
 	:param limit_start: Start at this index
-	:param limit_page_length: Number of records to be returned (default 20)"""
+	:param limit_page_length: Number of records to be returned (default 20)
+	:param cursor: Use keyset pagination, `""` for the first page, else `next_cursor` of the last page"""
 	if vmraid.is_table(doctype):
 		check_parent_permission(parent, doctype)
 
@@ -53,6 +55,7 @@ def get_list(
 		limit_page_length=limit_page_length,
 		debug=debug,
 		as_list=not as_dict,
+		cursor=cursor,
 	)
 
 	validate_args(args)
@@ -445,9 +445,18 @@ def import_csv(
 	"--submit-after-import", default=False, is_flag=True, help="Submit document after importing it"
 )
 @click.option("--mute-emails", default=True, is_flag=True, help="Mute emails during import")
+@click.option(
+	"--bulk", "bulk_import", default=False, is_flag=True, help="Commit documents in batches"
+)
 @pass_context
 def data_import(
-	context, file_path, doctype, import_type=None, submit_after_import=False, mute_emails=True
+	context,
+	file_path,
+	doctype,
+	import_type=None,
+	submit_after_import=False,
+	mute_emails=True,
+	bulk_import=False,
 ):
 	"Import documents in bulk from CSV or XLSX using data import"
 	from vmraid.core.doctype.data_import.data_import import import_file
@@ -456,7 +465,9 @@ def data_import(
 
 	vmraid.init(site=site)
 	vmraid.connect()
-	import_file(doctype, file_path, import_type, submit_after_import, console=True)
+	import_file(
+		doctype, file_path, import_type, submit_after_import, console=True, bulk_import=bulk_import
+	)
 	vmraid.destroy()
 
 
@@ -2,17 +2,27 @@
 # Copyright (c) 2019, VMRaid Technologies and contributors
 # License: MIT. See LICENSE
 
+import math
 import os
 
 import vmraid
 from vmraid import _
 from vmraid.core.doctype.data_import.exporter import Exporter
-from vmraid.core.doctype.data_import.importer import Importer
+from vmraid.core.doctype.data_import.importer import (
+	SHARD_PROGRESS_EXPIRY,
+	Importer,
+	get_shard_progress_key,
+)
 from vmraid.model.document import Document
 from vmraid.modules.import_file import import_file_by_path
-from vmraid.utils.background_jobs import enqueue
+from vmraid.utils import cint
+from vmraid.utils.background_jobs import enqueue, get_jobs
 from vmraid.utils.csvutils import validate_google_sheets_url
 
+# shards of parallel imports run concurrently, one job per shard on the long queue
+SHARD_QUEUE = "long"
+SHARD_TIMEOUT = 10000
+
 
 class DataImport(Document):
 	def validate(self):
@@ -24,26 +34,40 @@ class DataImport(Document):
 		):
 			self.template_options = ""
 			self.template_warnings = ""
+			self.set("shards", [])
 
 		self.validate_import_file()
 		self.validate_google_sheets_url()
-		self.set_payload_count()
+		self.validate_parallel_jobs()
 
 	def validate_import_file(self):
 		if self.import_file:
-			# validate template
-			self.get_importer()
+			# validate template, only a sample of rows is parsed
+			i = self.get_importer(preview=True)
+			self.payload_count = i.import_file.get_payload_count()
 
 	def validate_google_sheets_url(self):
 		if not self.google_sheets_url:
 			return
 		validate_google_sheets_url(self.google_sheets_url)
 
+	def validate_parallel_jobs(self):
+		"""Shards are imported concurrently in any order, so documents must not depend on
+		documents of the same doctype, as parents of a tree or through self links do."""
+		if cint(self.parallel_jobs) <= 1:
+			return
+
+		meta = vmraid.get_meta(self.reference_doctype)
+		has_self_link = any(df.options == meta.name for df in meta.get_link_fields())
+		if meta.is_tree or has_self_link:
+			message = _("{0} cannot be imported in parallel, its documents link to each other")
+			vmraid.throw(
+				message.format(_(self.reference_doctype)), title=_("Parallel Import Not Allowed")
+			)
+
 	def set_payload_count(self):
-		if self.import_file:
-			i = self.get_importer()
-			payloads = i.import_file.get_payloads_for_import()
-			self.payload_count = len(payloads)
+		if self.import_file or self.google_sheets_url:
+			self.payload_count = self.get_importer(preview=True).import_file.get_payload_count()
 
 	@vmraid.whitelist()
 	def get_preview_from_template(self, import_file=None, google_sheets_url=None):
@@ -56,7 +80,7 @@ class DataImport(Document):
 		if not (self.import_file or self.google_sheets_url):
 			return
 
-		i = self.get_importer()
+		i = self.get_importer(preview=True)
 		return i.get_data_for_import_preview()
 
 	def start_import(self):
@@ -66,6 +90,9 @@ class DataImport(Document):
 		if is_scheduler_inactive() and not vmraid.flags.in_test:
 			vmraid.throw(_("Scheduler is inactive. Cannot import data."), title=_("Scheduler Inactive"))
 
+		if cint(self.parallel_jobs) > 1 or self.shards:
+			return self.start_parallel_import()
+
 		enqueued_jobs = [d.get("job_name") for d in get_info()]
 
 		if self.name not in enqueued_jobs:
@@ -82,14 +109,72 @@ class DataImport(Document):
 
 		return False
 
+	def start_parallel_import(self):
+		"""Split payloads into `parallel_jobs` shards of consecutive payloads and enqueue a job
+		per shard. Shards are made once, retrying only enqueues shards which did not succeed
+		and are not queued or running already."""
+		if not self.shards:
+			self.make_shards()
+
+		enqueued_jobs = get_jobs(site=vmraid.local.site, queue=SHARD_QUEUE, key="job_name")
+		enqueued_jobs = enqueued_jobs[vmraid.local.site]
+
+		shards = [
+			shard
+			for shard in self.shards
+			if shard.status != "Success" and get_shard_job_name(shard) not in enqueued_jobs
+		]
+		if not shards:
+			return False
+
+		for shard in shards:
+			shard.status = "Queued"
+			shard.error_message = None
+		self.save(ignore_permissions=True)
+
+		# payloads of shards which are not retried are done
+		done = sum(shard.end_index - shard.start_index for shard in self.shards if shard not in shards)
+		vmraid.cache().set(get_shard_progress_key(self.name), done, ex=SHARD_PROGRESS_EXPIRY)
+
+		for shard in shards:
+			enqueue(
+				import_shard,
+				queue=SHARD_QUEUE,
+				timeout=SHARD_TIMEOUT,
+				event="data_import",
+				job_name=get_shard_job_name(shard),
+				data_import=self.name,
+				shard=shard.name,
+				enqueue_after_commit=True,
+				now=vmraid.conf.developer_mode or vmraid.flags.in_test,
+			)
+
+		return True
+
+	def make_shards(self):
+		if not self.payload_count:
+			self.set_payload_count()
+
+		payload_count = self.payload_count or 0
+		shard_size = math.ceil(payload_count / max(cint(self.parallel_jobs), 1)) or 1
+		for start_index in range(0, payload_count, shard_size):
+			self.append(
+				"shards",
+				{
+					"start_index": start_index,
+					"end_index": min(start_index + shard_size, payload_count),
+					"status": "Queued",
+				},
+			)
+
 	def export_errored_rows(self):
 		return self.get_importer().export_errored_rows()
 
 	def download_import_log(self):
 		return self.get_importer().export_import_log()
 
-	def get_importer(self):
-		return Importer(self.reference_doctype, data_import=self)
+	def get_importer(self, preview=False):
+		return Importer(self.reference_doctype, data_import=self, preview=preview)
 
 
 @vmraid.whitelist()
@@ -120,6 +205,72 @@ def start_import(data_import):
 	vmraid.publish_realtime("data_import_refresh", {"data_import": data_import.name})
 
 
+def import_shard(data_import, shard):
+	"""Import payloads of one shard, runs in background job. The job finishing the last
+	shard sets the status of the import."""
+	data_import = vmraid.get_doc("Data Import", data_import)
+	row = data_import.get("shards", {"name": shard})[0]
+	if row.status == "Success":
+		return
+
+	vmraid.db.set_value("Data Import Shard", shard, "status", "Started")
+	vmraid.db.commit()
+
+	try:
+		i = Importer(data_import.reference_doctype, data_import=data_import, shard=row)
+		status = i.import_data()
+		vmraid.db.set_value("Data Import Shard", shard, "status", status or "Error")
+		vmraid.db.commit()
+
+	except Exception:
+		vmraid.db.rollback()
+		vmraid.log_error(title=data_import.name)
+		vmraid.db.set_value(
+			"Data Import Shard", shard, {"status": "Error", "error_message": vmraid.get_traceback()}
+		)
+		vmraid.db.commit()
+
+	finally:
+		vmraid.flags.in_import = False
+
+	finish_parallel_import(data_import.name)
+
+
+def finish_parallel_import(data_import):
+	"""Set status of the import once all its shards are done."""
+	# lock the import, so that shards finishing at the same time see each other's status
+	vmraid.db.get_value("Data Import", data_import, "status", for_update=True)
+
+	shards = vmraid.get_all(
+		"Data Import Shard",
+		filters={"parenttype": "Data Import", "parent": data_import},
+		pluck="status",
+	)
+	if any(status in ("Queued", "Started") for status in shards):
+		vmraid.db.commit()
+		return
+
+	imported = vmraid.db.count("Data Import Log", {"data_import": data_import, "success": 1})
+	if all(status == "Success" for status in shards):
+		status = "Success"
+	elif imported:
+		status = "Partial Success"
+	elif "Error" in shards:
+		status = "Error"
+	else:
+		status = "Pending"
+
+	vmraid.db.set_value("Data Import", data_import, "status", status)
+	vmraid.db.commit()
+	vmraid.cache().delete(get_shard_progress_key(data_import))
+
+	vmraid.publish_realtime("data_import_refresh", {"data_import": data_import})
+
+
+def get_shard_job_name(shard):
+	return f"{shard.parent}::{shard.idx}"
+
+
 @vmraid.whitelist()
 def download_template(
 	doctype, export_fields=None, export_records=None, export_filters=None, file_type="CSV"
@@ -184,7 +335,9 @@ def get_import_status(data_import_name):
 	return import_status
 
 
-def import_file(doctype, file_path, import_type, submit_after_import=False, console=False):
+def import_file(
+	doctype, file_path, import_type, submit_after_import=False, console=False, bulk_import=False
+):
 	"""
 	Import documents in from CSV or XLSX using data import.
 
@@ -193,10 +346,12 @@ def import_file(doctype, file_path, import_type, submit_after_import=False, cons
 	:param import_type: One of "Insert" or "Update"
 	:param submit_after_import: Whether to submit documents after import
 	:param console: Set to true if this is to be used from command line. Will print errors or progress to stdout.
+	:param bulk_import: Commit documents in batches instead of one at a time, see `Importer.import_payloads_in_bulk`.
 	"""
 
 	data_import = vmraid.new_doc("Data Import")
 	data_import.submit_after_import = submit_after_import
+	data_import.bulk_import = bulk_import
 	data_import.import_type = (
 		"Insert New Records" if import_type.lower() == "insert" else "Update Existing Records"
 	)
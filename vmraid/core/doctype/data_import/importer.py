@@ -6,29 +6,55 @@ import json
 import os
 import timeit
 from datetime import date, datetime
+from itertools import count, islice
 
 import vmraid
 from vmraid import _
 from vmraid.core.doctype.version.version import get_diff
+from vmraid.database.database import get_commit_queues, restore_commit_queues
 from vmraid.model import no_value_fields
 from vmraid.model import table_fields as table_fieldtypes
-from vmraid.utils import cint, cstr, duration_to_seconds, flt, update_progress_bar
-from vmraid.utils.csvutils import get_csv_content_from_google_sheets, read_csv_content
-from vmraid.utils.xlsxutils import (
-	read_xls_file_from_attached_file,
-	read_xlsx_file_from_attached_file,
+from vmraid.model.naming import (
+	get_series_reservations,
+	restore_series_reservations,
+	series_reservation,
 )
+from vmraid.utils import cint, cstr, duration_to_seconds, flt, update_progress_bar
+from vmraid.utils.csvutils import get_csv_content_from_google_sheets, read_csv_file
+from vmraid.utils.xlsxutils import read_xls_file_from_attached_file, read_xlsx_rows
 
 INVALID_VALUES = ("", None)
 MAX_ROWS_IN_PREVIEW = 10
+# rows read for the preview, column types and warnings are inferred from these rows
+PREVIEW_SAMPLE_SIZE = 1000
 INSERT = "Insert New Records"
 UPDATE = "Update Existing Records"
 
+# documents committed at a time in bulk imports
+BULK_IMPORT_CHUNK_SIZE = 500
+BULK_IMPORT_SAVEPOINT = "bulk_import"
+
+# progress of parallel imports is shared by their shards for this long
+SHARD_PROGRESS_EXPIRY = 24 * 60 * 60
+
 
 class Importer:
-	def __init__(self, doctype, data_import=None, file_path=None, import_type=None, console=False):
+	def __init__(
+		self,
+		doctype,
+		data_import=None,
+		file_path=None,
+		import_type=None,
+		console=False,
+		preview=False,
+		shard=None,
+	):
+		"""
+		:param shard: Import only the payloads of this Data Import Shard row."""
 		self.doctype = doctype
 		self.console = console
+		self.shard = shard
+		self.shard_progress = 0
 
 		self.data_import = data_import
 		if not self.data_import:
@@ -44,6 +70,8 @@ class Importer:
 			file_path or data_import.google_sheets_url or data_import.import_file,
 			self.template_options,
 			self.import_type,
+			sample_size=PREVIEW_SAMPLE_SIZE if preview else None,
+			payload_range=(shard.start_index, shard.end_index) if shard else None,
 		)
 
 	def get_data_for_import_preview(self):
@@ -71,6 +99,7 @@ class Importer:
 		self.data_import.db_set("template_warnings", "")
 
 	def import_data(self):
+		"""Import all payloads, or only the payloads of the shard being imported."""
 		self.before_import()
 
 		# parse docs from rows
@@ -87,6 +116,9 @@ class Importer:
 				self.data_import.db_set("template_warnings", json.dumps(warnings))
 			return
 
+		if self.shard:
+			return self.import_shard(payloads)
+
 		# setup import log
 		import_log = (
 			vmraid.db.get_all(
@@ -119,7 +151,94 @@ class Importer:
 
 		# start import
 		total_payload_count = len(payloads)
+		if cint(self.data_import.bulk_import):
+			self.import_payloads_in_bulk(payloads, imported_rows, count(log_index))
+		else:
+			self.import_payloads(payloads, imported_rows, count(log_index))
+
+		# Logs are db inserted directly so will have to be fetched again
+		import_log = (
+			vmraid.db.get_all(
+				"Data Import Log",
+				fields=["row_indexes", "success", "log_index"],
+				filters={"data_import": self.data_import.name},
+				order_by="log_index",
+			)
+			or []
+		)
+
+		# set status
+		failures = [log for log in import_log if not log.get("success")]
+		if len(failures) == total_payload_count:
+			status = "Pending"
+		elif len(failures) > 0:
+			status = "Partial Success"
+		else:
+			status = "Success"
+
+		if self.console:
+			self.print_import_log(import_log)
+		else:
+			self.data_import.db_set("status", status)
+
+		self.after_import()
+
+		return import_log
+
+	def import_shard(self, payloads):
+		"""Import payloads `shard.start_index` to `shard.end_index`, which are the only ones
+		read from the file, while other shards of the same import are imported by other
+		workers. Returns the status of the shard.
+
+		Import logs of a shard have log indexes in the same range. Failures of a previous
+		run of the shard are removed, so that a retry only imports its failed rows again and
+		logs them with the indexes of the removed failures."""
+		shard = self.shard
+		log_filters = {
+			"data_import": self.data_import.name,
+			"log_index": ("between", [shard.start_index, shard.end_index - 1]),
+		}
+
+		vmraid.db.delete("Data Import Log", dict(log_filters, success=0))
+		imported_logs = vmraid.get_all(
+			"Data Import Log", filters=log_filters, fields=["log_index", "row_indexes"]
+		)
+		imported_rows = [row for log in imported_logs for row in json.loads(log.row_indexes)]
+		used_log_indexes = {log.log_index for log in imported_logs}
+		log_indexes = (
+			index
+			for index in range(shard.start_index, shard.end_index)
+			if index not in used_log_indexes
+		)
+
+		if cint(self.data_import.bulk_import):
+			self.import_payloads_in_bulk(payloads, imported_rows, log_indexes)
+		else:
+			self.import_payloads(payloads, imported_rows, log_indexes)
+
+		self.after_import()
+
+		if vmraid.db.count("Data Import Log", dict(log_filters, success=0)):
+			return "Partial Success"
+		return "Success"
+
+	def get_progress(self, current_index, total_payload_count):
+		"""Returns `(current, total)` progress of the import. Shards add their progress to
+		a counter shared by all shards of the import."""
+		if not self.shard:
+			return current_index, total_payload_count
+
+		current = vmraid.cache().incrby(
+			get_shard_progress_key(self.data_import.name), current_index - self.shard_progress
+		)
+		self.shard_progress = current_index
+		return current, self.data_import.payload_count
+
+	def import_payloads(self, payloads, imported_rows, log_indexes):
+		"""Import payloads one by one, `log_indexes` yields the index of each import log."""
+		total_payload_count = len(payloads)
 		batch_size = vmraid.conf.data_import_batch_size or 1000
+		imported_rows = set(imported_rows)
 
 		for batch_index, batched_payloads in enumerate(vmraid.utils.create_batch(payloads, batch_size)):
 			for i, payload in enumerate(batched_payloads):
@@ -127,14 +246,15 @@ class Importer:
 				row_indexes = [row.row_number for row in payload.rows]
 				current_index = (i + 1) + (batch_index * batch_size)
 
-				if set(row_indexes).intersection(set(imported_rows)):
+				if imported_rows.intersection(row_indexes):
 					print("Skipping imported rows", row_indexes)
 					if total_payload_count > 5:
+						current, total = self.get_progress(current_index, total_payload_count)
 						vmraid.publish_realtime(
 							"data_import_progress",
 							{
-								"current": current_index,
-								"total": total_payload_count,
+								"current": current,
+								"total": total,
 								"skipping": True,
 								"data_import": self.data_import.name,
 							},
@@ -154,11 +274,12 @@ class Importer:
 							total_payload_count,
 						)
 					elif total_payload_count > 5:
+						current, total = self.get_progress(current_index, total_payload_count)
 						vmraid.publish_realtime(
 							"data_import_progress",
 							{
-								"current": current_index,
-								"total": total_payload_count,
+								"current": current,
+								"total": total,
 								"docname": doc.name,
 								"data_import": self.data_import.name,
 								"success": True,
@@ -169,12 +290,10 @@ class Importer:
 
 					create_import_log(
 						self.data_import.name,
-						log_index,
+						next(log_indexes),
 						{"success": True, "docname": doc.name, "row_indexes": row_indexes},
 					)
 
-					log_index += 1
-
 					if not self.data_import.status == "Partial Success":
 						self.data_import.db_set("status", "Partial Success")
 
@@ -190,7 +309,7 @@ class Importer:
 
 					create_import_log(
 						self.data_import.name,
-						log_index,
+						next(log_indexes),
 						{
 							"success": False,
 							"exception": vmraid.get_traceback(),
@@ -199,36 +318,87 @@ class Importer:
 						},
 					)
 
-					log_index += 1
+	def import_payloads_in_bulk(self, payloads, imported_rows, log_indexes):
+		"""Import payloads in chunks of `data_import_bulk_chunk_size` (site config) documents,
+		`log_indexes` yields the index of each import log.
 
-		# Logs are db inserted directly so will have to be fetched again
-		import_log = (
-			vmraid.db.get_all(
-				"Data Import Log",
-				fields=["row_indexes", "success", "log_index"],
-				filters={"data_import": self.data_import.name},
-				order_by="log_index",
-			)
-			or []
-		)
+		Every document is inserted in a savepoint, so that a failing row is rolled back
+		without the rest of its chunk, along with the jobs and realtime events it queued for
+		the commit, and each chunk is committed once. Numbers of naming series are reserved
+		for the whole chunk and import logs are written with one multi-row insert per chunk."""
+		total_payload_count = len(payloads)
+		chunk_size = cint(vmraid.conf.data_import_bulk_chunk_size) or BULK_IMPORT_CHUNK_SIZE
+		imported_rows = set(imported_rows)
+		current_index = 0
+
+		for chunk in vmraid.utils.create_batch(payloads, chunk_size):
+			start = timeit.default_timer()
+			import_logs = []
+
+			with series_reservation(len(chunk)):
+				for payload in chunk:
+					current_index += 1
+					row_indexes = [row.row_number for row in payload.rows]
+					if imported_rows.intersection(row_indexes):
+						continue
 
-		# set status
-		failures = [log for log in import_log if not log.get("success")]
-		if len(failures) == total_payload_count:
-			status = "Pending"
-		elif len(failures) > 0:
-			status = "Partial Success"
-		else:
-			status = "Success"
+					reservations = get_series_reservations()
+					commit_queues = get_commit_queues()
+					vmraid.db.savepoint(BULK_IMPORT_SAVEPOINT)
+					try:
+						doc = self.process_doc(payload.doc)
+						vmraid.db.release_savepoint(BULK_IMPORT_SAVEPOINT)
+						import_logs.append(
+							{"success": True, "docname": doc.name, "row_indexes": row_indexes}
+						)
 
-		if self.console:
-			self.print_import_log(import_log)
-		else:
-			self.data_import.db_set("status", status)
+					except Exception:
+						messages = vmraid.local.message_log
+						vmraid.clear_messages()
 
-		self.after_import()
+						vmraid.db.rollback(save_point=BULK_IMPORT_SAVEPOINT)
+						# series numbers reserved or used by the failed row are undone
+						restore_series_reservations(reservations)
+						# as are jobs and realtime events queued for the commit
+						restore_commit_queues(commit_queues)
 
-		return import_log
+						import_logs.append(
+							{
+								"success": False,
+								"exception": vmraid.get_traceback(),
+								"messages": messages,
+								"row_indexes": row_indexes,
+							}
+						)
+
+			create_import_logs(self.data_import.name, log_indexes, import_logs)
+
+			succeeded = any(log["success"] for log in import_logs)
+			if succeeded and self.data_import.status != "Partial Success":
+				self.data_import.db_set("status", "Partial Success")
+
+			vmraid.db.commit()
+
+			processing_time = (timeit.default_timer() - start) / len(chunk)
+			eta = self.get_eta(current_index, total_payload_count, processing_time)
+			if self.console:
+				update_progress_bar(
+					"Importing {0} records".format(total_payload_count),
+					current_index,
+					total_payload_count,
+				)
+			elif total_payload_count > 5:
+				current, total = self.get_progress(current_index, total_payload_count)
+				vmraid.publish_realtime(
+					"data_import_progress",
+					{
+						"current": current,
+						"total": total,
+						"data_import": self.data_import.name,
+						"success": True,
+						"eta": eta,
+					},
+				)
 
 	def after_import(self):
 		vmraid.flags.in_import = False
@@ -392,8 +562,24 @@ class Importer:
 
 
 class ImportFile:
-	def __init__(self, doctype, file, template_options=None, import_type=None):
+	def __init__(
+		self,
+		doctype,
+		file,
+		template_options=None,
+		import_type=None,
+		sample_size=None,
+		payload_range=None,
+	):
+		"""
+		:param sample_size: Parse only the first `sample_size` rows, e.g. for the import preview.
+		        Remaining rows are only counted.
+		:param payload_range: `(start, end)`, parse only the rows of payloads `start` to `end`
+		        (exclusive), e.g. for a shard of a parallel import. Other rows are skipped."""
 		self.doctype = doctype
+		self.sample_size = sample_size
+		self.raw_row_indexes = None
+		self.row_count = self.payload_count = None
 		self.template_options = template_options or vmraid._dict(column_to_field_map=vmraid._dict())
 		self.column_to_field_map = self.template_options.column_to_field_map
 		self.import_type = import_type
@@ -411,40 +597,48 @@ class ImportFile:
 		if not self.file_doc and not self.file_path and not self.google_sheets_url:
 			vmraid.throw(_("Invalid template file for import"))
 
-		self.raw_data = self.get_data_from_template_file()
+		rows = self.get_data_from_template_file()
+		if payload_range:
+			self.raw_row_indexes, self.raw_data = self.read_payload_range(rows, *payload_range)
+		else:
+			self.raw_data = list(islice(rows, self.sample_size))
+		if not self.raw_data:
+			vmraid.throw(_("Invalid or corrupted content for import"))
+
 		self.parse_data_from_template()
 
+		if self.sample_size:
+			self.count_rows(rows)
+		rows.close()
+
 	def get_data_from_template_file(self):
-		content = None
+		"""Yields rows of the template file, reading local files lazily."""
 		extension = None
 
 		if self.file_doc:
-			parts = self.file_doc.get_extension()
-			extension = parts[1]
-			content = self.file_doc.get_content()
-			extension = extension.lstrip(".")
+			extension = self.file_doc.get_extension()[1].lstrip(".")
+			file_path = self.file_doc.get_full_path()
+			if os.path.exists(file_path):
+				yield from self.read_file(file_path, extension)
+			else:
+				yield from self.read_content(self.file_doc.get_content(), extension)
 
 		elif self.file_path:
-			content, extension = self.read_file(self.file_path)
+			yield from self.read_file(self.file_path)
 
 		elif self.google_sheets_url:
 			content = get_csv_content_from_google_sheets(self.google_sheets_url)
-			extension = "csv"
-
-		if not content:
-			vmraid.throw(_("Invalid or corrupted content for import"))
-
-		if not extension:
-			extension = "csv"
-
-		if content:
-			return self.read_content(content, extension)
+			yield from self.read_content(content, "csv")
 
 	def parse_data_from_template(self):
 		header = None
 		data = []
 
-		for i, row in enumerate(self.raw_data):
+		# link values are checked again for every import, they may have been created or deleted
+		Row.link_values_exist_map = {}
+
+		row_indexes = self.raw_row_indexes or range(len(self.raw_data))
+		for i, row in zip(row_indexes, self.raw_data):
 			if all(v in INVALID_VALUES for v in row):
 				# empty row
 				continue
@@ -465,6 +659,66 @@ class ImportFile:
 				title=_("Template Error"),
 			)
 
+	def read_payload_range(self, rows, start, end):
+		"""Returns `(row indexes, rows)` of the header and of the rows of payloads `start` to
+		`end`, rows of other payloads are not kept."""
+		row_indexes, raw_data = [], []
+		parent_column_indexes = None
+		payload_index = -1
+
+		for i, row in enumerate(rows):
+			if all(v in INVALID_VALUES for v in row):
+				continue
+
+			if not raw_data:
+				# only the header row is needed to find the parent columns
+				header = Header(i, row, self.doctype, [row], self.column_to_field_map)
+				if len(header.doctypes) > 1:
+					parent_column_indexes = header.get_column_indexes(self.doctype)
+			else:
+				if payload_index < 0 or is_payload_start(row, parent_column_indexes):
+					payload_index += 1
+				if payload_index >= end:
+					break
+				if payload_index < start:
+					continue
+
+			row_indexes.append(i)
+			raw_data.append(row)
+
+		return row_indexes, raw_data
+
+	def count_rows(self, rows):
+		"""Count rows and payloads of the rows which were not parsed, without parsing them."""
+		parent_column_indexes = self.get_parent_column_indexes()
+		self.row_count = len(self.data)
+		self.payload_count = self.get_payload_count()
+
+		for row in rows:
+			if all(v in INVALID_VALUES for v in row):
+				continue
+
+			self.row_count += 1
+			if is_payload_start(row, parent_column_indexes):
+				self.payload_count += 1
+
+	def get_payload_count(self):
+		"""Returns number of documents in the file, without parsing them."""
+		if self.payload_count is not None:
+			return self.payload_count
+
+		parent_column_indexes = self.get_parent_column_indexes()
+		return sum(
+			1
+			for i, row in enumerate(self.data)
+			if i == 0 or is_payload_start(row.data, parent_column_indexes)
+		)
+
+	def get_parent_column_indexes(self):
+		# without child table columns, every row is a document
+		if len(self.header.doctypes) > 1:
+			return self.header.get_column_indexes(self.doctype)
+
 	def get_data_for_import_preview(self):
 		"""Adds a serial number column as the first column"""
 
@@ -492,7 +746,7 @@ class ImportFile:
 		out.data = data
 		out.columns = columns
 		out.warnings = warnings
-		total_number_of_rows = len(out.data)
+		total_number_of_rows = self.row_count or len(out.data)
 		if total_number_of_rows > MAX_ROWS_IN_PREVIEW:
 			out.data = out.data[:MAX_ROWS_IN_PREVIEW]
 			out.max_rows_exceeded = True
@@ -573,28 +827,37 @@ class ImportFile:
 
 	######
 
-	def read_file(self, file_path):
-		extn = file_path.split(".")[1]
+	def read_file(self, file_path, extension=None):
+		extension = extension or file_path.split(".")[1]
+		self.validate_extension(extension)
 
-		file_content = None
 		with io.open(file_path, mode="rb") as f:
-			file_content = f.read()
-
-		return file_content, extn
+			yield from self.read_fileobj(f, extension)
 
 	def read_content(self, content, extension):
-		error_title = _("Template Error")
-		if extension not in ("csv", "xlsx", "xls"):
-			vmraid.throw(_("Import template should be of type .csv, .xlsx or .xls"), title=error_title)
+		self.validate_extension(extension)
+
+		if not content:
+			vmraid.throw(_("Invalid or corrupted content for import"))
 
+		if isinstance(content, str):
+			content = content.encode("utf-8")
+
+		yield from self.read_fileobj(io.BytesIO(content), extension)
+
+	def read_fileobj(self, fileobj, extension):
 		if extension == "csv":
-			data = read_csv_content(content)
+			yield from read_csv_file(fileobj)
 		elif extension == "xlsx":
-			data = read_xlsx_file_from_attached_file(fcontent=content)
+			yield from read_xlsx_rows(fileobj)
 		elif extension == "xls":
-			data = read_xls_file_from_attached_file(content)
+			yield from read_xls_file_from_attached_file(fileobj.read())
 
-		return data
+	def validate_extension(self, extension):
+		if extension not in ("csv", "xlsx", "xls"):
+			vmraid.throw(
+				_("Import template should be of type .csv, .xlsx or .xls"), title=_("Template Error")
+			)
 
 
 class Row:
@@ -986,8 +1249,12 @@ class Column:
 		if self.df.fieldtype == "Link":
 			# find all values that dont exist
 			values = list({cstr(v) for v in self.column_values[1:] if v})
-			exists = [d.name for d in vmraid.db.get_all(self.df.options, filters={"name": ("in", values)})]
+			exists = get_existing_link_values(self.df.options, values)
 			not_exists = list(set(values) - set(exists))
+
+			# rows don't have to check these values again, see `Row.link_exists`
+			for value in exists:
+				Row.link_values_exist_map[self.df.options + "::" + value] = True
 			if not_exists:
 				missing_values = ", ".join(not_exists)
 				self.warnings.append(
@@ -1247,6 +1514,15 @@ def get_select_options(df):
 	return [d for d in (df.options or "").split("\n") if d]
 
 
+def get_existing_link_values(doctype, values, batch_size=1000):
+	"""Returns `values` which exist as names of `doctype`, checked with one query per batch."""
+	exists = []
+	for batch in vmraid.utils.create_batch(values, batch_size):
+		exists += vmraid.db.get_all(doctype, filters={"name": ("in", batch)}, pluck="name")
+
+	return exists
+
+
 def create_import_log(data_import, log_index, log_details):
 	vmraid.get_doc(
 		{
@@ -1260,3 +1536,54 @@ def create_import_log(data_import, log_index, log_details):
 			"exception": log_details.get("exception"),
 		}
 	).db_insert()
+
+
+def create_import_logs(data_import, log_indexes, logs):
+	"""Insert import logs (see `create_import_log`) with a single query, `log_indexes`
+	yields the index of each log."""
+	now = vmraid.utils.now()
+	vmraid.db.bulk_insert(
+		"Data Import Log",
+		fields=[
+			"name",
+			"log_index",
+			"success",
+			"data_import",
+			"row_indexes",
+			"docname",
+			"messages",
+			"exception",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+		],
+		values=[
+			(
+				vmraid.generate_hash(length=10),
+				log_index,
+				cint(log.get("success")),
+				data_import,
+				json.dumps(log.get("row_indexes")),
+				log.get("docname"),
+				json.dumps(log.get("messages", "[]")),
+				log.get("exception"),
+				now,
+				now,
+				vmraid.session.user,
+				vmraid.session.user,
+			)
+			for log, log_index in zip(logs, log_indexes)
+		],
+	)
+
+
+def is_payload_start(row, parent_column_indexes):
+	"""Rows with blank parent columns are child rows of the previous document."""
+	if not parent_column_indexes:
+		return True
+	return any(get_item_at_index(row, i) not in INVALID_VALUES for i in parent_column_indexes)
+
+
+def get_shard_progress_key(data_import):
+	return vmraid.cache().make_key(f"data_import_shard_progress:{data_import}")
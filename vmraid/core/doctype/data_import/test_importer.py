@@ -4,9 +4,10 @@
 import unittest
 
 import vmraid
-from vmraid.core.doctype.data_import.importer import Importer
+from vmraid.core.doctype.data_import.importer import Importer, ImportFile
+from vmraid.core.doctype.doctype.test_doctype import new_doctype
 from vmraid.tests.test_query_builder import db_type_is, run_only_if
-from vmraid.utils import format_duration, getdate
+from vmraid.utils import cint, format_duration, getdate
 
 doctype_name = "DocType for Import"
 
@@ -128,10 +129,164 @@ class TestImporter(unittest.TestCase):
 		self.assertEqual(updated_doc.table_field_1[0].child_description, "child description")
 		self.assertEqual(updated_doc.table_field_1_again[0].child_title, "child title again")
 
-	def get_importer(self, doctype, import_file, update=False):
+	def test_bulk_data_import(self):
+		titles = [vmraid.generate_hash(length=8) for i in range(3)]
+		content = "Title,Description\n{0},first\n,missing title\n{1},second\n{2},third\n".format(*titles)
+		import_file = vmraid.get_doc(
+			doctype="File", content=content, file_name=f"bulk_{titles[0]}.csv", is_private=1
+		)
+		import_file.save(ignore_permissions=True)
+
+		data_import = self.get_importer(doctype_name, import_file, bulk_import=True)
+		data_import.start_import()
+		data_import.reload()
+
+		for title in titles:
+			self.assertTrue(vmraid.db.exists(doctype_name, title))
+
+		import_log = vmraid.db.get_all(
+			"Data Import Log",
+			fields=["row_indexes", "success"],
+			filters={"data_import": data_import.name},
+			order_by="log_index",
+		)
+		self.assertEqual(len(import_log), 4)
+		failures = [log for log in import_log if not log.success]
+		self.assertEqual(len(failures), 1)
+		self.assertEqual(vmraid.parse_json(failures[0].row_indexes), [3])
+		self.assertEqual(data_import.status, "Partial Success")
+
+	def test_bulk_data_import_naming_series(self):
+		doctype = "Series DocType for Import"
+		if not vmraid.db.exists("DocType", doctype):
+			vmraid.get_doc(
+				{
+					"doctype": "DocType",
+					"name": doctype,
+					"module": "Custom",
+					"custom": 1,
+					"autoname": "TIMP-.#####",
+					"fields": [
+						{"label": "Title", "fieldname": "title", "reqd": 1, "fieldtype": "Data"},
+						{"label": "Description", "fieldname": "description", "fieldtype": "Data"},
+					],
+					"permissions": [{"role": "System Manager"}],
+				}
+			).insert()
+
+		start = cint(vmraid.db.get_value("Series", "TIMP-", "current"))
+		content = "Title,Description\nfirst,1\n,missing title\nsecond,2\nthird,3\n"
+		import_file = vmraid.get_doc(
+			doctype="File",
+			content=content,
+			file_name=f"series_{vmraid.generate_hash(length=8)}.csv",
+			is_private=1,
+		)
+		import_file.save(ignore_permissions=True)
+
+		data_import = self.get_importer(doctype, import_file, bulk_import=True)
+		data_import.start_import()
+
+		# the failed row does not leave a gap in the series
+		names = vmraid.get_all(doctype, filters={"name": (">", f"TIMP-{start:05d}")}, pluck="name")
+		self.assertEqual(sorted(names), [f"TIMP-{start + i:05d}" for i in range(1, 4)])
+		self.assertEqual(cint(vmraid.db.get_value("Series", "TIMP-", "current")), start + 3)
+
+	def test_import_file_sample(self):
+		import_file = get_import_file("sample_import_file")
+		full = ImportFile(doctype_name, import_file.file_url)
+		sample = ImportFile(doctype_name, import_file.file_url, sample_size=3)
+
+		self.assertEqual(len(sample.data), 2)
+		self.assertEqual(sample.row_count, len(full.data))
+		self.assertEqual(sample.get_payload_count(), len(full.get_payloads_for_import()))
+		self.assertEqual(full.get_payload_count(), len(full.get_payloads_for_import()))
+
+		preview = sample.get_data_for_import_preview()
+		self.assertEqual(preview.data, [[row.row_number] + row.as_list() for row in sample.data])
+
+	def test_import_file_payload_range(self):
+		import_file = get_import_file("sample_import_file")
+		payloads = ImportFile(doctype_name, import_file.file_url).get_payloads_for_import()
+		shard = ImportFile(doctype_name, import_file.file_url, payload_range=(1, 3))
+
+		def get_row_numbers(payloads):
+			return [[row.row_number for row in payload.rows] for payload in payloads]
+
+		self.assertEqual(
+			get_row_numbers(shard.get_payloads_for_import()), get_row_numbers(payloads[1:3])
+		)
+
+	def test_parallel_import_of_linked_documents(self):
+		doctype = "Self Linked Doctype for Import"
+		if not vmraid.db.exists("DocType", doctype):
+			new_doctype(
+				doctype,
+				fields=[
+					{
+						"label": "Previous",
+						"fieldname": "previous",
+						"fieldtype": "Link",
+						"options": doctype,
+					}
+				],
+			).insert()
+
+		data_import = vmraid.new_doc("Data Import")
+		data_import.update({"reference_doctype": doctype, "parallel_jobs": 2})
+		self.assertRaises(vmraid.ValidationError, data_import.validate_parallel_jobs)
+
+		data_import.parallel_jobs = 1
+		data_import.validate_parallel_jobs()
+
+	def test_parallel_data_import(self):
+		titles = [vmraid.generate_hash(length=8) for i in range(3)]
+		content = "Title,Description\n{0},first\n{1},second\n,missing title\n{2},third\n".format(
+			*titles
+		)
+		import_file = vmraid.get_doc(
+			doctype="File", content=content, file_name=f"parallel_{titles[0]}.csv", is_private=1
+		)
+		import_file.save(ignore_permissions=True)
+
+		data_import = self.get_importer(doctype_name, import_file, parallel_jobs=2)
+		data_import.start_import()
+		data_import.reload()
+
+		for title in titles:
+			self.assertTrue(vmraid.db.exists(doctype_name, title))
+
+		self.assertEqual(
+			[(shard.start_index, shard.end_index, shard.status) for shard in data_import.shards],
+			[(0, 2, "Success"), (2, 4, "Partial Success")],
+		)
+		self.assertEqual(data_import.status, "Partial Success")
+
+		def get_import_log():
+			return vmraid.get_all(
+				"Data Import Log",
+				fields=["log_index", "row_indexes", "success", "name"],
+				filters={"data_import": data_import.name},
+				order_by="log_index",
+			)
+
+		import_log = get_import_log()
+		self.assertEqual([log.log_index for log in import_log], [0, 1, 2, 3])
+		self.assertEqual([log.success for log in import_log], [1, 1, 0, 1])
+
+		# retrying only re-runs the failed shard and replaces its failures
+		data_import.start_import()
+		retry_log = get_import_log()
+		self.assertEqual([log.log_index for log in retry_log], [0, 1, 2, 3])
+		self.assertEqual([log.success for log in retry_log], [1, 1, 0, 1])
+		self.assertEqual([log.name for log in retry_log[:2]], [log.name for log in import_log[:2]])
+		self.assertNotEqual(retry_log[2].name, import_log[2].name)
+
+	def get_importer(self, doctype, import_file, update=False, **kwargs):
 		data_import = vmraid.new_doc("Data Import")
 		data_import.import_type = "Insert New Records" if not update else "Update Existing Records"
 		data_import.reference_doctype = doctype
+		data_import.update(kwargs)
 		data_import.import_file = import_file.file_url
 		data_import.insert()
 		# Commit so that the first import failure does not rollback the Data Import insert.
@@ -53,6 +53,13 @@ class DocShare(Document):
 				)
 			)
 
+	def clear_permission_cache(self):
+		"""Shared documents are part of the cached match conditions of users"""
+		if self.everyone:
+			vmraid.cache().delete_value("permission_match_conditions")
+		else:
+			vmraid.cache().hdel("permission_match_conditions", self.user)
+
 	def after_insert(self):
 		doc = self.get_doc()
 		owner = get_fullname(self.owner)
@@ -64,10 +71,15 @@ class DocShare(Document):
 				"Shared", _("{0} shared this document with {1}").format(owner, get_fullname(self.user))
 			)
 
+	def on_update(self):
+		self.clear_permission_cache()
+
 	def on_trash(self):
 		if not self.flags.ignore_share_permission:
 			self.check_share_permission()
 
+		self.clear_permission_cache()
+
 		self.get_doc().add_comment(
 			"Unshared",
 			_("{0} un-shared this document with {1}").format(
@@ -40,6 +40,14 @@ vmraid.ui.form.on('Prepared Report', {
 					})
 				);
 			});
+		} else if (frm.doc.partitions && frm.doc.partitions.length) {
+			// completed partitions are not run again
+			frm.add_custom_button(__("Resume"), () => {
+				vmraid.call({
+					method: "vmraid.core.doctype.prepared_report.prepared_report.resume",
+					args: { dn: frm.doc.name },
+				}).then(() => frm.reload_doc());
+			});
 		}
 	}
 });
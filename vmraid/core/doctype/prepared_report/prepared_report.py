@@ -3,14 +3,40 @@
 # License: MIT. See LICENSE
 
 
+import hashlib
 import json
+import os
+import tempfile
+from contextlib import ExitStack, contextmanager
 
 import vmraid
+from vmraid import _
+from vmraid.core.doctype.file.file import get_file_name
+from vmraid.core.doctype.prepared_report.result_file import (
+	ResultFile,
+	ResultFileWriter,
+	get_row_type_and_keys,
+	is_result_file,
+	merge_row_types,
+	write_result_file,
+)
 from vmraid.desk.form.load import get_attachments
-from vmraid.desk.query_report import generate_report_result
+from vmraid.desk.query_report import generate_report_result, get_report_doc, get_total_row
 from vmraid.model.document import Document
-from vmraid.utils import gzip_compress, gzip_decompress
-from vmraid.utils.background_jobs import enqueue
+from vmraid.utils import (
+	add_days,
+	add_months,
+	cint,
+	get_files_path,
+	getdate,
+	gzip_compress,
+	gzip_decompress,
+)
+from vmraid.utils.background_jobs import enqueue, get_jobs
+
+# partitions run in parallel, one job per partition on the long queue
+PARTITION_QUEUE = "long"
+PARTITION_TIMEOUT = 6000
 
 
 class PreparedReport(Document):
@@ -21,25 +47,60 @@ class PreparedReport(Document):
 	def enqueue_report(self):
 		enqueue(run_background, prepared_report=self.name, timeout=6000)
 
+	def enqueue_partitions(self, partitions=None):
+		"""Enqueue partitions which are not completed yet, completed partitions are
+		checkpointed and are not run again when the report is resumed."""
+		for partition in partitions or self.partitions:
+			if partition.status != "Completed":
+				enqueue(
+					run_partition,
+					queue=PARTITION_QUEUE,
+					timeout=PARTITION_TIMEOUT,
+					enqueue_after_commit=True,
+					job_name=get_partition_job_name(partition),
+					prepared_report=self.name,
+					partition=partition.name,
+				)
+
+	def on_trash(self):
+		for partition in self.partitions:
+			delete_partition_file(partition.result_file)
+
+
+def get_report(instance):
+	report = vmraid.get_doc("Report", instance.ref_report_doctype)
+	report.custom_columns = []
+
+	if report.report_type == "Custom Report":
+		custom_report_doc = report
+		reference_report = custom_report_doc.reference_report
+		report = vmraid.get_doc("Report", reference_report)
+		if custom_report_doc.json:
+			data = json.loads(custom_report_doc.json)
+			if data:
+				report.custom_columns = data["columns"]
+
+	return report
+
 
 def run_background(prepared_report):
 	instance = vmraid.get_doc("Prepared Report", prepared_report)
-	report = vmraid.get_doc("Report", instance.ref_report_doctype)
 
 	try:
-		report.custom_columns = []
-
-		if report.report_type == "Custom Report":
-			custom_report_doc = report
-			reference_report = custom_report_doc.reference_report
-			report = vmraid.get_doc("Report", reference_report)
-			if custom_report_doc.json:
-				data = json.loads(custom_report_doc.json)
-				if data:
-					report.custom_columns = data["columns"]
+		report = get_report(instance)
+
+		partitions = report.get_partitions(get_filters(instance))
+		if partitions:
+			instance.set(
+				"partitions",
+				[{"partition_filters": json.dumps(partition), "status": "Queued"} for partition in partitions],
+			)
+			instance.save(ignore_permissions=True)
+			instance.enqueue_partitions()
+			return
 
 		result = generate_report_result(report=report, filters=instance.filters, user=instance.owner)
-		create_json_gz_file(result["result"], "Prepared Report", instance.name)
+		create_result_file(result["result"], "Prepared Report", instance.name)
 
 		instance.status = "Completed"
 		instance.columns = json.dumps(result["columns"])
@@ -53,6 +114,181 @@ def run_background(prepared_report):
 		instance.error_message = vmraid.get_traceback()
 		instance.save(ignore_permissions=True)
 
+	publish_report_generated(instance)
+
+
+def run_partition(prepared_report, partition):
+	"""Run the report for one partition and checkpoint its result. The job completing
+	the last partition merges the results of all partitions."""
+	instance = vmraid.get_doc("Prepared Report", prepared_report)
+	row = instance.get("partitions", {"name": partition})[0]
+	if row.status == "Completed":
+		return
+
+	vmraid.db.set_value("Prepared Report Partition", partition, "status", "Started")
+	vmraid.db.commit()
+
+	try:
+		report = get_report(instance)
+		# total row is added to the merged result
+		report.add_total_row = 0
+
+		filters = get_filters(instance)
+		filters.update(json.loads(row.partition_filters))
+
+		result = generate_report_result(report=report, filters=filters, user=instance.owner)
+		result_file = create_result_file(result["result"], "Prepared Report Partition", partition)
+
+		vmraid.db.set_value(
+			"Prepared Report Partition",
+			partition,
+			{
+				"status": "Completed",
+				"row_count": len(result["result"]),
+				"skip_total_row": cint(result["skip_total_row"]),
+				"result_file": result_file.name,
+			},
+		)
+		vmraid.db.set_value(
+			"Prepared Report", prepared_report, "columns", json.dumps(result["columns"])
+		)
+		vmraid.db.commit()
+
+	except Exception:
+		vmraid.db.rollback()
+		vmraid.log_error(vmraid.get_traceback())
+		vmraid.db.set_value(
+			"Prepared Report Partition",
+			partition,
+			{"status": "Error", "error_message": vmraid.get_traceback()},
+		)
+		vmraid.db.set_value(
+			"Prepared Report",
+			prepared_report,
+			{"status": "Error", "error_message": vmraid.get_traceback()},
+		)
+		vmraid.db.commit()
+		publish_report_generated(instance)
+		return
+
+	publish_partition_progress(prepared_report)
+	merge_partitions(prepared_report)
+
+
+def merge_partitions(prepared_report):
+	# lock the report, so that it is merged only once even if the last
+	# partitions complete at the same time
+	status = vmraid.db.get_value("Prepared Report", prepared_report, "status", for_update=True)
+	if status == "Completed":
+		return
+
+	instance = vmraid.get_doc("Prepared Report", prepared_report)
+	if any(partition.status != "Completed" for partition in instance.partitions):
+		return
+
+	columns = json.loads(instance.columns) if instance.columns else []
+	report = get_report(instance)
+	skip_total_row = any(partition.skip_total_row for partition in instance.partitions)
+
+	# rows are streamed from the partition files into the merged file a chunk at a time
+	with ExitStack() as stack:
+		result_files = []
+		for partition in instance.partitions:
+			file_path = vmraid.get_doc("File", partition.result_file).get_full_path()
+			result_file = ResultFile(stack.enter_context(open(file_path, "rb")))
+			if result_file.row_count:
+				result_files.append(result_file)
+
+		row_types = [(result_file.row_type, result_file.keys) for result_file in result_files]
+		total_row = None
+		if cint(report.add_total_row) and result_files and not skip_total_row:
+			total_row = get_total_row(iter_result_rows(result_files), columns)
+			row_types.append(get_row_type_and_keys([total_row]))
+
+		def write(fileobj):
+			writer = ResultFileWriter(fileobj, *merge_row_types(row_types))
+			writer.write_rows(iter_result_rows(result_files))
+			if total_row is not None:
+				writer.write_rows([total_row])
+			writer.close()
+
+		save_result_file(write, "Prepared Report", instance.name)
+
+	for partition in instance.partitions:
+		delete_partition_file(partition.result_file)
+		partition.result_file = None
+
+	instance.status = "Completed"
+	instance.report_end_time = vmraid.utils.now()
+	instance.save(ignore_permissions=True)
+	vmraid.db.commit()
+
+	publish_report_generated(instance)
+
+
+@vmraid.whitelist()
+def iter_result_rows(result_files):
+	for result_file in result_files:
+		yield from result_file.iter_rows()
+
+
+def resume(dn):
+	"""Re-run partitions which did not complete, e.g. because their job timed out."""
+	instance = vmraid.get_doc("Prepared Report", dn)
+	instance.check_permission("read")
+
+	# resuming runs the report, like generating it in `background_enqueue_run`
+	get_report_doc(instance.report_name)
+
+	if not instance.partitions:
+		vmraid.throw(_("Only reports run in partitions can be resumed"))
+
+	if instance.status == "Completed":
+		return
+
+	# partitions which are queued or running are not run again
+	enqueued_jobs = get_jobs(site=vmraid.local.site, queue=PARTITION_QUEUE, key="job_name")
+	enqueued_jobs = enqueued_jobs[vmraid.local.site]
+	partitions = [
+		partition
+		for partition in instance.partitions
+		if partition.status != "Completed" and get_partition_job_name(partition) not in enqueued_jobs
+	]
+	if not partitions:
+		return
+
+	instance.status = "Queued"
+	instance.error_message = None
+	for partition in partitions:
+		partition.status = "Queued"
+		partition.error_message = None
+
+	instance.save(ignore_permissions=True)
+	instance.enqueue_partitions(partitions)
+
+
+def get_partition_job_name(partition):
+	return f"{partition.parent}::{partition.idx}"
+
+
+def publish_partition_progress(prepared_report):
+	partitions = vmraid.get_all(
+		"Prepared Report Partition",
+		filters={"parenttype": "Prepared Report", "parent": prepared_report},
+		pluck="status",
+	)
+	completed = partitions.count("Completed")
+
+	vmraid.publish_progress(
+		completed * 100 / len(partitions),
+		title=_("Preparing Report"),
+		doctype="Prepared Report",
+		docname=prepared_report,
+		description=_("{0} of {1} partitions completed").format(completed, len(partitions)),
+	)
+
+
+def publish_report_generated(instance):
 	vmraid.publish_realtime(
 		"report_generated",
 		{"report_name": instance.report_name, "name": instance.name},
@@ -60,6 +296,31 @@ def run_background(prepared_report):
 	)
 
 
+def delete_partition_file(file_name):
+	if file_name and vmraid.db.exists("File", file_name):
+		vmraid.delete_doc("File", file_name, ignore_permissions=True)
+
+
+def get_filters(instance):
+	return json.loads(instance.filters) if instance.filters else {}
+
+
+def get_date_partitions(from_date, to_date, months=1, from_field="from_date", to_field="to_date"):
+	"""Split a date range into partitions of `months` months, for `get_partitions` of reports.
+
+	e.g. for 2021-01-01 to 2021-12-31 and months=3 returns four quarterly partitions
+	`[{"from_date": "2021-01-01", "to_date": "2021-03-31"}, ...]`"""
+	partitions = []
+	from_date, to_date = getdate(from_date), getdate(to_date)
+
+	while from_date <= to_date:
+		partition_to_date = min(add_days(add_months(from_date, months), -1), to_date)
+		partitions.append({from_field: str(from_date), to_field: str(partition_to_date)})
+		from_date = add_days(partition_to_date, 1)
+
+	return partitions
+
+
 @vmraid.whitelist()
 def get_reports_in_queued_state(report_name, filters):
 	reports = vmraid.get_all(
@@ -123,15 +384,143 @@ def create_json_gz_file(data, dt, dn):
 	_file.save(ignore_permissions=True)
 
 
+def create_result_file(data, dt, dn):
+	"""Store report result in the chunked, columnar format of `result_file`,
+	so that pages of large results can be read without loading all rows."""
+	return save_result_file(lambda fileobj: write_result_file(fileobj, data), dt, dn)
+
+
+def save_result_file(write, dt, dn):
+	"""Attach a result file written by `write(fileobj)` to `dt` `dn`. The file is written to
+	the private files folder directly, so that it is never held in memory as a whole."""
+	file_name = "{0}.vrpr".format(vmraid.utils.data.format_datetime(vmraid.utils.now(), "Y-m-d-H:M"))
+	files_path = get_files_path(is_private=1)
+	vmraid.create_folder(files_path)
+
+	fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=files_path)
+	try:
+		with os.fdopen(fd, "wb") as f:
+			write(f)
+
+		content_hash = get_file_hash(temp_path)
+		if os.path.exists(os.path.join(files_path, file_name)):
+			file_name = get_file_name(file_name, content_hash[-6:])
+
+		file_path = os.path.join(files_path, file_name)
+		os.replace(temp_path, file_path)
+	except Exception:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		raise
+
+	_file = vmraid.get_doc(
+		{
+			"doctype": "File",
+			"file_name": file_name,
+			"file_url": f"/private/files/{file_name}",
+			"attached_to_doctype": dt,
+			"attached_to_name": dn,
+			"content_hash": content_hash,
+			"file_size": os.path.getsize(file_path),
+			"is_private": 1,
+		}
+	)
+	_file.flags.ignore_duplicate_entry_error = True
+	_file.save(ignore_permissions=True)
+	return _file
+
+
+def get_file_hash(file_path, block_size=1024 * 1024):
+	file_hash = hashlib.md5()  # nosec
+	with open(file_path, "rb") as f:
+		for block in iter(lambda: f.read(block_size), b""):
+			file_hash.update(block)
+
+	return file_hash.hexdigest()
+
+
+@contextmanager
+def open_result_file(dn):
+	"""Yields `ResultFile` of the prepared report, None if the result is stored
+	in the older gzipped JSON format."""
+	attachment = get_attachments("Prepared Report", dn)[0]
+	attached_file = vmraid.get_doc("File", attachment.name)
+
+	with open(attached_file.get_full_path(), "rb") as f:
+		yield ResultFile(f) if is_result_file(f) else None
+
+
+@vmraid.whitelist()
+def get_result_rows(
+	dn,
+	start=0,
+	page_length=500,
+	order_by=None,
+	descending=False,
+	filters=None,
+	skip_total_row=False,
+	total_columns=None,
+):
+	"""Returns a page of result rows of a prepared report, sorted and filtered
+	without loading the whole result.
+
+	:param filters: List of `[column, operator, value]`
+	:param skip_total_row: Leave out the last row, which is the total row of the report.
+	:param total_columns: Column keys to return totals of, over all filtered rows."""
+	vmraid.get_doc("Prepared Report", dn).check_permission("read")
+
+	with open_result_file(dn) as result_file:
+		if not result_file:
+			vmraid.throw(_("Please rebuild the report to browse its result"))
+
+		row_numbers = result_file.get_row_numbers(
+			order_by=order_by,
+			descending=cint(descending),
+			filters=vmraid.parse_json(filters) if filters else None,
+		)
+		if cint(skip_total_row):
+			total_row_number = result_file.row_count - 1
+			row_numbers = [number for number in row_numbers if number != total_row_number]
+
+		start = cint(start)
+		page_length = cint(page_length)
+
+		result = {
+			"result": result_file.get_rows_by_number(row_numbers[start : start + page_length]),
+			"row_count": len(row_numbers),
+		}
+		if total_columns:
+			result["totals"] = result_file.get_totals(row_numbers, vmraid.parse_json(total_columns))
+
+		return result
+
+
 @vmraid.whitelist()
 def download_attachment(dn):
 	attachment = get_attachments("Prepared Report", dn)[0]
-	vmraid.local.response.filename = attachment.file_name[:-2]
 	attached_file = vmraid.get_doc("File", attachment.name)
-	vmraid.local.response.filecontent = gzip_decompress(attached_file.get_content())
+
+	with open_result_file(dn) as result_file:
+		if result_file:
+			vmraid.local.response.filename = attachment.file_name.rsplit(".", 1)[0] + ".json"
+			vmraid.local.response.filecontent = get_json_content(result_file)
+		else:
+			vmraid.local.response.filename = attachment.file_name[:-2]
+			vmraid.local.response.filecontent = gzip_decompress(attached_file.get_content())
+
 	vmraid.local.response.type = "binary"
 
 
+def get_json_content(result_file):
+	"""Returns rows as a JSON array, serialized one chunk at a time."""
+	parts = []
+	for chunk_idx in range(len(result_file.chunks)):
+		rows = result_file.get_chunk_rows(chunk_idx)
+		parts.append(vmraid.as_json(rows)[1:-1].strip())
+
+	return vmraid.safe_encode("[" + ",".join(part for part in parts if part) + "]")
+
+
 def get_permission_query_condition(user):
 	if not user:
 		user = vmraid.session.user
@@ -0,0 +1,349 @@
+# Copyright (c) 2022, VMRaid Technologies and contributors
+# License: MIT. See LICENSE
+"""
+Chunked, columnar file format for Prepared Report results.
+
+Rows are split into chunks of `chunk_size` rows and every column of a chunk is
+stored as a separately gzipped JSON list, followed by a gzipped JSON index of
+chunk / column offsets:
+
+        MAGIC | chunk 0 column 0 | chunk 0 column 1 | ... | index | index offset | MAGIC
+
+Readers only decompress the chunks and columns they need, e.g. a page of rows
+or the values of the column being sorted or filtered on.
+"""
+
+import json
+import struct
+from gzip import compress, decompress
+
+import vmraid
+from vmraid import _
+from vmraid.utils import flt
+from vmraid.utils.response import json_handler
+
+MAGIC = b"VRPR0001"
+FOOTER = struct.Struct(">Q")
+DEFAULT_CHUNK_SIZE = 5000
+
+# how rows are split into columns
+DICT_ROWS = "dict"
+LIST_ROWS = "list"
+# rows of mixed types are stored as is, in a single column
+RAW_ROWS = "raw"
+
+
+def is_result_file(content_or_fileobj):
+	if isinstance(content_or_fileobj, bytes):
+		return content_or_fileobj.startswith(MAGIC)
+
+	content_or_fileobj.seek(0)
+	return content_or_fileobj.read(len(MAGIC)) == MAGIC
+
+
+def write_result_file(fileobj, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""Write `rows` (list of dicts or lists) to a binary file object."""
+	row_type, keys = get_row_type_and_keys(rows)
+	writer = ResultFileWriter(fileobj, row_type, keys, chunk_size)
+	writer.write_rows(rows)
+	writer.close()
+
+
+class ResultFileWriter:
+	"""Writes rows one chunk at a time, so that rows can be streamed into the file without
+	holding all of them in memory. The row type and keys of all rows must be known upfront,
+	see `get_row_type_and_keys` and `merge_row_types`.
+
+	Example:
+
+	        writer = ResultFileWriter(f, row_type, keys)
+	        for result_file in result_files:
+	                writer.write_rows(result_file.iter_rows())
+	        writer.close()
+	"""
+
+	def __init__(self, fileobj, row_type, keys, chunk_size=DEFAULT_CHUNK_SIZE):
+		self.fileobj = fileobj
+		self.row_type = row_type
+		self.keys = keys
+		self.chunk_size = chunk_size
+		self.chunks = []
+		self.row_count = 0
+		self.pending_rows = []
+
+		fileobj.write(MAGIC)
+		self.offset = len(MAGIC)
+
+	def write_rows(self, rows):
+		for row in rows:
+			self.pending_rows.append(row)
+			# readers expect chunks of equal size, except the last one
+			if len(self.pending_rows) == self.chunk_size:
+				self.write_chunk()
+
+	def write_chunk(self):
+		chunk = {"row_count": len(self.pending_rows), "columns": []}
+		for column in split_columns(self.pending_rows, self.row_type, self.keys):
+			data = compress(dumps(column))
+			self.fileobj.write(data)
+			chunk["columns"].append([self.offset, len(data)])
+			self.offset += len(data)
+
+		self.chunks.append(chunk)
+		self.row_count += len(self.pending_rows)
+		self.pending_rows = []
+
+	def close(self):
+		"""Write the remaining rows and the index, the file object is not closed."""
+		if self.pending_rows:
+			self.write_chunk()
+
+		index = compress(
+			dumps(
+				{
+					"row_type": self.row_type,
+					"keys": self.keys,
+					"row_count": self.row_count,
+					"chunks": self.chunks,
+				}
+			)
+		)
+		self.fileobj.write(index)
+		self.fileobj.write(FOOTER.pack(self.offset))
+		self.fileobj.write(MAGIC)
+
+
+class ResultFile:
+	"""Reader for files written by `write_result_file`.
+
+	Example:
+
+	        with open(path, "rb") as f:
+	                rows = ResultFile(f).get_rows(start=0, page_length=100, order_by="amount")
+	"""
+
+	def __init__(self, fileobj):
+		self.fileobj = fileobj
+
+		fileobj.seek(-(FOOTER.size + len(MAGIC)), 2)
+		footer = fileobj.read(FOOTER.size + len(MAGIC))
+		if footer[FOOTER.size :] != MAGIC:
+			raise ValueError("Not a prepared report result file")
+
+		(index_offset,) = FOOTER.unpack(footer[: FOOTER.size])
+		index_length = fileobj.seek(0, 2) - index_offset - len(footer)
+		index = json.loads(decompress(self.read(index_offset, index_length)))
+
+		self.row_type = index["row_type"]
+		self.keys = index["keys"]
+		self.row_count = index["row_count"]
+		self.chunks = index["chunks"]
+
+		# first row number of each chunk
+		self.chunk_starts = []
+		start = 0
+		for chunk in self.chunks:
+			self.chunk_starts.append(start)
+			start += chunk["row_count"]
+
+	def read(self, offset, length):
+		self.fileobj.seek(offset)
+		return self.fileobj.read(length)
+
+	def read_column(self, chunk_idx, column_idx):
+		offset, length = self.chunks[chunk_idx]["columns"][column_idx]
+		return json.loads(decompress(self.read(offset, length)))
+
+	def get_column_index(self, key):
+		if self.row_type == RAW_ROWS:
+			vmraid.throw(_("Rows of mixed types can not be sorted or filtered"))
+
+		try:
+			return self.keys.index(int(key) if self.row_type == LIST_ROWS else key)
+		except ValueError:
+			vmraid.throw(_("Unknown column {0}").format(key))
+
+	def iter_column(self, key):
+		"""Yields all values of a column."""
+		column_idx = self.get_column_index(key)
+		for chunk_idx in range(len(self.chunks)):
+			yield from self.read_column(chunk_idx, column_idx)
+
+	def iter_rows(self):
+		"""Yields all rows, one chunk in memory at a time."""
+		for chunk_idx in range(len(self.chunks)):
+			yield from self.get_chunk_rows(chunk_idx)
+
+	def get_chunk_rows(self, chunk_idx):
+		column_count = len(self.chunks[chunk_idx]["columns"])
+		columns = [self.read_column(chunk_idx, idx) for idx in range(column_count)]
+		return join_columns(columns, self.row_type, self.keys)
+
+	def get_rows(self, start=0, page_length=None, order_by=None, descending=False, filters=None):
+		"""Returns a page of rows, after filtering and sorting.
+
+		:param start: Index of the first row in the page.
+		:param page_length: Number of rows in the page, all rows if not set.
+		:param order_by: Column key to sort by.
+		:param descending: Sort in descending order.
+		:param filters: List of `[column key, operator, value]`, see `OPERATORS`."""
+		row_numbers = self.get_row_numbers(order_by, descending, filters)
+		end = None if page_length is None else start + page_length
+		return self.get_rows_by_number(row_numbers[start:end])
+
+	def get_row_numbers(self, order_by=None, descending=False, filters=None):
+		"""Returns numbers of the rows matching `filters`, sorted by `order_by`.
+
+		Only the columns being filtered and sorted on are read."""
+		if not order_by and not filters:
+			return range(self.row_count)
+
+		row_numbers = None
+		for key, operator, value in filters or []:
+			if operator not in OPERATORS:
+				vmraid.throw(_("Unknown operator {0}").format(operator))
+
+			matches = OPERATORS[operator]
+			selected = None if row_numbers is None else set(row_numbers)
+			row_numbers = [
+				number
+				for number, row_value in enumerate(self.iter_column(key))
+				if (selected is None or number in selected) and matches(row_value, value)
+			]
+
+		if row_numbers is None:
+			row_numbers = list(range(self.row_count))
+
+		if order_by:
+			values = list(self.iter_column(order_by))
+			row_numbers.sort(key=lambda number: sort_key(values[number]), reverse=descending)
+
+		return row_numbers
+
+	def get_totals(self, row_numbers, keys):
+		"""Returns {column key: sum of the values in the given rows}."""
+		selected = set(row_numbers)
+		return {
+			key: sum(
+				flt(value) for number, value in enumerate(self.iter_column(key)) if number in selected
+			)
+			for key in keys
+		}
+
+	def get_rows_by_number(self, row_numbers):
+		"""Returns rows in the given order, decompressing only the chunks containing them."""
+		chunk_rows = {}
+		rows = []
+		for number in row_numbers:
+			chunk_idx = self.get_chunk_idx(number)
+			if chunk_idx not in chunk_rows:
+				chunk_rows[chunk_idx] = self.get_chunk_rows(chunk_idx)
+			rows.append(chunk_rows[chunk_idx][number - self.chunk_starts[chunk_idx]])
+
+		return rows
+
+	def iter_rows_by_number(self, row_numbers):
+		"""Yields rows in the given order, keeping only the last decompressed chunk in memory.
+		Rows in ascending order decompress every chunk once."""
+		chunk_idx, chunk_rows = None, None
+		for number in row_numbers:
+			if self.get_chunk_idx(number) != chunk_idx:
+				chunk_idx = self.get_chunk_idx(number)
+				chunk_rows = self.get_chunk_rows(chunk_idx)
+			yield chunk_rows[number - self.chunk_starts[chunk_idx]]
+
+	def get_chunk_idx(self, row_number):
+		# chunks are of equal size except the last one
+		chunk_size = self.chunks[0]["row_count"]
+		return row_number // chunk_size
+
+
+def get_row_type_and_keys(rows):
+	if rows and all(isinstance(row, dict) for row in rows):
+		keys = {}
+		for row in rows:
+			keys.update(dict.fromkeys(row))
+		if keys:
+			return DICT_ROWS, list(keys)
+
+	if rows and all(isinstance(row, (list, tuple)) for row in rows):
+		return LIST_ROWS, list(range(max(len(row) for row in rows)))
+
+	return RAW_ROWS, [None]
+
+
+def merge_row_types(row_types):
+	"""Returns row type and keys of rows of all `(row_type, keys)` together, e.g. of the rows
+	of several result files."""
+	row_types = list(row_types)
+	if not row_types or len({row_type for row_type, keys in row_types}) > 1:
+		return RAW_ROWS, [None]
+
+	row_type = row_types[0][0]
+	if row_type == DICT_ROWS:
+		keys = {}
+		for _row_type, row_keys in row_types:
+			keys.update(dict.fromkeys(row_keys))
+		return DICT_ROWS, list(keys)
+
+	if row_type == LIST_ROWS:
+		return LIST_ROWS, list(range(max(len(row_keys) for _row_type, row_keys in row_types)))
+
+	return RAW_ROWS, [None]
+
+
+def split_columns(rows, row_type, keys):
+	if row_type == DICT_ROWS:
+		return [[row.get(key) for row in rows] for key in keys]
+
+	if row_type == LIST_ROWS:
+		return [[row[idx] if idx < len(row) else None for row in rows] for idx in keys]
+
+	return [rows]
+
+
+def join_columns(columns, row_type, keys):
+	if row_type == DICT_ROWS:
+		return [dict(zip(keys, values)) for values in zip(*columns)]
+
+	if row_type == LIST_ROWS:
+		return [list(values) for values in zip(*columns)]
+
+	return columns[0]
+
+
+def dumps(obj):
+	return json.dumps(obj, default=json_handler, separators=(",", ":")).encode()
+
+
+def sort_key(value):
+	# None first, then numbers, then everything else as text
+	if value is None:
+		return (0, 0, "")
+	if isinstance(value, (int, float)) and not isinstance(value, bool):
+		return (1, value, "")
+	return (2, 0, str(value).lower())
+
+
+def compare(operator):
+	def matches(row_value, value):
+		if row_value is None:
+			return False
+		try:
+			return operator(row_value, value)
+		except TypeError:
+			return operator(str(row_value), str(value))
+
+	return matches
+
+
+OPERATORS = {
+	"=": compare(lambda a, b: a == b),
+	"!=": lambda a, b: a != b,
+	">": compare(lambda a, b: a > b),
+	"<": compare(lambda a, b: a < b),
+	">=": compare(lambda a, b: a >= b),
+	"<=": compare(lambda a, b: a <= b),
+	"like": lambda a, b: a is not None and str(b).strip("%").lower() in str(a).lower(),
+	"in": lambda a, b: a in b,
+}
@@ -1,10 +1,28 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2018, VMRaid Technologies and Contributors
 # License: MIT. See LICENSE
+import io
 import json
 import unittest
+from unittest.mock import patch
 
 import vmraid
+from vmraid.core.doctype.prepared_report.prepared_report import (
+	create_result_file,
+	get_date_partitions,
+	get_partition_job_name,
+	get_result_rows,
+	merge_partitions,
+	open_result_file,
+	resume,
+)
+from vmraid.core.doctype.prepared_report.result_file import (
+	ResultFile,
+	ResultFileWriter,
+	is_result_file,
+	merge_row_types,
+	write_result_file,
+)
 
 
 class TestPreparedReport(unittest.TestCase):
@@ -27,3 +45,146 @@ class TestPreparedReport(unittest.TestCase):
 	def test_for_creation(self):
 		self.assertTrue("QUEUED" == self.prepared_report_doc.status.upper())
 		self.assertTrue(self.prepared_report_doc.report_start_time)
+
+	def test_result_file(self):
+		rows = [{"name": f"row-{i}", "amount": i % 7, "idx": i} for i in range(23)]
+		f = io.BytesIO()
+		write_result_file(f, rows, chunk_size=5)
+		self.assertTrue(is_result_file(f))
+
+		result_file = ResultFile(f)
+		self.assertEqual(result_file.row_count, 23)
+		self.assertEqual(list(result_file.iter_rows()), rows)
+		self.assertEqual(result_file.get_rows(start=7, page_length=4), rows[7:11])
+		self.assertEqual(
+			list(result_file.iter_rows_by_number([12, 3, 4, 21])), [rows[i] for i in (12, 3, 4, 21)]
+		)
+
+		sorted_rows = result_file.get_rows(order_by="amount", descending=True, page_length=3)
+		self.assertEqual([row["amount"] for row in sorted_rows], [6, 6, 6])
+
+		filtered_rows = result_file.get_rows(filters=[["amount", "=", 3], ["idx", ">", 5]])
+		self.assertEqual([row["idx"] for row in filtered_rows], [10, 17])
+
+		# list rows
+		f = io.BytesIO()
+		write_result_file(f, [[1, "a"], [2, "b", "extra"]])
+		self.assertEqual(list(ResultFile(f).iter_rows()), [[1, "a", None], [2, "b", "extra"]])
+
+		# rows of several files streamed into one
+		result_files = []
+		for part in ([{"a": 1}, {"a": 2}], [{"b": 3}]):
+			f = io.BytesIO()
+			write_result_file(f, part)
+			result_files.append(ResultFile(f))
+
+		f = io.BytesIO()
+		row_type, keys = merge_row_types((r.row_type, r.keys) for r in result_files)
+		writer = ResultFileWriter(f, row_type, keys, chunk_size=2)
+		for result_file in result_files:
+			writer.write_rows(result_file.iter_rows())
+		writer.close()
+
+		merged = ResultFile(f)
+		self.assertEqual(merged.keys, ["a", "b"])
+		self.assertEqual([chunk["row_count"] for chunk in merged.chunks], [2, 1])
+		self.assertEqual(
+			list(merged.iter_rows()), [{"a": 1, "b": None}, {"a": 2, "b": None}, {"a": None, "b": 3}]
+		)
+
+	def test_result_rows(self):
+		rows = [{"name": f"row-{i}", "amount": i} for i in range(10)]
+		create_result_file(rows, "Prepared Report", self.prepared_report_doc.name)
+
+		with open_result_file(self.prepared_report_doc.name) as result_file:
+			self.assertEqual(result_file.row_count, 10)
+
+		result = get_result_rows(
+			self.prepared_report_doc.name,
+			page_length=2,
+			order_by="amount",
+			descending=1,
+			filters=[["amount", "<", 5]],
+		)
+		self.assertEqual(result["row_count"], 5)
+		self.assertEqual([row["amount"] for row in result["result"]], [4, 3])
+
+		# last row is the total row of the report
+		result = get_result_rows(
+			self.prepared_report_doc.name,
+			filters=[["amount", ">", 5]],
+			skip_total_row=1,
+			total_columns=["amount"],
+		)
+		self.assertEqual(result["row_count"], 3)
+		self.assertEqual(result["totals"], {"amount": 6 + 7 + 8})
+
+		for filters in ([["amount", "between", 5]], [["unknown", "=", 5]]):
+			self.assertRaises(
+				vmraid.ValidationError, get_result_rows, self.prepared_report_doc.name, filters=filters
+			)
+
+	def test_date_partitions(self):
+		partitions = get_date_partitions("2021-01-01", "2021-12-15", months=3)
+		self.assertEqual(len(partitions), 4)
+		self.assertEqual(partitions[0], {"from_date": "2021-01-01", "to_date": "2021-03-31"})
+		self.assertEqual(partitions[-1], {"from_date": "2021-10-01", "to_date": "2021-12-15"})
+
+	def test_merge_partitions(self):
+		doc = self.prepared_report_doc
+		doc.columns = json.dumps([{"fieldname": "name", "label": "Name"}])
+		doc.set(
+			"partitions",
+			[{"partition_filters": json.dumps({"idx": i}), "status": "Queued"} for i in range(2)],
+		)
+		doc.save()
+
+		for i, partition in enumerate(doc.partitions):
+			result_file = create_result_file(
+				[{"name": f"{i}-{j}"} for j in range(3)], "Prepared Report Partition", partition.name
+			)
+			vmraid.db.set_value(
+				"Prepared Report Partition",
+				partition.name,
+				{"status": "Completed", "result_file": result_file.name},
+			)
+
+		merge_partitions(doc.name)
+		doc.reload()
+		self.assertEqual(doc.status, "Completed")
+		self.assertFalse(any(partition.result_file for partition in doc.partitions))
+
+		with open_result_file(doc.name) as result_file:
+			self.assertEqual(
+				[row["name"] for row in result_file.iter_rows()], ["0-0", "0-1", "0-2", "1-0", "1-1", "1-2"]
+			)
+
+	def test_resume(self):
+		doc = self.prepared_report_doc
+		doc.status = "Error"
+		doc.set(
+			"partitions",
+			[
+				{"partition_filters": json.dumps({"idx": i}), "status": status}
+				for i, status in enumerate(("Completed", "Started", "Error"))
+			],
+		)
+		doc.save()
+
+		# the started partition is still running
+		running = {vmraid.local.site: [get_partition_job_name(doc.partitions[1])]}
+		module = "vmraid.core.doctype.prepared_report.prepared_report"
+		with patch(f"{module}.get_jobs", return_value=running):
+			with patch(f"{module}.enqueue") as enqueue:
+				resume(doc.name)
+
+		resumed = [call.kwargs["partition"] for call in enqueue.call_args_list]
+		self.assertEqual(resumed, [doc.partitions[2].name])
+
+		doc.reload()
+		statuses = [partition.status for partition in doc.partitions]
+		self.assertEqual(statuses, ["Completed", "Started", "Queued"])
+
+		# users without access to the report can't resume it
+		vmraid.set_user("Guest")
+		self.assertRaises(vmraid.PermissionError, resume, doc.name)
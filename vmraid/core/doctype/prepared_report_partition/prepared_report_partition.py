@@ -0,0 +1,8 @@
+# Copyright (c) 2022, VMRaid Technologies and contributors
+# License: MIT. See LICENSE
+
+from vmraid.model.document import Document
+
+
+class PreparedReportPartition(Document):
+	pass
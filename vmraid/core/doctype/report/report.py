@@ -48,6 +48,7 @@ class Report(Document):
 
 	def on_update(self):
 		self.export_doc()
+		vmraid.desk.query_report.clear_cached_report_results(self.name)
 
 	def on_trash(self):
 		if (
@@ -156,6 +157,19 @@ class Report(Document):
 		method_name = get_report_module_dotted_path(module, self.name) + ".execute"
 		return vmraid.get_attr(method_name)(vmraid._dict(filters))
 
+	def get_partitions(self, filters):
+		"""Returns list of filter overrides to run a prepared report in parallel, one job per
+		partition. Standard script reports can define `get_partitions(filters)` next to `execute`,
+		e.g. returning `[{"from_date": ..., "to_date": ...}, ...]` to split by date range."""
+		if self.report_type != "Script Report" or self.is_standard != "Yes":
+			return []
+
+		module = self.module or vmraid.db.get_value("DocType", self.ref_doctype, "module")
+		report_module = vmraid.get_module(get_report_module_dotted_path(module, self.name))
+		get_partitions = getattr(report_module, "get_partitions", None)
+
+		return (get_partitions and get_partitions(vmraid._dict(filters))) or []
+
 	def execute_script(self, filters):
 		# server script
 		loc = {"filters": vmraid._dict(filters), "data": None, "result": None}
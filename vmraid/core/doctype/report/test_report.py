@@ -8,7 +8,13 @@ import textwrap
 import vmraid
 from vmraid.core.doctype.user_permission.test_user_permission import create_user
 from vmraid.custom.doctype.customize_form.customize_form import reset_customization
-from vmraid.desk.query_report import add_total_row, run, save_report
+from vmraid.desk.query_report import (
+	add_total_row,
+	get_cached_report_result,
+	get_report_cache_key,
+	run,
+	save_report,
+)
 from vmraid.desk.reportview import delete_report
 from vmraid.desk.reportview import save_report as _save_report
 from vmraid.tests.utils import VMRaidTestCase
@@ -363,3 +369,25 @@ result = [
 			self.assertGreaterEqual(len(rows), 1)
 		elif vmraid.db.db_type == "postgres":
 			self.assertRaises(vmraid.PermissionError, report.execute_query_report, filters={})
+
+	def test_cached_report_result(self):
+		report = vmraid.get_doc("Report", "Permitted Documents For User")
+		report.custom_columns = []
+		filters = {"user": "Administrator", "doctype": "ToDo"}
+		key = get_report_cache_key(report, filters, "Administrator")
+		vmraid.cache().delete_value(key)
+
+		result = get_cached_report_result(report, filters, "Administrator")
+		cached = vmraid.cache().get_value(key)
+		self.assertEqual(cached["result"], result)
+
+		# served from cache until the ref doctype is modified
+		self.assertEqual(get_cached_report_result(report, filters, "Administrator"), result)
+		self.assertEqual(vmraid.cache().get_value(key)["cached_on"], cached["cached_on"])
+
+		vmraid.db.sql("update `tabUser` set modified = modified where name = 'Administrator'")
+		vmraid.db.commit()
+		self.assertGreaterEqual(vmraid.db.get_table_modified(["User"]), cached["cached_on"])
+
+		get_cached_report_result(report, filters, "Administrator")
+		self.assertGreater(vmraid.cache().get_value(key)["cached_on"], cached["cached_on"])
@@ -55,6 +55,10 @@ class Role(Document):
 		"""update system user desk access if this has changed in this update"""
 		if vmraid.flags.in_install:
 			return
+
+		# roles are part of the cached match conditions of users
+		vmraid.cache().delete_value("permission_match_conditions")
+
 		if self.has_value_changed("desk_access"):
 			for user_name in get_users(self.name):
 				user = vmraid.get_doc("User", user_name)
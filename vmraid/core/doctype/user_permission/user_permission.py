@@ -19,10 +19,12 @@ class UserPermission(Document):
 
 	def on_update(self):
 		vmraid.cache().hdel("user_permissions", self.user)
+		vmraid.cache().hdel("permission_match_conditions", self.user)
 		vmraid.publish_realtime("update_user_permissions")
 
 	def on_trash(self):  # pylint: disable=no-self-use
 		vmraid.cache().hdel("user_permissions", self.user)
+		vmraid.cache().hdel("permission_match_conditions", self.user)
 		vmraid.publish_realtime("update_user_permissions")
 
 	def validate_user_permission(self):
@@ -0,0 +1,159 @@
+vmraid.pages["profiler"].on_page_load = wrapper => {
+	const profiler = new Profiler(wrapper);
+
+	$(wrapper).bind("show", () => {
+		profiler.show();
+	});
+
+	window.profiler = profiler;
+};
+
+const PROFILER_METHOD = "vmraid.core.page.profiler.profiler";
+
+class Profiler {
+	constructor(wrapper) {
+		this.page = vmraid.ui.make_app_page({
+			parent: wrapper,
+			title: __("Profiler"),
+			single_column: true
+		});
+
+		this.page.set_primary_action(__("Refresh"), () => this.show());
+		this.page.add_inner_button(__("Clear Profiles"), () => {
+			vmraid.confirm(__("Are you sure you want to clear all profiles?"), () => {
+				vmraid
+					.call(`${PROFILER_METHOD}.clear_profiles`)
+					.then(() => this.show());
+			});
+		});
+
+		this.page.main.addClass("vmraid-card");
+		this.page.body.append('<div class="profile-area"></div>');
+		this.$content = $(this.page.body).find(".profile-area");
+
+		this.$content.on("click", ".profile-name", e => {
+			this.show_profile($(e.currentTarget).attr("data-name"));
+		});
+		this.$content.on("click", ".profile-back", () => this.show());
+	}
+
+	show() {
+		vmraid.call(`${PROFILER_METHOD}.get_profiles`).then(r => {
+			let { enabled, profiles } = r.message;
+			if (enabled) {
+				this.page.set_indicator(__("Enabled"), "green");
+			} else {
+				this.page.set_indicator(__("Disabled"), "gray");
+			}
+			this.render_profiles(profiles);
+		});
+	}
+
+	render_profiles(profiles) {
+		if (!profiles.length) {
+			this.$content.html(`<div class="text-muted">
+				${__(
+					"No profiles yet. Set {0} or {1} in site config to start profiling.",
+					["<code>profile_requests</code>", "<code>profile_jobs</code>"]
+				)}
+			</div>`);
+			return;
+		}
+
+		let rows = profiles
+			.map(
+				profile => `<tr>
+					<td>
+						<a class="profile-name" data-name="${escape(profile.name)}">
+							${escape(profile.name)}
+						</a>
+					</td>
+					<td>${toTitle(profile.transaction_type)}</td>
+					<td class="text-right">${profile.transactions}</td>
+					<td class="text-right">${profile.samples}</td>
+					<td class="text-right">${format_ms(profile.duration / profile.transactions)}</td>
+					<td class="text-muted">${vmraid.datetime.prettyDate(profile.last_profiled)}</td>
+				</tr>`
+			)
+			.join("");
+
+		this.$content.html(`<table class="table">
+			<thead>
+				<tr>
+					<th>${__("Path / Method")}</th>
+					<th>${__("Type")}</th>
+					<th class="text-right">${__("Count")}</th>
+					<th class="text-right">${__("Samples")}</th>
+					<th class="text-right">${__("Average Duration")}</th>
+					<th>${__("Last Profiled")}</th>
+				</tr>
+			</thead>
+			<tbody>${rows}</tbody>
+		</table>`);
+	}
+
+	show_profile(name) {
+		vmraid
+			.call(`${PROFILER_METHOD}.get_profile`, { name })
+			.then(r => this.render_profile(name, r.message));
+	}
+
+	render_profile(name, profile) {
+		let percent = count => ((count * 100) / (profile.samples || 1)).toFixed(1) + "%";
+
+		let functions = profile.functions
+			.map(
+				row => `<tr>
+					<td><code>${escape(row.function)}</code></td>
+					<td class="text-right">${percent(row.self)}</td>
+					<td class="text-right">${percent(row.total)}</td>
+				</tr>`
+			)
+			.join("");
+
+		let stacks = profile.stacks
+			.map(
+				([stack, count]) => `<tr>
+					<td class="text-right">${percent(count)}</td>
+					<td><pre>${escape(stack.split(";").reverse().join("\n"))}</pre></td>
+				</tr>`
+			)
+			.join("");
+
+		this.$content.html(`
+			<div class="margin-bottom">
+				<button class="btn btn-default btn-xs profile-back">${__("Back")}</button>
+				<a class="btn btn-default btn-xs profile-download"
+					href="/api/method/${PROFILER_METHOD}.download_profile?name=${encodeURIComponent(name)}">
+					${__("Download Collapsed Stacks")}
+				</a>
+				<span class="text-muted">
+					${escape(name)}: ${__("{0} samples", [profile.samples])}
+				</span>
+			</div>
+			<h5>${__("Functions")}</h5>
+			<table class="table">
+				<thead>
+					<tr>
+						<th>${__("Function")}</th>
+						<th class="text-right">${__("Self")}</th>
+						<th class="text-right">${__("Total")}</th>
+					</tr>
+				</thead>
+				<tbody>${functions}</tbody>
+			</table>
+			<h5>${__("Stacks")}</h5>
+			<table class="table">
+				<tbody>${stacks}</tbody>
+			</table>
+		`);
+	}
+}
+
+function escape(text) {
+	return vmraid.utils.escape_html(text || "");
+}
+
+function format_ms(value) {
+	return __("{0} ms", [Math.round(value || 0)]);
+}
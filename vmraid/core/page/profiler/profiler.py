@@ -0,0 +1,45 @@
+# Copyright (c) 2022, VMRaid and Contributors
+# License: MIT. See LICENSE
+
+import vmraid
+from vmraid import profiler
+from vmraid.utils import cint
+
+# stacks and functions shown on the page, the download has all stacks
+MAX_ROWS = 100
+
+
+@vmraid.whitelist()
+def get_profiles():
+	vmraid.only_for("System Manager")
+	return {
+		"enabled": bool(vmraid.conf.profile_requests or vmraid.conf.profile_jobs),
+		"profiles": profiler.get_profiles(),
+	}
+
+
+@vmraid.whitelist()
+def get_profile(name, limit=MAX_ROWS):
+	vmraid.only_for("System Manager")
+	limit = cint(limit)
+	stacks = profiler.get_stacks(name)
+	return {
+		"samples": sum(stacks.values()),
+		"functions": profiler.get_functions(stacks)[:limit],
+		"stacks": sorted(stacks.items(), key=lambda item: item[1], reverse=True)[:limit],
+	}
+
+
+@vmraid.whitelist()
+def download_profile(name):
+	vmraid.only_for("System Manager")
+	filename = vmraid.scrub(name.strip("/").replace("/", "_")) or "profile"
+	vmraid.response["filename"] = f"{filename}.collapsed.txt"
+	vmraid.response["filecontent"] = profiler.to_collapsed(profiler.get_stacks(name))
+	vmraid.response["type"] = "download"
+
+
+@vmraid.whitelist(methods=["POST"])
+def clear_profiles(name=None):
+	vmraid.only_for("System Manager")
+	profiler.delete_profiles(name)
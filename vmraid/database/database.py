@@ -9,6 +9,7 @@ import random
 import re
 import string
 from contextlib import contextmanager
+from functools import lru_cache
 from time import time
 from typing import Dict, List, Optional, Tuple, Union
 
@@ -18,6 +19,7 @@ import vmraid
 import vmraid.defaults
 import vmraid.model.meta
 from vmraid import _
+from vmraid.database.replica import mark_primary_sticky
 from vmraid.model.utils.link_count import flush_local_link_count
 from vmraid.query_builder.functions import Count
 from vmraid.query_builder.utils import DocType
@@ -25,6 +27,73 @@ from vmraid.utils import cast, get_datetime, getdate, now, sbool
 
 from .query import Query
 
+QUERY_CACHE_SIZE = 4096
+# longer queries usually have values formatted in them and are rarely repeated
+MAX_CACHED_QUERY_LENGTH = 4096
+
+IFNULL_PATTERN = re.compile(r"ifnull\(", flags=re.IGNORECASE)
+QUERY_TYPE_PATTERN = re.compile(r"\w+")
+
+WRITE_QUERY_TYPES = frozenset(("insert", "update", "delete"))
+IMPLICIT_COMMIT_QUERY_TYPES = frozenset(("start", "alter", "drop", "create", "begin", "truncate"))
+
+# rows fetched from the server at a time by `Database.sql_iter`
+SQL_ITER_BATCH_SIZE = 1000
+
+# table names in queries:
+# single word - `tabXxx`, tabXxx and "tabXxx"
+# multi word - `tabXxx Xxx` and "tabXxx Xxx", must have surrounding quotes
+# ([`"]?) captures " or ` at the begining of the table name (if provided) and
+# \1 matches the captured quote character at the end of the table name
+SINGLE_WORD_TABLE_PATTERN = re.compile(r'([`"]?)(tab([A-Z]\w+))\1')
+MULTI_WORD_TABLE_PATTERN = re.compile(r'([`"])(tab([A-Z]\w+)( [A-Z]\w+)+)\1')
+
+# redis hash of doctype: time of the last committed write to its table
+TABLE_MODIFIED_KEY = "table_modified"
+
+
+def normalize_query(query: str) -> Tuple[str, str]:
+	"""Returns the query with whitespace stripped and `ifnull` replaced by `coalesce`,
+	and its type (first keyword in lowercase, e.g. `select`, `update`, `create`).
+
+	Results are memoized by query text since the same query shapes are run repeatedly."""
+	if len(query) > MAX_CACHED_QUERY_LENGTH:
+		return _normalize_query(query)
+
+	return _cached_normalize_query(query)
+
+
+def get_table_names(query: str) -> frozenset:
+	"""Returns names of tables (e.g. `tabToDo`) referenced in the query."""
+	if len(query) > MAX_CACHED_QUERY_LENGTH:
+		return _get_table_names(query)
+
+	return _cached_get_table_names(query)
+
+
+def _get_table_names(query: str) -> frozenset:
+	return frozenset(
+		groups[1]
+		for pattern in (SINGLE_WORD_TABLE_PATTERN, MULTI_WORD_TABLE_PATTERN)
+		for groups in pattern.findall(query)
+	)
+
+
+_cached_get_table_names = lru_cache(maxsize=QUERY_CACHE_SIZE)(_get_table_names)
+
+
+def _normalize_query(query: str) -> Tuple[str, str]:
+	query = query.strip()
+
+	if IFNULL_PATTERN.search(query):
+		query = IFNULL_PATTERN.sub("coalesce(", query)
+
+	query_type = QUERY_TYPE_PATTERN.match(query)
+	return query, query_type.group().lower() if query_type else ""
+
+
+_cached_normalize_query = lru_cache(maxsize=QUERY_CACHE_SIZE)(_normalize_query)
+
 
 class Database(object):
 	"""
@@ -43,6 +112,9 @@ class Database(object):
 	CHILD_TABLE_COLUMNS = ("parent", "parenttype", "parentfield")
 	MAX_WRITES_PER_TRANSACTION = 200_000
 
+	# set on connections to the read replica
+	is_replica = False
+
 	class InvalidColumnName(vmraid.ValidationError):
 		pass
 
@@ -63,6 +135,9 @@ class Database(object):
 		self.transaction_writes = 0
 		self.auto_commit_on_many_writes = 0
 
+		# tables written in the current transaction, see `flush_touched_tables`
+		self.touched_tables = set()
+
 		self.password = password or vmraid.conf.db_password
 		self.value_cache = {}
 		self.query = Query()
@@ -134,28 +209,28 @@ class Database(object):
 		if not run:
 			return query
 
-		# remove whitespace / indentation from start and end of query
-		query = query.strip()
-
-		if re.search(r"ifnull\(", query, flags=re.IGNORECASE):
-			# replaces ifnull in query with coalesce
-			query = re.sub(r"ifnull\(", "coalesce(", query, flags=re.IGNORECASE)
+		# remove whitespace / indentation and replace ifnull with coalesce
+		query, query_type = normalize_query(query)
 
 		if not self._conn:
 			self.connect()
 
 		# in transaction validations
-		self.check_transaction_status(query)
+		self.check_transaction_status(query, query_type)
 
-		self.clear_db_table_cache(query)
+		self.clear_db_table_cache(query, query_type)
 
 		# autocommit
 		if auto_commit:
 			self.commit()
 
+		# query count and time of the transaction, see `vmraid.monitor` and `vmraid.metrics`
+		monitor = getattr(vmraid.local, "monitor", None)
+		metrics = getattr(vmraid.local, "metrics", None)
+
 		# execute
 		try:
-			if debug:
+			if debug or monitor or metrics:
 				time_start = time()
 
 			self.log_query(query, values, debug, explain)
@@ -177,6 +252,12 @@ class Database(object):
 				if vmraid.flags.in_migrate:
 					self.log_touched_tables(query)
 
+			if monitor:
+				monitor.add_query(query, time() - time_start)
+
+			if metrics:
+				metrics.add_query(query_type, time() - time_start)
+
 			if debug:
 				time_end = time()
 				vmraid.errprint(("Execution time: {0} sec").format(round(time_end - time_start, 2)))
@@ -280,23 +361,129 @@ class Database(object):
 		"""
 		return [r[0] for r in self.sql(query, values, **kwargs, debug=debug)]
 
+	def sql_iter(
+		self,
+		query,
+		values=(),
+		as_dict=False,
+		pluck=False,
+		update=None,
+		batch_size=SQL_ITER_BATCH_SIZE,
+		as_batches=False,
+		debug=False,
+	):
+		"""Execute a read query and lazily yield rows, using a server side (unbuffered) cursor.
+
+		Rows are fetched from the server `batch_size` at a time, so large results can be
+		processed in constant memory. On MariaDB this has two limits:
+
+		- the rows are read on a new connection, outside the snapshot of the current
+		  transaction, so they may include rows committed by others after it started.
+		- if the current transaction has written anything, the rows are read on the current
+		  connection with a buffered cursor so that the writes are seen, and all of them are
+		  held in memory (logged to the "database" logger). Commit before streaming large
+		  results in patches and jobs.
+
+		:param query: SQL query.
+		:param values: List / dict of values to be escaped and substituted in the query.
+		:param as_dict: Yield rows as dictionaries.
+		:param pluck: Yield the first column only.
+		:param update: Update this dict to all rows (if yielded `as_dict`).
+		:param batch_size: Number of rows fetched from the server at a time.
+		:param as_batches: Yield lists of upto `batch_size` rows instead of single rows.
+
+		Example:
+
+		        for user in vmraid.db.sql_iter("select name, email from tabUser", as_dict=True):
+		                ...
+		"""
+		debug = debug or getattr(self, "debug", False)
+		query, query_type = normalize_query(str(query))
+
+		if query_type in WRITE_QUERY_TYPES:
+			raise ValueError("sql_iter can only be used for read queries")
+
+		if not self._conn:
+			self.connect()
+
+		self.log_query(query, values, debug, explain=False)
+
+		if values != () and not isinstance(values, (dict, tuple, list)):
+			values = (values,)
+
+		# time spent executing and fetching, without the time spent by the caller on the rows
+		monitor = getattr(vmraid.local, "monitor", None)
+		metrics = getattr(vmraid.local, "metrics", None)
+		duration = 0
+
+		with self.unbuffered_cursor() as cursor:
+			try:
+				time_start = time()
+				cursor.execute(query, values if values != () else None)
+				duration += time() - time_start
+				keys = None
+
+				while True:
+					time_start = time()
+					rows = cursor.fetchmany(batch_size)
+					duration += time() - time_start
+					if not rows:
+						break
+
+					if pluck:
+						rows = [row[0] for row in rows]
+					elif as_dict:
+						keys = keys or [column[0] for column in cursor.description]
+						rows = [vmraid._dict(zip(keys, row)) for row in rows]
+						if update:
+							for row in rows:
+								row.update(update)
+
+					if as_batches:
+						yield rows
+					else:
+						yield from rows
+			finally:
+				if monitor:
+					monitor.add_query(query, duration)
+
+				if metrics:
+					metrics.add_query(query_type, duration)
+
+	@contextmanager
+	def unbuffered_cursor(self):
+		"""Cursor used by `sql_iter`, overridden by the database specific subclasses."""
+		cursor = self._conn.cursor()
+		try:
+			yield cursor
+		finally:
+			cursor.close()
+
 	def sql_ddl(self, query, values=(), debug=False):
 		"""Commit and execute a query. DDL (Data Definition Language) queries that alter schema
 		autocommit in MariaDB."""
 		self.commit()
 		self.sql(query, debug=debug)
 
-	def check_transaction_status(self, query):
+	def check_transaction_status(self, query, query_type=None):
 		"""Raises exception if more than 20,000 `INSERT`, `UPDATE` queries are
 		executed in one transaction. This is to ensure that writes are always flushed otherwise this
 		could cause the system to hang."""
-		self.check_implicit_commit(query)
+		if query_type is None:
+			query, query_type = normalize_query(query)
+
+		self.check_implicit_commit(query, query_type)
 
-		if query and query.strip().lower() in ("commit", "rollback"):
+		if query_type in ("commit", "rollback") and query.lower() == query_type:
 			self.transaction_writes = 0
 
-		if query[:6].lower() in ("update", "insert", "delete"):
+			# touched tables of committed transactions are flushed by `commit`
+			if query_type == "rollback":
+				self.touched_tables = set()
+
+		if query_type in WRITE_QUERY_TYPES:
 			self.transaction_writes += 1
+			self.touched_tables.update(get_table_names(query))
 			if self.transaction_writes > self.MAX_WRITES_PER_TRANSACTION:
 				if self.auto_commit_on_many_writes:
 					self.commit()
@@ -305,13 +492,14 @@ class Database(object):
 					msg += _("The changes have been reverted.") + "<br>"
 					raise vmraid.TooManyWritesError(msg)
 
-	def check_implicit_commit(self, query):
-		if (
-			self.transaction_writes
-			and query
-			and query.strip().split()[0].lower()
-			in ["start", "alter", "drop", "create", "begin", "truncate"]
-		):
+	def check_implicit_commit(self, query, query_type=None):
+		if not self.transaction_writes or not query:
+			return
+
+		if query_type is None:
+			query, query_type = normalize_query(query)
+
+		if query_type in IMPLICIT_COMMIT_QUERY_TYPES:
 			raise Exception("This statement can cause implicit commit")
 
 	def fetch_as_dict(self, formatted=0, as_utf8=0):
@@ -332,8 +520,14 @@ class Database(object):
 		return ret
 
 	@staticmethod
-	def clear_db_table_cache(query):
-		if query and query.strip().split()[0].lower() in {"drop", "create"}:
+	def clear_db_table_cache(query, query_type=None):
+		if not query:
+			return
+
+		if query_type is None:
+			query, query_type = normalize_query(query)
+
+		if query_type in ("drop", "create"):
 			vmraid.cache().delete_key("db_tables")
 
 	@staticmethod
@@ -913,13 +1107,37 @@ class Database(object):
 		for method in vmraid.local.before_commit:
 			vmraid.call(method[0], *(method[1] or []), **(method[2] or {}))
 
+		had_writes = self.transaction_writes
 		self.sql("commit")
 
+		if had_writes:
+			mark_primary_sticky()
+
+		self.flush_touched_tables()
+
 		vmraid.local.rollback_observers = []
 		self.flush_realtime_log()
 		enqueue_jobs_after_commit()
 		flush_local_link_count()
 
+	def flush_touched_tables(self):
+		"""Record the time of the last committed write to tables written in the transaction,
+		used to invalidate cached results which depend on them, see `get_table_modified`."""
+		if not self.touched_tables:
+			return
+
+		tables, self.touched_tables = self.touched_tables, set()
+		modified = time()
+		for table in tables:
+			vmraid.cache().hset(TABLE_MODIFIED_KEY, table[3:], modified)
+
+	@staticmethod
+	def get_table_modified(doctypes):
+		"""Returns the time of the last committed write to any of the doctypes, 0 if not known."""
+		return max(
+			(vmraid.cache().hget(TABLE_MODIFIED_KEY, doctype) or 0 for doctype in doctypes), default=0
+		)
+
 	def add_before_commit(self, method, args=None, kwargs=None):
 		vmraid.local.before_commit.append([method, args, kwargs])
 
@@ -1127,6 +1345,10 @@ class Database(object):
 
 		return vmraid.cache().get_value("system_settings", _load_system_settings).get(key)
 
+	def get_replication_lag(self) -> Optional[float]:
+		"""Returns seconds the replica is behind the primary, None if unknown."""
+		return None
+
 	def close(self):
 		"""Close database connection."""
 		if self._conn:
@@ -1204,55 +1426,44 @@ class Database(object):
 		if values:
 			query = vmraid.safe_decode(self._cursor.mogrify(query, values))
 		if query.strip().lower().split()[0] in ("insert", "delete", "update", "alter", "drop", "rename"):
-			# single_word_regex is designed to match following patterns
-			# `tabXxx`, tabXxx and "tabXxx"
-
-			# multi_word_regex is designed to match following patterns
-			# `tabXxx Xxx` and "tabXxx Xxx"
-
-			# ([`"]?) Captures " or ` at the begining of the table name (if provided)
-			# \1 matches the first captured group (quote character) at the end of the table name
-			# multi word table name must have surrounding quotes.
-
-			# (tab([A-Z]\w+)( [A-Z]\w+)*) Captures table names that start with "tab"
-			# and are continued with multiple words that start with a captital letter
-			# e.g. 'tabXxx' or 'tabXxx Xxx' or 'tabXxx Xxx Xxx' and so on
-
-			single_word_regex = r'([`"]?)(tab([A-Z]\w+))\1'
-			multi_word_regex = r'([`"])(tab([A-Z]\w+)( [A-Z]\w+)+)\1'
-			tables = []
-			for regex in (single_word_regex, multi_word_regex):
-				tables += [groups[1] for groups in re.findall(regex, query)]
+			tables = _get_table_names(query)
 
 			if vmraid.flags.touched_tables is None:
 				vmraid.flags.touched_tables = set()
 			vmraid.flags.touched_tables.update(tables)
 
-	def bulk_insert(self, doctype, fields, values, ignore_duplicates=False):
+	def bulk_insert(self, doctype, fields, values, ignore_duplicates=False, chunk_size=10000):
 		"""
 		Insert multiple records at a time
 
 		:param doctype: Doctype name
 		:param fields: list of fields
 		:params values: list of list of values
+		:param chunk_size: max number of rows per INSERT statement
 		"""
 		insert_list = []
 		fields = ", ".join("`" + field + "`" for field in fields)
 
-		for idx, value in enumerate(values):
+		def flush():
+			self.sql(
+				"""INSERT {ignore_duplicates} INTO `tab{doctype}` ({fields}) VALUES {values}""".format(
+					ignore_duplicates="IGNORE" if ignore_duplicates else "",
+					doctype=doctype,
+					fields=fields,
+					values=", ".join(["%s"] * len(insert_list)),
+				),
+				tuple(insert_list),
+			)
+
+		for value in values:
 			insert_list.append(tuple(value))
-			if idx and (idx % 10000 == 0 or idx < len(values) - 1):
-				self.sql(
-					"""INSERT {ignore_duplicates} INTO `tab{doctype}` ({fields}) VALUES {values}""".format(
-						ignore_duplicates="IGNORE" if ignore_duplicates else "",
-						doctype=doctype,
-						fields=fields,
-						values=", ".join(["%s"] * len(insert_list)),
-					),
-					tuple(insert_list),
-				)
+			if len(insert_list) >= chunk_size:
+				flush()
 				insert_list = []
 
+		if insert_list:
+			flush()
+
 
 def enqueue_jobs_after_commit():
 	from vmraid.utils.background_jobs import execute_job, get_queue
@@ -1264,6 +1475,25 @@ def enqueue_jobs_after_commit():
 		vmraid.flags.enqueue_after_commit = []
 
 
+def get_commit_queues():
+	"""Returns copies of the methods, jobs and realtime events queued for the next commit,
+	see `restore_commit_queues`."""
+	return (
+		list(vmraid.local.before_commit),
+		list(vmraid.flags.enqueue_after_commit or []),
+		list(vmraid.local.realtime_log),
+	)
+
+
+def restore_commit_queues(queues):
+	"""Restore queues returned by `get_commit_queues` before a savepoint, after rolling back
+	to it. Jobs and events queued by the rolled back writes are not run on commit."""
+	before_commit, enqueue_after_commit, realtime_log = queues
+	vmraid.local.before_commit = before_commit
+	vmraid.flags.enqueue_after_commit = enqueue_after_commit
+	vmraid.local.realtime_log = realtime_log
+
+
 @contextmanager
 def savepoint(catch: Union[type, Tuple[type, ...]] = Exception):
 	"""Wrapper for wrapping blocks of DB operations in a savepoint.
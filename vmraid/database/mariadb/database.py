@@ -1,6 +1,8 @@
+from contextlib import contextmanager
 from typing import List, Tuple, Union
 
 import pymysql
+import pymysql.cursors
 from pymysql.constants import ER, FIELD_TYPE
 from pymysql.converters import conversions, escape_string
 
@@ -95,6 +97,45 @@ class MariaDBDatabase(Database):
 
 		return conn
 
+	@contextmanager
+	def unbuffered_cursor(self):
+		"""Unbuffered cursor on a separate connection.
+
+		The connection can't run other queries until an unbuffered result is fully read, so
+		the rows are read on a new connection, which only sees committed data and not the
+		snapshot of the current transaction. If the current transaction has uncommitted writes,
+		a buffered cursor of the current connection is used instead, so that the writes are
+		read back (at the cost of holding all rows in memory)."""
+		if self.transaction_writes:
+			vmraid.logger("database").info(
+				"sql_iter fell back to a buffered cursor, the transaction has uncommitted writes"
+			)
+			with super().unbuffered_cursor() as cursor:
+				yield cursor
+			return
+
+		conn = self.get_connection()
+		try:
+			yield conn.cursor(pymysql.cursors.SSCursor)
+		finally:
+			# closing the connection discards any unread rows
+			conn.close()
+
+	def get_replication_lag(self):
+		try:
+			status = self.sql("show slave status", as_dict=True)
+		except pymysql.err.OperationalError as e:
+			if e.args[0] != ER.SPECIFIC_ACCESS_DENIED_ERROR:
+				raise
+
+			raise vmraid.PermissionError(
+				f"Replication lag can not be checked, {self.user} needs the REPLICATION CLIENT "
+				"privilege on the replica"
+			) from e
+
+		if status:
+			return status[0].get("Seconds_Behind_Master")
+
 	def get_database_size(self):
 		"""'Returns database size in MB"""
 		db_size = self.sql(
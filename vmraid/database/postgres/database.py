@@ -1,4 +1,6 @@
 import re
+from contextlib import contextmanager
+from functools import lru_cache
 from typing import List, Tuple, Union
 
 import psycopg2
@@ -7,7 +9,7 @@ from psycopg2.errorcodes import STRING_DATA_RIGHT_TRUNCATION
 from psycopg2.extensions import ISOLATION_LEVEL_REPEATABLE_READ
 
 import vmraid
-from vmraid.database.database import Database
+from vmraid.database.database import MAX_CACHED_QUERY_LENGTH, QUERY_CACHE_SIZE, Database
 from vmraid.database.postgres.schema import PostgresTable
 from vmraid.utils import cstr, get_table_name
 
@@ -97,6 +99,17 @@ class PostgresDatabase(Database):
 
 		return str(psycopg2.extensions.QuotedString(s))
 
+	def get_replication_lag(self):
+		# the last replay timestamp does not move on an idle replica, it is only a lag if
+		# some received WAL has not been replayed yet
+		lag = self.sql(
+			"""select case
+				when pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() then 0
+				else extract(epoch from now() - pg_last_xact_replay_timestamp())
+			end"""
+		)
+		return lag[0][0] if lag else None
+
 	def get_database_size(self):
 		"""'Returns database size in MB"""
 		db_size = self.sql(
@@ -110,6 +123,21 @@ class PostgresDatabase(Database):
 			modify_query(query), modify_values(values), *args, **kwargs
 		)
 
+	def sql_iter(self, query, values=(), *args, **kwargs):
+		return super(PostgresDatabase, self).sql_iter(
+			modify_query(query), modify_values(values), *args, **kwargs
+		)
+
+	@contextmanager
+	def unbuffered_cursor(self):
+		"""Named (server side) cursor in the current transaction, rows are fetched from the
+		server as they are iterated and other queries can run in between."""
+		cursor = self._conn.cursor(name=f"vmraid_sql_iter_{vmraid.generate_hash(length=10)}")
+		try:
+			yield cursor
+		finally:
+			cursor.close()
+
 	def get_tables(self, cached=True):
 		return [
 			d[0]
@@ -369,8 +397,15 @@ class PostgresDatabase(Database):
 
 def modify_query(query):
 	""" "Modifies query according to the requirements of postgres"""
-	# replace ` with " for definitions
 	query = str(query)
+	if len(query) > MAX_CACHED_QUERY_LENGTH:
+		return _modify_query(query)
+
+	return _cached_modify_query(query)
+
+
+def _modify_query(query):
+	# replace ` with " for definitions
 	query = query.replace("`", '"')
 	query = replace_locate_with_strpos(query)
 	# select from requires ""
@@ -390,6 +425,10 @@ def modify_query(query):
 	return query
 
 
+# same query shapes are run repeatedly, memoize the regex replacements
+_cached_modify_query = lru_cache(maxsize=QUERY_CACHE_SIZE)(_modify_query)
+
+
 def modify_values(values):
 	def stringify_value(value):
 		if isinstance(value, int):
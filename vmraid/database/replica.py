@@ -0,0 +1,140 @@
+# Copyright (c) 2022, VMRaid and Contributors
+# License: MIT. See LICENSE
+"""
+Read routing to the replica database.
+
+`vmraid.read_only` endpoints always read from the replica if `read_from_replica`
+is set in site config. With `route_reads_to_replica` set, reads from list views,
+`get_list` / `get_all` and reports are also routed to the replica automatically when:
+
+- the request is a `GET` (or `HEAD`) request,
+- the current transaction has not written anything,
+- the user has not committed a write in the last `replica_sticky_primary_seconds`
+  seconds (default 10), so that users always read their own writes,
+- the replica is not lagging more than `replica_max_lag` seconds (default 10). On
+  MariaDB the database user needs the REPLICATION CLIENT privilege on the replica to
+  check the lag, reads stay on the primary while the lag is unknown.
+
+Writes are not expected in routed reads; use `vmraid.write_only` for endpoints that
+need to write while reading from the replica.
+"""
+
+from contextlib import contextmanager
+
+import vmraid
+from vmraid.utils import cint
+
+DEFAULT_MAX_LAG = 10
+DEFAULT_STICKY_PRIMARY_SECONDS = 10
+
+# replication lag is shared across workers and re-checked at most this often
+REPLICATION_LAG_CACHE_SECONDS = 5
+
+
+def connect_replica_db():
+	"""Returns a connection to the replica database, reused for the whole request."""
+	from vmraid.database import get_db
+
+	if replica_db := getattr(vmraid.local, "replica_db", None):
+		return replica_db
+
+	conf = vmraid.local.conf
+	user = conf.db_name
+	password = conf.db_password
+
+	if conf.different_credentials_for_replica:
+		user = conf.replica_db_name
+		password = conf.replica_db_password
+
+	vmraid.local.replica_db = get_db(
+		host=conf.replica_host, user=user, password=password, port=conf.replica_db_port
+	)
+	vmraid.local.replica_db.is_replica = True
+	return vmraid.local.replica_db
+
+
+def in_replica():
+	primary_db = getattr(vmraid.local, "primary_db", None)
+	return bool(primary_db) and vmraid.local.db is not primary_db
+
+
+@contextmanager
+def use_replica(force=False):
+	"""Route queries in this block to the replica if it is safe to do so.
+
+	:param force: Use replica if it is configured, skip the routing checks."""
+	if in_replica() or not (force or can_route_to_replica()):
+		yield
+		return
+
+	primary_db = vmraid.local.db
+	vmraid.local.primary_db = primary_db
+	vmraid.local.db = connect_replica_db()
+
+	try:
+		yield
+	finally:
+		vmraid.local.db = primary_db
+
+
+def can_route_to_replica():
+	conf = vmraid.local.conf
+	if not (conf.route_reads_to_replica and conf.replica_host):
+		return False
+
+	request = getattr(vmraid.local, "request", None)
+	if not request or request.method not in ("GET", "HEAD"):
+		return False
+
+	if not vmraid.local.db or vmraid.local.db.transaction_writes:
+		return False
+
+	# sticky primary and replication lag only need to be checked once per request
+	if vmraid.local.flags.replica_eligible is None:
+		vmraid.local.flags.replica_eligible = not is_primary_sticky() and not is_replica_lagging()
+
+	return vmraid.local.flags.replica_eligible
+
+
+def mark_primary_sticky():
+	"""Read from primary for the next few seconds after a user commits a write."""
+	conf = vmraid.local.conf
+	session = getattr(vmraid.local, "session", None)
+	if not (conf.route_reads_to_replica and session and session.user):
+		return
+
+	vmraid.cache().set_value(
+		"replica_sticky_primary",
+		1,
+		user=session.user,
+		expires_in_sec=cint(conf.replica_sticky_primary_seconds) or DEFAULT_STICKY_PRIMARY_SECONDS,
+	)
+
+
+def is_primary_sticky():
+	session = getattr(vmraid.local, "session", None)
+	if not (session and session.user):
+		return False
+
+	sticky = vmraid.cache().get_value("replica_sticky_primary", user=session.user, expires=True)
+	return bool(sticky)
+
+
+def is_replica_lagging():
+	max_lag = cint(vmraid.local.conf.replica_max_lag) or DEFAULT_MAX_LAG
+	lag = vmraid.cache().get_value("replica_lag", expires=True)
+
+	if lag is None:
+		try:
+			lag = connect_replica_db().get_replication_lag()
+		except Exception as e:
+			vmraid.logger("database").error(
+				f"Could not check replication lag, reading from primary: {e}"
+			)
+			lag = None
+
+		# unknown lag is treated as lagging
+		lag = -1 if lag is None else lag
+		vmraid.cache().set_value("replica_lag", lag, expires_in_sec=REPLICATION_LAG_CACHE_SECONDS)
+
+	return lag < 0 or lag > max_lag
@@ -31,22 +31,43 @@ def save_to_db():
 		record_count = 0
 		queue_key = get_key_name(key)
 		doctype = get_doctype_name(key)
+		records_to_insert = []
 		while vmraid.cache().llen(queue_key) > 0 and record_count <= 500:
 			records = vmraid.cache().lpop(queue_key)
 			records = json.loads(records.decode("utf-8"))
 			if isinstance(records, dict):
-				record_count += 1
-				insert_record(records, doctype)
-				continue
+				records = [records]
+
 			for record in records:
 				record_count += 1
-				insert_record(record, doctype)
+				records_to_insert.append(record)
+
+		insert_records(records_to_insert, doctype)
 
 	vmraid.db.commit()
 
 
+def insert_records(records: List[Union[Dict, "Document"]], doctype: str):
+	if not records:
+		return
+
+	for record in records:
+		record.update({"doctype": doctype})
+
+	vmraid.db.savepoint("deferred_insert")
+	try:
+		vmraid.insert_many(records)
+	except Exception:
+		# insert one by one so that a single bad record does not drop the whole batch
+		vmraid.db.rollback(save_point="deferred_insert")
+		for record in records:
+			insert_record(record, doctype)
+	else:
+		vmraid.db.release_savepoint("deferred_insert")
+
+
 def insert_record(record: Union[Dict, "Document"], doctype: str):
-	setattr(record, "doctype", doctype)
+	record.update({"doctype": doctype})
 	try:
 		vmraid.get_doc(record).insert()
 	except Exception as e:
@@ -9,11 +9,15 @@ import vmraid
 from vmraid import _
 from vmraid.boot import get_allowed_reports
 from vmraid.config import get_modules_from_all_apps_for_user
+from vmraid.desk.doctype.dashboard_chart_rollup.dashboard_chart_rollup import (
+	clear_rollup,
+	get_rollup_data,
+)
 from vmraid.model.document import Document
 from vmraid.model.naming import append_number_if_name_exists
 from vmraid.modules.export_file import export_to_files
 from vmraid.utils import cint, get_datetime, getdate, now_datetime, nowdate
-from vmraid.utils.dashboard import cache_source
+from vmraid.utils.dashboard import cache_source, clear_cached_results, get_permission_conditions
 from vmraid.utils.dateutils import (
 	get_dates_from_timegrain,
 	get_from_date_from_timespan,
@@ -134,6 +138,8 @@ def get(
 	if not filters:
 		filters = []
 
+	use_rollup = can_use_rollup(chart, filters)
+
 	# don't include cancelled documents
 	filters.append([chart.document_type, "docstatus", "<", 2, False])
 
@@ -143,7 +149,9 @@ def get(
 		if chart.type == "Heatmap":
 			chart_config = get_heatmap_chart_config(chart, filters, heatmap_year)
 		else:
-			chart_config = get_chart_config(chart, filters, timespan, timegrain, from_date, to_date)
+			chart_config = get_chart_config(
+				chart, filters, timespan, timegrain, from_date, to_date, use_rollup
+			)
 
 	return chart_config
 
@@ -193,7 +201,29 @@ def add_chart_to_dashboard(args):
 	vmraid.db.commit()
 
 
-def get_chart_config(chart, filters, timespan, timegrain, from_date, to_date):
+def can_use_rollup(chart, filters):
+	"""Rollups are aggregated over all documents matching the saved filters of the chart,
+	so they can only be used without other filters and without permission restrictions."""
+	if not (
+		isinstance(chart, Document)
+		and chart.use_rollup
+		and chart.rollup_synced_on
+		and chart.timeseries
+		and chart.chart_type in ("Count", "Sum", "Average")
+		and chart.type != "Heatmap"
+	):
+		return False
+
+	if filters != (vmraid.parse_json(chart.filters_json) or []):
+		return False
+
+	try:
+		return not get_permission_conditions(chart.document_type)
+	except vmraid.PermissionError:
+		return False
+
+
+def get_chart_config(chart, filters, timespan, timegrain, from_date, to_date, use_rollup=False):
 	if not from_date:
 		from_date = get_from_date_from_timespan(to_date, timespan)
 		from_date = get_period_beginning(from_date, timegrain)
@@ -209,15 +239,18 @@ def get_chart_config(chart, filters, timespan, timegrain, from_date, to_date):
 	filters.append([doctype, datefield, ">=", from_date, False])
 	filters.append([doctype, datefield, "<=", to_date, False])
 
-	data = vmraid.db.get_list(
-		doctype,
-		fields=["{} as _unit".format(datefield), "SUM({})".format(value_field), "COUNT(*)"],
-		filters=filters,
-		group_by="_unit",
-		order_by="_unit asc",
-		as_list=True,
-		ignore_ifnull=True,
-	)
+	if use_rollup:
+		data = get_rollup_data(chart, from_date, to_date)
+	else:
+		data = vmraid.db.get_list(
+			doctype,
+			fields=["{} as _unit".format(datefield), "SUM({})".format(value_field), "COUNT(*)"],
+			filters=filters,
+			group_by="_unit",
+			order_by="_unit asc",
+			as_list=True,
+			ignore_ifnull=True,
+		)
 
 	result = get_result(data, timegrain, from_date, to_date, chart.chart_type)
 
@@ -347,10 +380,24 @@ def get_charts_for_user(doctype, txt, searchfield, start, page_len, filters):
 
 class DashboardChart(Document):
 	def on_update(self):
-		vmraid.cache().delete_key("chart-data:{}".format(self.name))
+		clear_cached_results(self.name)
+		self.reset_rollup()
 		if vmraid.conf.developer_mode and self.is_standard:
 			export_to_files(record_list=[["Dashboard Chart", self.name]], record_module=self.module)
 
+	def on_trash(self):
+		clear_rollup(self.name)
+
+	def reset_rollup(self):
+		"""Rollups are (re)built by the scheduler when enabled or the chart query changes."""
+		rollup_fields = ("use_rollup", "document_type", "based_on", "value_based_on", "filters_json")
+		if not any(self.has_value_changed(fieldname) for fieldname in rollup_fields):
+			return
+
+		clear_rollup(self.name)
+		if self.rollup_synced_on:
+			self.db_set("rollup_synced_on", None, update_modified=False)
+
 	def validate(self):
 		if not vmraid.conf.developer_mode and self.is_standard:
 			vmraid.throw(_("Cannot edit Standard charts"))
@@ -10,6 +10,7 @@ from dateutil.relativedelta import relativedelta
 import vmraid
 from vmraid.desk.doctype.dashboard_chart.dashboard_chart import get
 from vmraid.utils import formatdate, get_last_day, getdate
+from vmraid.utils.dashboard import get_permission_signature
 from vmraid.utils.dateutils import get_period, get_period_ending
 
 
@@ -153,6 +154,55 @@ class TestDashboardChart(unittest.TestCase):
 
 		vmraid.db.rollback()
 
+	def test_cached_results(self):
+		if vmraid.db.exists("Dashboard Chart", "Test Cached Dashboard Chart"):
+			vmraid.delete_doc("Dashboard Chart", "Test Cached Dashboard Chart")
+
+		vmraid.get_doc({"doctype": "ToDo", "description": "test", "status": "Open"}).insert()
+		vmraid.get_doc(
+			dict(
+				doctype="Dashboard Chart",
+				chart_name="Test Cached Dashboard Chart",
+				chart_type="Group By",
+				document_type="ToDo",
+				group_by_based_on="status",
+				filters_json="[]",
+			)
+		).insert()
+
+		def open_count(**kwargs):
+			result = get(chart_name="Test Cached Dashboard Chart", **kwargs)
+			if not result:
+				return None
+			return dict(zip(result["labels"], result["datasets"][0]["values"])).get("Open")
+
+		count = open_count(refresh=1)
+		vmraid.get_doc({"doctype": "ToDo", "description": "test", "status": "Open"}).insert()
+
+		# served from cache until refreshed
+		self.assertEqual(open_count(), count)
+		self.assertEqual(open_count(refresh=1), count + 1)
+
+		# filters are part of the cache key
+		filters = '[["ToDo", "status", "=", "Closed"]]'
+		self.assertIsNone(open_count(filters=filters))
+
+		vmraid.db.rollback()
+
+	def test_permission_signature_of_shared_only_user(self):
+		vmraid.share.add("Role", "System Manager", "test1@example.com")
+		try:
+			signature = get_permission_signature("Role")
+			vmraid.set_user("test1@example.com")
+			shared_signature = get_permission_signature("Role")
+		finally:
+			vmraid.set_user("Administrator")
+			vmraid.db.rollback()
+
+		# users who can only read shared documents don't get results of unrestricted users
+		self.assertEqual(signature, "")
+		self.assertIn("System Manager", shared_signature)
+
 	def test_daily_dashboard_chart(self):
 		insert_test_records()
 
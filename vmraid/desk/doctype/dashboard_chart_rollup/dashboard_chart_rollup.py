@@ -0,0 +1,220 @@
+# Copyright (c) 2022, VMRaid Technologies and contributors
+# License: MIT. See LICENSE
+"""
+Daily partial aggregates (sum and count) of time series Dashboard Charts with
+`use_rollup` set.
+
+Days touched by document updates are marked dirty by doc event hooks, and
+`sync_rollups` (scheduled) recomputes dirty days and the days of documents
+modified since the last sync. Charts then merge the daily buckets into their
+time grain instead of aggregating all documents in the timespan.
+"""
+
+import datetime
+
+import redis
+
+import vmraid
+from vmraid.model.document import Document
+from vmraid.utils import add_days, getdate, make_filter_tuple, now_datetime
+
+
+class DashboardChartRollup(Document):
+	pass
+
+
+def on_doctype_update():
+	# buckets are looked up by chart and date range
+	vmraid.db.add_index("Dashboard Chart Rollup", ["chart", "bucket_date"])
+
+
+def get_rollup_charts(doctype):
+	"""Returns charts with rollups on `doctype`"""
+
+	def _get():
+		# not migrated yet
+		if not vmraid.db.has_column("Dashboard Chart", "use_rollup"):
+			return []
+
+		return vmraid.get_all(
+			"Dashboard Chart",
+			filters={"use_rollup": 1, "document_type": doctype},
+			fields=["name", "based_on"],
+		)
+
+	return vmraid.cache().hget("dashboard_chart_rollups", doctype, _get)
+
+
+def mark_dirty_dates(doc, method=None):
+	"""Mark days of the document (before and after the change) to be recomputed."""
+	if (
+		vmraid.flags.in_install
+		or vmraid.flags.in_migrate
+		or doc.doctype in ("Dashboard Chart Rollup", "Dashboard Chart")
+	):
+		return
+
+	charts = get_rollup_charts(doc.doctype)
+	if not charts:
+		return
+
+	doc_before_save = doc.get_doc_before_save()
+	for chart in charts:
+		dates = {doc.get(chart.based_on)}
+		if doc_before_save:
+			dates.add(doc_before_save.get(chart.based_on))
+
+		dates = [str(getdate(date)) for date in dates if date]
+		if dates:
+			try:
+				vmraid.cache().sadd(get_dirty_dates_key(chart.name), *dates)
+			except redis.exceptions.ConnectionError:
+				# modified documents are picked up by the next sync anyway
+				pass
+
+
+def sync_rollups():
+	"""Recompute dirty days of all rollups, build rollups that are not built yet."""
+	for chart in vmraid.get_all("Dashboard Chart", filters={"use_rollup": 1}, pluck="name"):
+		sync_rollup(vmraid.get_doc("Dashboard Chart", chart))
+		vmraid.db.commit()
+
+
+def sync_rollup(chart):
+	synced_on = now_datetime()
+
+	if not chart.rollup_synced_on:
+		update_buckets(chart)
+	else:
+		dates = pop_dirty_dates(chart.name)
+		dates.update(get_modified_dates(chart, chart.rollup_synced_on))
+		for from_date, to_date in get_date_ranges(dates):
+			update_buckets(chart, from_date, to_date)
+
+	vmraid.db.set_value(
+		"Dashboard Chart", chart.name, "rollup_synced_on", synced_on, update_modified=False
+	)
+
+
+def clear_rollup(chart_name):
+	vmraid.db.delete("Dashboard Chart Rollup", {"chart": chart_name})
+	vmraid.cache().delete_value(get_dirty_dates_key(chart_name))
+	vmraid.cache().delete_value("dashboard_chart_rollups")
+
+
+def get_rollup_data(chart, from_date, to_date):
+	"""Returns list of [date, total, count] for each day with documents, like the chart query."""
+	return vmraid.get_all(
+		"Dashboard Chart Rollup",
+		filters={"chart": chart.name, "bucket_date": ("between", [from_date, getdate(to_date)])},
+		fields=["bucket_date", "total", "row_count"],
+		order_by="bucket_date asc",
+		as_list=True,
+	)
+
+
+def update_buckets(chart, from_date=None, to_date=None):
+	"""Recompute buckets of all days between `from_date` and `to_date` (all days if not set)."""
+	doctype = chart.document_type
+	datefield = f"`tab{doctype}`.`{chart.based_on}`"
+	filters = vmraid.parse_json(chart.filters_json) or []
+	if isinstance(filters, dict):
+		filters = [make_filter_tuple(doctype, key, value) for key, value in filters.items()]
+
+	# don't include cancelled documents
+	filters.append([doctype, "docstatus", "<", 2, False])
+
+	bucket_filters = {"chart": chart.name}
+	if from_date:
+		filters.append([doctype, chart.based_on, ">=", from_date, False])
+		filters.append([doctype, chart.based_on, "<", add_days(to_date, 1), False])
+		bucket_filters["bucket_date"] = ("between", [from_date, to_date])
+
+	data = vmraid.get_all(
+		doctype,
+		fields=[
+			f"date({datefield}) as _day",
+			"SUM({})".format(chart.value_based_on or "1"),
+			"COUNT(*)",
+		],
+		filters=filters,
+		group_by="_day",
+		as_list=True,
+		ignore_ifnull=True,
+	)
+
+	vmraid.db.delete("Dashboard Chart Rollup", bucket_filters)
+
+	now = now_datetime()
+	vmraid.db.bulk_insert(
+		"Dashboard Chart Rollup",
+		fields=[
+			"name",
+			"chart",
+			"bucket_date",
+			"total",
+			"row_count",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+		],
+		values=[
+			(
+				vmraid.generate_hash(length=10),
+				chart.name,
+				day,
+				total or 0,
+				count,
+				now,
+				now,
+				"Administrator",
+				"Administrator",
+			)
+			for day, total, count in data
+			if day
+		],
+	)
+
+
+def get_modified_dates(chart, since):
+	"""Returns days of documents modified since `since`, irrespective of chart filters."""
+	return {
+		str(getdate(day))
+		for day in vmraid.get_all(
+			chart.document_type,
+			fields=[f"date(`tab{chart.document_type}`.`{chart.based_on}`) as _day"],
+			filters={"modified": (">=", since)},
+			group_by="_day",
+			pluck="_day",
+		)
+		if day
+	}
+
+
+def pop_dirty_dates(chart_name):
+	key = get_dirty_dates_key(chart_name)
+	try:
+		dates = {vmraid.safe_decode(date) for date in vmraid.cache().smembers(key)}
+		if dates:
+			vmraid.cache().srem(key, *dates)
+	except redis.exceptions.ConnectionError:
+		dates = set()
+
+	return dates
+
+
+def get_date_ranges(dates):
+	"""Group dates into ranges of consecutive days, e.g. for 1, 2, 3 and 7 returns (1, 3), (7, 7)"""
+	ranges = []
+	for date in sorted(getdate(d) for d in dates):
+		if ranges and date - ranges[-1][1] <= datetime.timedelta(days=1):
+			ranges[-1][1] = date
+		else:
+			ranges.append([date, date])
+
+	return [tuple(r) for r in ranges]
+
+
+def get_dirty_dates_key(chart_name):
+	return f"dashboard_chart_rollup_dirty_dates:{chart_name}"
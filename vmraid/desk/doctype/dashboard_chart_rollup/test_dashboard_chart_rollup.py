@@ -0,0 +1,80 @@
+# Copyright (c) 2022, VMRaid Technologies and Contributors
+# License: MIT. See LICENSE
+import unittest
+
+import vmraid
+from vmraid.desk.doctype.dashboard_chart.dashboard_chart import can_use_rollup, get
+from vmraid.desk.doctype.dashboard_chart_rollup.dashboard_chart_rollup import (
+	get_date_ranges,
+	sync_rollups,
+)
+from vmraid.utils import add_days, getdate, now_datetime
+
+
+class TestDashboardChartRollup(unittest.TestCase):
+	def test_chart_from_rollup(self):
+		if vmraid.db.exists("Dashboard Chart", "Test Rollup Dashboard Chart"):
+			vmraid.delete_doc("Dashboard Chart", "Test Rollup Dashboard Chart")
+
+		chart = vmraid.get_doc(
+			dict(
+				doctype="Dashboard Chart",
+				chart_name="Test Rollup Dashboard Chart",
+				chart_type="Count",
+				document_type="ToDo",
+				based_on="creation",
+				timespan="Last Month",
+				time_interval="Daily",
+				filters_json="[]",
+				timeseries=1,
+				use_rollup=1,
+			)
+		).insert()
+
+		def get_values():
+			return get(chart_name=chart.name, refresh=1)["datasets"][0]["values"]
+
+		vmraid.get_doc({"doctype": "ToDo", "description": "rollup"}).insert()
+		live = get_values()
+
+		sync_rollups()
+		self.assertTrue(vmraid.db.get_value("Dashboard Chart", chart.name, "rollup_synced_on"))
+		self.assertTrue(vmraid.db.count("Dashboard Chart Rollup", {"chart": chart.name}))
+		self.assertEqual(get_values(), live)
+
+		# updated incrementally
+		vmraid.get_doc({"doctype": "ToDo", "description": "rollup"}).insert()
+		sync_rollups()
+		self.assertEqual(get_values()[-1], live[-1] + 1)
+
+		chart.delete()
+		self.assertFalse(vmraid.db.count("Dashboard Chart Rollup", {"chart": chart.name}))
+
+	def test_rollup_not_used_by_shared_only_user(self):
+		chart = vmraid.get_doc(
+			dict(
+				doctype="Dashboard Chart",
+				chart_type="Count",
+				document_type="Role",
+				timeseries=1,
+				use_rollup=1,
+				rollup_synced_on=now_datetime(),
+				filters_json="[]",
+			)
+		)
+		self.assertTrue(can_use_rollup(chart, []))
+
+		vmraid.share.add("Role", "System Manager", "test1@example.com")
+		try:
+			vmraid.set_user("test1@example.com")
+			self.assertFalse(can_use_rollup(chart, []))
+		finally:
+			vmraid.set_user("Administrator")
+			vmraid.db.rollback()
+
+	def test_date_ranges(self):
+		today = getdate()
+		dates = [today, add_days(today, 1), add_days(today, 2), add_days(today, 5)]
+		self.assertEqual(
+			get_date_ranges(dates), [(today, add_days(today, 2)), (add_days(today, 5), add_days(today, 5))]
+		)
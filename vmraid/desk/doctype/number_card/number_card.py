@@ -9,6 +9,7 @@ from vmraid.model.document import Document
 from vmraid.model.naming import append_number_if_name_exists
 from vmraid.modules.export_file import export_to_files
 from vmraid.utils import cint
+from vmraid.utils.dashboard import clear_cached_results, get_cached_result
 
 
 class NumberCard(Document):
@@ -31,6 +32,7 @@ class NumberCard(Document):
 			vmraid.throw(_("Parent document type is required to create a number card"))
 
 	def on_update(self):
+		clear_cached_results(self.name)
 		if vmraid.conf.developer_mode and self.is_standard:
 			export_to_files(record_list=[["Number Card", self.name]], record_module=self.module)
 
@@ -88,7 +90,26 @@ def has_permission(doc, ptype, user):
 
 
 @vmraid.whitelist()
-def get_result(doc, filters, to_date=None):
+def get_result(doc, filters, to_date=None, refresh=None):
+	doc = vmraid.parse_json(doc)
+	return get_cached_result(
+		doc.name or doc.document_type,
+		"vmraid.desk.doctype.number_card.number_card.calculate_result",
+		dict(
+			doc=dict(
+				document_type=doc.document_type,
+				function=doc.function,
+				aggregate_function_based_on=doc.aggregate_function_based_on,
+			),
+			filters=filters,
+			to_date=to_date,
+		),
+		doctype=doc.document_type,
+		refresh=cint(refresh),
+	)
+
+
+def calculate_result(doc, filters, to_date=None):
 	doc = vmraid.parse_json(doc)
 	fields = []
 	sql_function_map = {
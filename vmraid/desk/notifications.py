@@ -140,11 +140,11 @@ def clear_notifications(user=None):
 	for_module = list(config.get("for_module")) if config.get("for_module") else []
 	groups = for_doctype + for_module
 
-	for name in groups:
-		if user:
-			cache.hdel("notification_count:" + name, user)
-		else:
-			cache.delete_key("notification_count:" + name)
+	names = ["notification_count:" + name for name in groups]
+	if user:
+		cache.hdel_names(names, user)
+	else:
+		cache.delete_value(names)
 
 	vmraid.publish_realtime("clear_notifications")
 
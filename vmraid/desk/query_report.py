@@ -1,14 +1,19 @@
 # Copyright (c) 2015, VMRaid and Contributors
 # License: MIT. See LICENSE
 
+import hashlib
+import itertools
 import json
 import os
+import tempfile
 from datetime import timedelta
+from time import time
 
 import vmraid
 import vmraid.desk.reportview
 from vmraid import _
 from vmraid.core.utils import ljust_list
+from vmraid.database.replica import DEFAULT_MAX_LAG, in_replica
 from vmraid.model.utils import render_include
 from vmraid.modules import get_module_path, scrub
 from vmraid.permissions import get_role_permissions
@@ -23,6 +28,12 @@ from vmraid.utils import (
 	gzip_decompress,
 )
 
+# rows of a prepared report result sent to the report view, see `get_prepared_report_result`
+PREPARED_REPORT_VIEW_LIMIT = 50000
+
+# seconds, if `cache_expiry` is not set on the report
+DEFAULT_REPORT_CACHE_EXPIRY = 3600
+
 
 def get_report_doc(report_name):
 	doc = vmraid.get_doc("Report", report_name)
@@ -246,6 +257,8 @@ def run(
 		else:
 			dn = ""
 		result = get_prepared_report_result(report, filters, dn, user)
+	elif cint(report.cache_result) and not custom_columns:
+		result = get_cached_report_result(report, filters, user, is_tree, parent_field)
 	else:
 		result = generate_report_result(report, filters, user, custom_columns, is_tree, parent_field)
 
@@ -254,6 +267,70 @@ def run(
 	return result
 
 
+def get_cached_report_result(report, filters, user, is_tree=False, parent_field=None):
+	"""Returns result of a report with `cache_result` set, computed once and shared
+	by users with the same roles and user permissions.
+
+	Cached results are discarded when the Ref DocType or any of the report's
+	`cache_dependencies` is modified after the result was computed."""
+	key = get_report_cache_key(report, filters, user, is_tree, parent_field)
+	dependencies = get_report_cache_dependencies(report)
+
+	cached = vmraid.cache().get_value(key, expires=True)
+	if cached and cached["cached_on"] > vmraid.db.get_table_modified(dependencies):
+		return cached["result"]
+
+	# writes committed while the report runs (or not yet replicated) must invalidate the result
+	cached_on = time()
+	if in_replica():
+		cached_on -= cint(vmraid.conf.replica_max_lag) or DEFAULT_MAX_LAG
+
+	result = generate_report_result(report, filters, user, is_tree=is_tree, parent_field=parent_field)
+	vmraid.cache().set_value(
+		key,
+		{"result": result, "cached_on": cached_on},
+		expires_in_sec=cint(report.cache_expiry) or DEFAULT_REPORT_CACHE_EXPIRY,
+	)
+
+	return result
+
+
+def get_report_cache_key(report, filters, user, is_tree=False, parent_field=None):
+	from vmraid.core.doctype.user_permission.user_permission import get_user_permissions
+
+	if isinstance(filters, str):
+		filters = json.loads(filters)
+
+	signature = json.dumps(
+		[
+			filters or {},
+			report.get("custom_report"),
+			report.custom_columns,
+			cint(is_tree),
+			parent_field,
+			sorted(vmraid.get_roles(user)),
+			get_user_permissions(user),
+		],
+		sort_keys=True,
+		default=str,
+	)
+
+	return "report_result:{0}:{1}".format(report.name, hashlib.sha1(signature.encode()).hexdigest())
+
+
+def get_report_cache_dependencies(report):
+	dependencies = {report.ref_doctype}
+	for doctype in (report.cache_dependencies or "").splitlines():
+		if doctype.strip():
+			dependencies.add(doctype.strip())
+
+	return dependencies
+
+
+def clear_cached_report_results(report_name):
+	vmraid.cache().delete_keys(f"report_result:{report_name}:")
+
+
 def add_custom_column_data(custom_columns, result):
 	custom_column_data = get_data_for_custom_report(custom_columns)
 
@@ -295,16 +372,7 @@ def get_prepared_report_result(report, filters, dn="", user=None):
 
 	if doc:
 		try:
-			# Prepared Report data is stored in a GZip compressed JSON file
-			attached_file_name = vmraid.db.get_value(
-				"File",
-				{"attached_to_doctype": doc.doctype, "attached_to_name": doc.name},
-				"name",
-			)
-			attached_file = vmraid.get_doc("File", attached_file_name)
-			compressed_content = attached_file.get_content()
-			uncompressed_content = gzip_decompress(compressed_content)
-			data = json.loads(uncompressed_content.decode("utf-8"))
+			data, row_count = get_prepared_report_data(doc)
 			if data:
 				columns = json.loads(doc.columns) if doc.columns else data[0]
 
@@ -313,6 +381,10 @@ def get_prepared_report_result(report, filters, dn="", user=None):
 						column["label"] = _(column["label"])
 
 				latest_report_data = {"columns": columns, "result": data}
+				if row_count > len(data):
+					# rest of the rows can be fetched page by page,
+					# see `prepared_report.get_result_rows`
+					latest_report_data.update({"partial": True, "row_count": row_count})
 		except Exception:
 			vmraid.log_error(vmraid.get_traceback())
 			vmraid.delete_doc("Prepared Report", doc.name)
@@ -324,6 +396,29 @@ def get_prepared_report_result(report, filters, dn="", user=None):
 	return latest_report_data
 
 
+def get_prepared_report_data(doc):
+	"""Returns (rows, total row count) of a prepared report result.
+
+	Results in the columnar format are read only up to `prepared_report_view_limit`
+	(site config) rows, older results are stored in a GZip compressed JSON file."""
+	from vmraid.core.doctype.prepared_report.prepared_report import open_result_file
+
+	with open_result_file(doc.name) as result_file:
+		if result_file:
+			limit = cint(vmraid.conf.prepared_report_view_limit) or PREPARED_REPORT_VIEW_LIMIT
+			return result_file.get_rows(page_length=limit), result_file.row_count
+
+	attached_file_name = vmraid.db.get_value(
+		"File",
+		{"attached_to_doctype": doc.doctype, "attached_to_name": doc.name},
+		"name",
+	)
+	attached_file = vmraid.get_doc("File", attached_file_name)
+	uncompressed_content = gzip_decompress(attached_file.get_content())
+	data = json.loads(uncompressed_content.decode("utf-8"))
+	return data, len(data)
+
+
 @vmraid.whitelist()
 def export_query():
 	"""export from query reports"""
@@ -349,6 +444,11 @@ def export_query():
 	if isinstance(visible_idx, str):
 		visible_idx = json.loads(visible_idx)
 
+	# sort and filters of the rows shown in the view of a partial prepared report result
+	result_order_by = data.get("result_order_by") or None
+	result_descending = cint(data.get("result_descending"))
+	result_filters = vmraid.parse_json(data.get("result_filters"))
+
 	if file_format_type == "Excel":
 		data = run(report_name, filters, custom_columns=custom_columns)
 		data = vmraid._dict(data)
@@ -359,42 +459,110 @@ def export_query():
 			)
 			return
 
-		from vmraid.utils.xlsxutils import make_xlsx
-
-		format_duration_fields(data)
-		xlsx_data, column_widths = build_xlsx_data(data, visible_idx, include_indentation)
-		xlsx_file = make_xlsx(xlsx_data, "Query Report", column_widths=column_widths)
+		if data.get("partial"):
+			# only the first rows of large prepared report results are loaded in the report
+			# view, export all rows from the result file with the view's sort and filters
+			from vmraid.core.doctype.prepared_report.prepared_report import open_result_file
+
+			with open_result_file(data.doc.name) as result_file:
+				data.result = iter_partial_result_rows(
+					result_file,
+					data,
+					order_by=result_order_by,
+					descending=result_descending,
+					filters=result_filters,
+				)
+				xlsx_file = make_xlsx_file(data, visible_idx, include_indentation, ignore_visible_idx=True)
+		else:
+			xlsx_file = make_xlsx_file(data, visible_idx, include_indentation)
 
 		vmraid.response["filename"] = report_name + ".xlsx"
-		vmraid.response["filecontent"] = xlsx_file.getvalue()
-		vmraid.response["type"] = "binary"
+		vmraid.response["fileobj"] = xlsx_file
+		vmraid.response["type"] = "file"
+
+
+def iter_partial_result_rows(result_file, data, order_by=None, descending=False, filters=None):
+	"""Yields rows of a prepared report result file sorted and filtered like `get_result_rows`,
+	followed by the total row of the yielded rows if the report has one."""
+	row_numbers = result_file.get_row_numbers(order_by, descending, filters)
+	if not data.add_total_row:
+		yield from result_file.iter_rows_by_number(row_numbers)
+		return
+
+	# the last row of the file is the total row of all rows
+	total_row_number = result_file.row_count - 1
+	row_numbers = [number for number in row_numbers if number != total_row_number]
+	yield from result_file.iter_rows_by_number(row_numbers)
+
+	if filters:
+		yield get_total_row(result_file.iter_rows_by_number(row_numbers), data.columns)
+	else:
+		yield from result_file.iter_rows_by_number([total_row_number])
+
+
+def make_xlsx_file(data, visible_idx, include_indentation, ignore_visible_idx=False):
+	"""Returns a temporary file with the report result in xlsx format. Rows are written
+	one at a time instead of building the rows and the workbook in memory."""
+	from vmraid.utils.xlsxutils import write_xlsx
+
+	format_duration_fields(data)
+	header, column_widths = get_xlsx_header(data.columns)
+	xlsx_data = itertools.chain(
+		[header], iter_xlsx_rows(data, visible_idx, include_indentation, ignore_visible_idx)
+	)
+
+	xlsx_file = tempfile.TemporaryFile()
+	write_xlsx(xlsx_data, "Query Report", xlsx_file, column_widths=column_widths)
+	return xlsx_file
 
 
 def format_duration_fields(data: vmraid._dict) -> None:
-	for i, col in enumerate(data.columns):
-		if col.get("fieldtype") != "Duration":
-			continue
+	"""Format values of Duration columns as rows of `data.result` are read."""
+	duration_columns = [
+		(i, col) for i, col in enumerate(data.columns) if col.get("fieldtype") == "Duration"
+	]
+	if duration_columns:
+		data.result = (format_duration_row(row, duration_columns) for row in data.result)
+
+
+def format_duration_row(row, duration_columns):
+	for i, col in duration_columns:
+		index = col.fieldname if isinstance(row, dict) else i
+		if row[index]:
+			row[index] = format_duration(row[index])
 
-		for row in data.result:
-			index = col.fieldname if isinstance(row, dict) else i
-			if row[index]:
-				row[index] = format_duration(row[index])
+	return row
 
 
 def build_xlsx_data(data, visible_idx, include_indentation, ignore_visible_idx=False):
-	result = [[]]
+	header, column_widths = get_xlsx_header(data.columns)
+	result = [header]
+	result.extend(iter_xlsx_rows(data, visible_idx, include_indentation, ignore_visible_idx))
+
+	return result, column_widths
+
+
+def get_xlsx_header(columns):
+	"""Returns labels and widths of visible columns."""
+	header = []
 	column_widths = []
 
-	for column in data.columns:
+	for column in columns:
 		if column.get("hidden"):
 			continue
-		result[0].append(_(column.get("label")))
+		header.append(_(column.get("label")))
 		column_width = cint(column.get("width", 0))
 		# to convert into scale accepted by openpyxl
 		column_width /= 10
 		column_widths.append(column_width)
 
-	# build table from result
+	return header, column_widths
+
+
+def iter_xlsx_rows(data, visible_idx, include_indentation, ignore_visible_idx=False):
+	"""Yields rows of the report result, one at a time."""
+	visible_idx = set(visible_idx or [])
+
 	for row_idx, row in enumerate(data.result):
 		# only pick up rows that are visible in the report
 		if ignore_visible_idx or row_idx in visible_idx:
@@ -412,39 +580,29 @@ def build_xlsx_data(data, visible_idx, include_indentation, ignore_visible_idx=F
 			elif row:
 				row_data = row
 
-			result.append(row_data)
-
-	return result, column_widths
+			yield row_data
 
 
 def add_total_row(result, columns, meta=None, is_tree=False, parent_field=None):
+	result.append(get_total_row(result, columns, meta, is_tree=is_tree, parent_field=parent_field))
+	return result
+
+
+def get_total_row(rows, columns, meta=None, is_tree=False, parent_field=None):
+	"""Returns the total row of `rows`. Rows are iterated only once, so that they can be
+	streamed, e.g. from the result files of a partitioned prepared report."""
+	column_types = [get_column_type(col, meta) for col in columns]
 	total_row = [""] * len(columns)
 	has_percent = []
+	first_row = None
+	row_count = 0
 
-	for i, col in enumerate(columns):
-		fieldtype, options, fieldname = None, None, None
-		if isinstance(col, str):
-			if meta:
-				# get fieldtype from the meta
-				field = meta.get_field(col)
-				if field:
-					fieldtype = meta.get_field(col).fieldtype
-					fieldname = meta.get_field(col).fieldname
-			else:
-				col = col.split(":")
-				if len(col) > 1:
-					if col[1]:
-						fieldtype = col[1]
-						if "/" in fieldtype:
-							fieldtype, options = fieldtype.split("/")
-					else:
-						fieldtype = "Data"
-		else:
-			fieldtype = col.get("fieldtype")
-			fieldname = col.get("fieldname")
-			options = col.get("options")
+	for row in rows:
+		if first_row is None:
+			first_row = row
+		row_count += 1
 
-		for row in result:
+		for i, (fieldtype, options, fieldname) in enumerate(column_types):
 			if i >= len(row):
 				continue
 			cell = row.get(fieldname) if isinstance(row, dict) else row[i]
@@ -460,11 +618,12 @@ def add_total_row(result, columns, meta=None, is_tree=False, parent_field=None):
 					total_row[i] = timedelta(hours=0, minutes=0, seconds=0)
 				total_row[i] = total_row[i] + cell
 
+	for i, (fieldtype, options, fieldname) in enumerate(column_types):
 		if fieldtype == "Link" and options == "Currency":
-			total_row[i] = result[0].get(fieldname) if isinstance(result[0], dict) else result[0][i]
+			total_row[i] = first_row.get(fieldname) if isinstance(first_row, dict) else first_row[i]
 
 	for i in has_percent:
-		total_row[i] = flt(total_row[i]) / len(result)
+		total_row[i] = flt(total_row[i]) / row_count
 
 	first_col_fieldtype = None
 	if isinstance(columns[0], str):
@@ -477,8 +636,34 @@ def add_total_row(result, columns, meta=None, is_tree=False, parent_field=None):
 	if first_col_fieldtype not in ["Currency", "Int", "Float", "Percent", "Date"]:
 		total_row[0] = _("Total")
 
-	result.append(total_row)
-	return result
+	return total_row
+
+
+def get_column_type(col, meta=None):
+	"""Returns (fieldtype, options, fieldname) of a report column."""
+	fieldtype, options, fieldname = None, None, None
+	if isinstance(col, str):
+		if meta:
+			# get fieldtype from the meta
+			field = meta.get_field(col)
+			if field:
+				fieldtype = meta.get_field(col).fieldtype
+				fieldname = meta.get_field(col).fieldname
+		else:
+			col = col.split(":")
+			if len(col) > 1:
+				if col[1]:
+					fieldtype = col[1]
+					if "/" in fieldtype:
+						fieldtype, options = fieldtype.split("/")
+				else:
+					fieldtype = "Data"
+	else:
+		fieldtype = col.get("fieldtype")
+		fieldname = col.get("fieldname")
+		options = col.get("options")
+
+	return fieldtype, options, fieldname
 
 
 @vmraid.whitelist()
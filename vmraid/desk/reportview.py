@@ -4,7 +4,7 @@
 """build query for doclistview and return results"""
 
 import json
-from io import StringIO
+import tempfile
 
 import vmraid
 import vmraid.permissions
@@ -12,8 +12,8 @@ from vmraid import _
 from vmraid.core.doctype.access_log.access_log import make_access_log
 from vmraid.model import child_table_fields, default_fields, optional_fields
 from vmraid.model.base_document import get_controller
-from vmraid.model.db_query import DatabaseQuery
-from vmraid.utils import add_user_info, cstr, format_duration
+from vmraid.model.db_query import CursorPage, DatabaseQuery
+from vmraid.utils import add_user_info, format_duration
 
 
 @vmraid.whitelist()
@@ -270,7 +270,11 @@ def compress(data, args=None):
 		meta = vmraid.get_meta(args.doctype)
 		values = add_total_row(values, keys, meta)
 
-	return {"keys": keys, "values": values, "user_info": user_info}
+	result = {"keys": keys, "values": values, "user_info": user_info}
+	if isinstance(data, CursorPage):
+		result["next_cursor"] = data.next_cursor
+
+	return result
 
 
 @vmraid.whitelist()
@@ -362,57 +366,81 @@ def export_query():
 	)
 
 	db_query = DatabaseQuery(doctype)
-	ret = db_query.execute(**form_params)
+	rows = db_query.execute(as_iterator=True, **form_params)
 
-	if add_totals_row:
-		ret = append_totals_row(ret)
+	# rows are read from the database and written to a temporary file in batches,
+	# so memory does not grow with the number of rows exported
+	export_file = tempfile.TemporaryFile()
+	data = get_export_rows(doctype, db_query.fields, rows, add_totals_row)
 
-	data = [[_("Sr")] + get_labels(db_query.fields, doctype)]
-	for i, row in enumerate(ret):
-		data.append([i + 1] + list(row))
+	if file_format_type == "CSV":
+		from vmraid.utils.csvutils import write_csv
+		from vmraid.utils.xlsxutils import handle_html
 
-	data = handle_duration_fieldtype_values(doctype, data, db_query.fields)
+		write_csv(
+			([handle_html(vmraid.as_unicode(v)) if isinstance(v, str) else v for v in r] for r in data),
+			export_file,
+		)
+		vmraid.response["filename"] = title + ".csv"
 
-	if file_format_type == "CSV":
+	elif file_format_type == "Excel":
+		from vmraid.utils.xlsxutils import write_xlsx
 
-		# convert to csv
-		import csv
+		write_xlsx(data, doctype, export_file)
+		vmraid.response["filename"] = title + ".xlsx"
 
-		from vmraid.utils.xlsxutils import handle_html
+	vmraid.response["fileobj"] = export_file
+	vmraid.response["type"] = "file"
 
-		f = StringIO()
-		writer = csv.writer(f)
-		for r in data:
-			# encode only unicode type strings and not int, floats etc.
-			writer.writerow([handle_html(vmraid.as_unicode(v)) if isinstance(v, str) else v for v in r])
 
-		f.seek(0)
-		vmraid.response["result"] = cstr(f.read())
-		vmraid.response["type"] = "csv"
-		vmraid.response["doctype"] = title
+def get_export_rows(doctype, fields, rows, add_totals_row=False, batch_size=1000):
+	"""Yields header and rows (with serial number) to be exported, formatting rows in batches."""
+	yield [_("Sr")] + get_labels(fields, doctype)
 
-	elif file_format_type == "Excel":
+	totals = None
+	batch = []
+	count = 0
+	for count, row in enumerate(rows, 1):
+		if add_totals_row:
+			totals = add_to_totals(totals, row)
 
-		from vmraid.utils.xlsxutils import make_xlsx
+		batch.append([count] + list(row))
+		if len(batch) >= batch_size:
+			yield from format_export_rows(doctype, fields, batch)
+			batch = []
 
-		xlsx_file = make_xlsx(data, doctype)
+	if totals:
+		if not isinstance(totals[0], (int, float)):
+			totals[0] = "Total"
+		batch.append([count + 1] + totals)
 
-		vmraid.response["filename"] = title + ".xlsx"
-		vmraid.response["filecontent"] = xlsx_file.getvalue()
-		vmraid.response["type"] = "binary"
+	yield from format_export_rows(doctype, fields, batch)
+
+
+def format_export_rows(doctype, fields, rows):
+	# first row is expected to be the header
+	return handle_duration_fieldtype_values(doctype, [None] + rows, fields)[1:]
+
+
+def add_to_totals(totals, row):
+	if totals is None:
+		totals = [""] * len(row)
+
+	for i in range(len(row)):
+		if isinstance(row[i], (float, int)):
+			totals[i] = (totals[i] or 0) + row[i]
+
+	return totals
 
 
 def append_totals_row(data):
 	if not data:
 		return data
 	data = list(data)
-	totals = []
-	totals.extend([""] * len(data[0]))
+	totals = None
 
 	for row in data:
-		for i in range(len(row)):
-			if isinstance(row[i], (float, int)):
-				totals[i] = (totals[i] or 0) + row[i]
+		totals = add_to_totals(totals, row)
 
 	if not isinstance(totals[0], (int, float)):
 		totals[0] = "Total"
@@ -2,6 +2,7 @@
 # License: MIT. See LICENSE
 
 import vmraid
+import vmraid.metrics
 from vmraid import _, msgprint
 from vmraid.query_builder import DocType, Interval
 from vmraid.query_builder.functions import Now
@@ -161,6 +162,8 @@ def flush(from_test=False):
 		msgprint(_("Emails are muted"))
 		from_test = True
 
+	update_backlog_metric()
+
 	if cint(vmraid.defaults.get_defaults().get("hold_queue")) == 1:
 		return
 
@@ -173,6 +176,14 @@ def flush(from_test=False):
 			vmraid.log_error()
 
 
+def update_backlog_metric():
+	if vmraid.conf.metrics:
+		backlog = vmraid.db.count(
+			"Email Queue", {"status": ("in", ("Not Sent", "Partially Sent"))}
+		)
+		vmraid.metrics.set_gauge("vmraid_email_queue_backlog", backlog)
+
+
 def get_queue():
 	return vmraid.db.sql(
 		"""select
@@ -6,6 +6,8 @@ from mimetypes import guess_type
 from werkzeug.wrappers import Response
 
 import vmraid
+import vmraid.metrics
+import vmraid.profiler
 import vmraid.sessions
 import vmraid.utils
 from vmraid import _, is_whitelisted
@@ -59,6 +61,8 @@ def execute_cmd(cmd, from_async=False):
 	# via server script
 	server_script = get_server_script_map().get("_api", {}).get(cmd)
 	if server_script:
+		vmraid.metrics.set_method(cmd)
+		vmraid.profiler.set_method(cmd)
 		return run_server_script(server_script)
 
 	try:
@@ -73,6 +77,8 @@ def execute_cmd(cmd, from_async=False):
 		is_whitelisted(method)
 		is_valid_http_method(method)
 
+	vmraid.metrics.set_method(cmd)
+	vmraid.profiler.set_method(cmd)
 	return vmraid.call(method, **vmraid.form_dict)
 
 
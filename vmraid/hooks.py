@@ -152,20 +152,24 @@ doc_events = {
 			"vmraid.event_streaming.doctype.event_update_log.event_update_log.notify_consumers",
 			"vmraid.automation.doctype.assignment_rule.assignment_rule.update_due_date",
 			"vmraid.core.doctype.user_type.user_type.apply_permissions_for_non_standard_user_type",
+			"vmraid.desk.doctype.dashboard_chart_rollup.dashboard_chart_rollup.mark_dirty_dates",
 		],
 		"after_rename": "vmraid.desk.notifications.clear_doctype_notifications",
 		"on_cancel": [
 			"vmraid.desk.notifications.clear_doctype_notifications",
 			"vmraid.workflow.doctype.workflow_action.workflow_action.process_workflow_actions",
 			"vmraid.event_streaming.doctype.event_update_log.event_update_log.notify_consumers",
+			"vmraid.desk.doctype.dashboard_chart_rollup.dashboard_chart_rollup.mark_dirty_dates",
 		],
 		"on_trash": [
 			"vmraid.desk.notifications.clear_doctype_notifications",
 			"vmraid.workflow.doctype.workflow_action.workflow_action.process_workflow_actions",
 			"vmraid.event_streaming.doctype.event_update_log.event_update_log.notify_consumers",
+			"vmraid.desk.doctype.dashboard_chart_rollup.dashboard_chart_rollup.mark_dirty_dates",
 		],
 		"on_update_after_submit": [
-			"vmraid.workflow.doctype.workflow_action.workflow_action.process_workflow_actions"
+			"vmraid.workflow.doctype.workflow_action.workflow_action.process_workflow_actions",
+			"vmraid.desk.doctype.dashboard_chart_rollup.dashboard_chart_rollup.mark_dirty_dates",
 		],
 		"on_change": [
 			"vmraid.social.doctype.energy_point_rule.energy_point_rule.process_energy_points",
@@ -206,6 +210,7 @@ scheduler_events = {
 		"vmraid.integrations.doctype.razorpay_settings.razorpay_settings.capture_payment",
 		"vmraid.utils.global_search.sync_global_search",
 		"vmraid.monitor.flush",
+		"vmraid.desk.doctype.dashboard_chart_rollup.dashboard_chart_rollup.sync_rollups",
 	],
 	"hourly": [
 		"vmraid.model.utils.link_count.update_link_count",
@@ -0,0 +1,336 @@
+# Copyright (c) 2022, VMRaid and Contributors
+# License: MIT. See LICENSE
+"""
+Prometheus metrics of framework internals.
+
+Request and job durations, query durations and cache lookups are counted in
+memory while a transaction runs, merged into a per-process buffer when it ends
+and added to a Redis hash of the site every few seconds by a background thread.
+Scraping reads that hash, a few gauges set by scheduled jobs and the scheduler and
+the lengths of the RQ queues, it never queries the database.
+
+Enable by setting `metrics` in site config, then scrape
+`/api/method/vmraid.metrics.get_metrics` with the API key of a System Manager.
+"""
+
+import re
+import sys
+import time
+import traceback
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+import redis
+import rq
+
+import vmraid
+from vmraid.utils.process_buffer import ProcessBuffer, get_process_buffer
+from vmraid.utils.redis_wrapper import SCAN_COUNT
+
+METRICS_REDIS_KEY = "metrics"
+METRICS_GAUGES_REDIS_KEY = "metrics-gauges"
+
+# buffered values are pushed to Redis this often (seconds)
+METRICS_BUFFER_FLUSH_INTERVAL = 10
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 10)
+JOB_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1500, 3600)
+
+# name: (type, help, buckets)
+METRICS = {
+	"vmraid_http_request_duration_seconds": (
+		"histogram",
+		"Request latency by route.",
+		REQUEST_BUCKETS,
+	),
+	"vmraid_db_query_duration_seconds": ("histogram", "Database query time.", QUERY_BUCKETS),
+	"vmraid_cache_lookups_total": (
+		"counter",
+		"Cache lookups by the tier that served them: local, process, redis or miss.",
+		None,
+	),
+	"vmraid_job_duration_seconds": ("histogram", "Background job duration.", JOB_BUCKETS),
+	"vmraid_job_failures_total": ("counter", "Failed background jobs.", None),
+	"vmraid_queue_depth": ("gauge", "Jobs waiting in the queue.", None),
+	"vmraid_scheduler_lag_seconds": (
+		"gauge",
+		"Time since a Scheduled Job Type was due without being started.",
+		None,
+	),
+	"vmraid_email_queue_backlog": ("gauge", "Emails waiting to be sent.", None),
+}
+
+QUERY_TYPES = ("select", "insert", "update", "delete")
+HTTP_METHODS = ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS")
+# first segment of paths labelled by route family, other paths are labelled "other"
+ROUTE_FAMILIES = ("api", "app", "assets", "backups", "files", "private")
+LE_PATTERN = re.compile(r'le="([^"]+)"')
+
+
+def start(transaction_type="request", method=None, kwargs=None):
+	if vmraid.conf.metrics:
+		vmraid.local.metrics = Metrics(transaction_type, method, kwargs)
+
+
+def stop():
+	if hasattr(vmraid.local, "metrics"):
+		vmraid.local.metrics.dump()
+
+		# job processes may exit before the buffer is flushed in the background
+		if vmraid.local.metrics.transaction_type == "job":
+			get_buffer().flush()
+
+		del vmraid.local.metrics
+
+
+def set_method(method):
+	"""Label the request with `method`, called once a whitelisted method is resolved."""
+	if hasattr(vmraid.local, "metrics"):
+		vmraid.local.metrics.method = method
+
+
+def set_gauge(name, value, **labels):
+	if vmraid.conf.metrics:
+		vmraid.cache().hset(METRICS_GAUGES_REDIS_KEY, format_series(name, labels.items()), value)
+
+
+class Metrics:
+	"""Counters and histograms of a request or job, merged into the process buffer in `dump`"""
+
+	def __init__(self, transaction_type, method=None, kwargs=None):
+		self.transaction_type = transaction_type
+		self.start_time = time.monotonic()
+		self.method = None
+
+		# (name, labels): increment
+		self.counters = Counter()
+		# (name, labels): [count of each bucket and +Inf, sum]
+		self.histograms = {}
+
+		# requests are labelled in `dump`, once the method or document type is resolved
+		if transaction_type != "request":
+			self.labels = (("queue", get_job_queue()), ("method", get_job_method(method, kwargs)))
+
+	def observe(self, name, value, labels=()):
+		histogram = self.histograms.get((name, labels))
+		if histogram is None:
+			buckets = METRICS[name][2]
+			histogram = self.histograms[(name, labels)] = [0] * (len(buckets) + 1) + [0]
+
+		histogram[bisect_left(METRICS[name][2], value)] += 1
+		histogram[-1] += value
+
+	def add_cache_lookup(self, tier):
+		self.counters[("vmraid_cache_lookups_total", (("tier", tier),))] += 1
+
+	def add_query(self, query_type, duration):
+		labels = (("type", query_type if query_type in QUERY_TYPES else "other"),)
+		self.observe("vmraid_db_query_duration_seconds", duration, labels)
+
+	def dump(self):
+		try:
+			duration = time.monotonic() - self.start_time
+			if self.transaction_type == "request":
+				self.labels = (("route", get_route()), ("method", get_http_method()))
+				self.observe("vmraid_http_request_duration_seconds", duration, self.labels)
+			else:
+				self.observe("vmraid_job_duration_seconds", duration, self.labels)
+				# called from `finally`, the exception is still set if the job failed
+				if sys.exc_info()[0]:
+					self.counters[("vmraid_job_failures_total", self.labels)] += 1
+
+			cache = vmraid.cache()
+			key = cache.make_key(METRICS_REDIS_KEY)
+			get_buffer().add(key, self.get_series(), cache.connection_pool)
+		except Exception:
+			traceback.print_exc()
+
+	def get_series(self):
+		"""Returns {series: increment}, with cumulative histogram buckets."""
+		series = {}
+		for (name, labels), count in self.counters.items():
+			series[format_series(name, labels)] = count
+
+		for (name, labels), histogram in self.histograms.items():
+			count = 0
+			for bound, bucket_count in zip(METRICS[name][2] + ("+Inf",), histogram):
+				count += bucket_count
+				series[format_series(f"{name}_bucket", labels + (("le", bound),))] = count
+
+			series[format_series(f"{name}_count", labels)] = count
+			series[format_series(f"{name}_sum", labels)] = histogram[-1]
+
+		return series
+
+
+def get_route(method=None):
+	"""Returns the route label of the request. Paths and commands come from clients, so only
+	whitelisted methods, existing document types and route families are labelled as is.
+
+	:param method: Whitelisted method of the request, the one set with `set_method` by default."""
+	if not method:
+		metrics = getattr(vmraid.local, "metrics", None)
+		method = metrics and metrics.method
+
+	if method:
+		return f"/api/method/{method}"
+
+	parts = vmraid.request.path.strip("/").split("/")
+	if parts[0] not in ROUTE_FAMILIES:
+		return "other"
+
+	if parts[0] != "api" or len(parts) < 2 or parts[1] not in ("method", "resource"):
+		return "/" + parts[0]
+
+	doctype = parts[2] if parts[1] == "resource" and len(parts) > 2 else None
+	if doctype and vmraid.db and vmraid.db.table_exists(doctype):
+		return f"/api/resource/{doctype}"
+
+	return f"/api/{parts[1]}"
+
+
+def get_http_method():
+	method = vmraid.request.method
+	return method if method in HTTP_METHODS else "other"
+
+
+def get_job_queue():
+	job = rq.get_current_job()
+	return job.origin.split(":")[-1] if job else ""
+
+
+def get_job_method(method, kwargs):
+	# all scheduled jobs run through `run_scheduled_job`
+	if method and "run_scheduled_job" in method and kwargs:
+		return kwargs.get("job_type")
+
+	return method
+
+
+def format_series(name, labels):
+	if not labels:
+		return name
+
+	labels = ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels)
+	return f"{name}{{{labels}}}"
+
+
+def escape_label_value(value):
+	return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def get_buffer():
+	return get_process_buffer(MetricsBuffer)
+
+
+class MetricsBuffer(ProcessBuffer):
+	"""Sum of increments of each series, added to Redis in one pipeline by a background
+	thread, so that requests never wait for Redis."""
+
+	flush_interval = METRICS_BUFFER_FLUSH_INTERVAL
+	thread_name = "vmraid-metrics"
+
+	def __init__(self):
+		super().__init__()
+		self.values = defaultdict(float)
+
+	def add(self, key, series, connection_pool):
+		self.connection_pool = connection_pool
+		with self.lock:
+			for name, value in series.items():
+				self.values[(key, name)] += value
+
+		self.ensure_flusher()
+
+	def flush(self):
+		"""Add buffered increments to Redis, increments are dropped if Redis is not reachable."""
+		with self.lock:
+			values, self.values = self.values, defaultdict(float)
+
+		if not values or not self.connection_pool:
+			return
+
+		try:
+			pipe = redis.Redis(connection_pool=self.connection_pool).pipeline(transaction=False)
+			for (key, name), value in values.items():
+				pipe.hincrbyfloat(key, name, value)
+			pipe.execute()
+		except redis.exceptions.RedisError:
+			pass
+
+
+@vmraid.whitelist()
+def get_metrics():
+	"""Metrics of the site in the Prometheus text format."""
+	vmraid.only_for("System Manager")
+
+	vmraid.response["type"] = "download"
+	vmraid.response["filename"] = "metrics.txt"
+	vmraid.response["content_type"] = "text/plain; version=0.0.4; charset=utf-8"
+	vmraid.response["display_content_as"] = "inline"
+	vmraid.response["filecontent"] = render(get_samples())
+
+
+def get_samples():
+	"""Returns {series: value} of the site."""
+	# include values of this process which are not flushed yet
+	get_buffer().flush()
+
+	cache = vmraid.cache()
+	samples = {
+		vmraid.safe_decode(name): float(value)
+		for name, value in cache.hscan_iter(cache.make_key(METRICS_REDIS_KEY), count=SCAN_COUNT)
+	}
+	for name, value in cache.hgetall(METRICS_GAUGES_REDIS_KEY).items():
+		samples[vmraid.safe_decode(name)] = value
+
+	samples.update(get_queue_depths())
+	return samples
+
+
+def get_queue_depths():
+	from vmraid.utils.background_jobs import get_queues
+
+	return {
+		format_series("vmraid_queue_depth", (("queue", queue.name.split(":")[-1]),)): queue.count
+		for queue in get_queues()
+	}
+
+
+def render(samples):
+	"""Returns samples in the Prometheus text exposition format."""
+	series_by_metric = defaultdict(list)
+	for series, value in samples.items():
+		name = series.partition("{")[0]
+		if name not in METRICS:
+			name = name.rpartition("_")[0]
+
+		series_by_metric[name].append((series, value))
+
+	lines = []
+	for name, (metric_type, help_text, buckets) in METRICS.items():
+		if name not in series_by_metric:
+			continue
+
+		lines.append(f"# HELP {name} {help_text}")
+		lines.append(f"# TYPE {name} {metric_type}")
+		samples = sorted(series_by_metric[name], key=lambda sample: sort_key(sample[0]))
+		for series, value in samples:
+			lines.append(f"{series} {format_value(value)}")
+
+	return "\n".join(lines) + "\n"
+
+
+def sort_key(series):
+	# buckets of a histogram in the order of their bounds
+	match = LE_PATTERN.search(series)
+	if not match:
+		return (series, 0)
+
+	return (LE_PATTERN.sub("", series), float(match.group(1)))
+
+
+def format_value(value):
+	value = float(value)
+	return str(int(value)) if value.is_integer() else repr(value)
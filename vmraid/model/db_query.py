@@ -2,6 +2,7 @@
 # License: MIT. See LICENSE
 """build query for doclistview and return results"""
 
+import base64
 import copy
 import json
 import re
@@ -14,6 +15,7 @@ import vmraid.permissions
 import vmraid.share
 from vmraid import _
 from vmraid.core.doctype.server_script.server_script_utils import get_server_script_map
+from vmraid.database.replica import use_replica
 from vmraid.model import optional_fields
 from vmraid.model.meta import get_table_columns
 from vmraid.model.utils.user_settings import get_user_settings, update_user_settings
@@ -29,6 +31,24 @@ from vmraid.utils import (
 	make_filter_tuple,
 )
 
+# compiled fields and tables cached per doctype, see `DatabaseQuery.compile_fields`
+MAX_QUERY_PLANS_PER_DOCTYPE = 256
+
+# a single column of the queried table in an order by clause, e.g. `tabToDo`.`modified` desc
+CURSOR_ORDER_PATTERN = re.compile(
+	r"^(?:`?tab(?P<table>[^`]+)`?\.)?`?(?P<column>\w+)`?(?:\s+(?P<direction>asc|desc))?$", re.I
+)
+
+
+class CursorPage(list):
+	"""A page of results of a cursor paginated query.
+
+	`next_cursor` is the continuation token for the next page, None on the last page."""
+
+	def __init__(self, rows=(), next_cursor=None):
+		super().__init__(rows)
+		self.next_cursor = next_cursor
+
 
 class DatabaseQuery(object):
 	def __init__(self, doctype, user=None):
@@ -75,6 +95,8 @@ class DatabaseQuery(object):
 		pluck=None,
 		ignore_ddl=False,
 		parent_doctype=None,
+		cursor=None,
+		as_iterator=False,
 	) -> List:
 
 		if (
@@ -132,6 +154,12 @@ class DatabaseQuery(object):
 		self.strict = strict
 		self.ignore_ddl = ignore_ddl
 
+		# keyset pagination, `True` or "" for the first page, else the `next_cursor` of the last page
+		self.cursor = None if cursor in (None, False) else cursor
+
+		# stream rows from a server side cursor instead of fetching all of them
+		self.as_iterator = as_iterator
+
 		# for contextual user permission check
 		# to determine which user permission is applicable on link field of specific doctype
 		self.reference_doctype = reference_doctype or self.doctype
@@ -147,15 +175,21 @@ class DatabaseQuery(object):
 
 		result = self.build_and_run()
 
-		if with_comment_count and not as_list and self.doctype:
-			self.add_comment_count(result)
-
 		if save_user_settings:
 			self.save_user_settings_fields = save_user_settings_fields
 			self.update_user_settings()
 
+		if self.as_iterator and self.run:
+			return self.iter_result(result, with_comment_count and not as_list and self.doctype, pluck)
+
+		if with_comment_count and not as_list and self.doctype:
+			self.add_comment_count(result)
+
 		if pluck:
-			return [d[pluck] for d in result]
+			plucked = [d[pluck] for d in result]
+			if isinstance(result, CursorPage):
+				return CursorPage(plucked, result.next_cursor)
+			return plucked
 
 		return result
 
@@ -163,6 +197,9 @@ class DatabaseQuery(object):
 		args = self.prepare_args()
 		args.limit = self.add_limit()
 
+		if self.cursor is not None:
+			self.apply_cursor(args)
+
 		if args.conditions:
 			args.conditions = "where " + args.conditions
 
@@ -185,19 +222,150 @@ class DatabaseQuery(object):
 			% args
 		)
 
-		return vmraid.db.sql(
-			query,
-			as_dict=not self.as_list,
-			debug=self.debug,
-			update=self.update,
-			ignore_ddl=self.ignore_ddl,
-			run=self.run,
+		if self.as_iterator and self.run:
+			if self.cursor is not None:
+				vmraid.throw(_("Cursor pagination can not be used with as_iterator"), vmraid.ValidationError)
+
+			with use_replica():
+				return vmraid.db.sql_iter(
+					query, as_dict=not self.as_list, update=self.update, debug=self.debug
+				)
+
+		with use_replica():
+			result = vmraid.db.sql(
+				query,
+				as_dict=not self.as_list,
+				debug=self.debug,
+				update=self.update,
+				ignore_ddl=self.ignore_ddl,
+				run=self.run,
+			)
+
+		if self.cursor is not None and self.run:
+			result = self.get_cursor_page(result)
+
+		return result
+
+	def apply_cursor(self, args):
+		"""Sort by a unique key and select rows after the cursor instead of using an offset.
+
+		The sort order is made unique by adding `name`, and the values of the sort columns
+		are selected (as `_cursor_<n>`) to build the continuation token from the last row."""
+		if self.group_by or self.distinct or len(self.tables) > 1:
+			vmraid.throw(
+				_("Cursor pagination is not supported with group by, distinct or child table queries"),
+				vmraid.ValidationError,
+			)
+
+		self.cursor_order = self.get_cursor_order(args.order_by)
+		table = f"`tab{self.doctype}`"
+
+		args.order_by = " order by " + ", ".join(
+			f"{table}.`{column}` {'desc' if descending else 'asc'}"
+			for column, descending in self.cursor_order
 		)
+		args.fields += "".join(
+			f", {table}.`{column}` as `_cursor_{idx}`"
+			for idx, (column, descending) in enumerate(self.cursor_order)
+		)
+
+		if self.cursor is True or not self.cursor:
+			return
+
+		values = decode_cursor(self.cursor, self.cursor_order)
+		condition = self.get_cursor_condition(values)
+
+		if args.conditions:
+			args.conditions = f"({args.conditions}) and {condition}"
+		else:
+			args.conditions = condition
+
+	def get_cursor_order(self, order_by):
+		"""Returns list of (column, descending) for the order by clause, ending with `name`."""
+		order_by = re.sub(r"^\s*order by\s+", "", order_by or "", flags=re.I)
+		cursor_order = []
+
+		for part in filter(None, (p.strip() for p in order_by.split(","))):
+			match = CURSOR_ORDER_PATTERN.match(part)
+			if (
+				not match
+				or (match.group("table") and match.group("table") != self.doctype)
+				or match.group("column") not in self.columns
+			):
+				vmraid.throw(
+					_("Cursor pagination only supports sorting by columns of {0}").format(self.doctype),
+					vmraid.ValidationError,
+				)
+
+			column = match.group("column")
+			descending = (match.group("direction") or "asc").lower() == "desc"
+			cursor_order.append((column, descending))
+
+			# name is unique, any further columns never change the order
+			if column == "name":
+				return cursor_order
+
+		descending = cursor_order[-1][1] if cursor_order else False
+		cursor_order.append(("name", descending))
+		return cursor_order
+
+	def get_cursor_condition(self, values):
+		"""Condition for rows that come after `values` in the cursor order, i.e.
+		`(a > x) or (a = x and b > y) or (a = x and b = y and name > z)`"""
+		conditions = []
+		equal_conditions = []
+
+		for (column, descending), value in zip(self.cursor_order, values):
+			field = f"`tab{self.doctype}`.`{column}`"
+
+			# nulls are the smallest values in mariadb and the largest in postgres
+			nulls_last = (vmraid.db.db_type == "postgres") != descending
+
+			if value is None:
+				after = None if nulls_last else f"{field} is not null"
+				equal_conditions.append(f"{field} is null")
+			else:
+				value = vmraid.db.escape(cstr(value))
+				after = f"{field} {'<' if descending else '>'} {value}"
+				if nulls_last:
+					after = f"({after} or {field} is null)"
+				equal_conditions.append(f"{field} = {value}")
+
+			if after:
+				conditions.append(" and ".join(equal_conditions[:-1] + [after]))
+
+		if not conditions:
+			return "1=0"
+
+		return "(" + " or ".join(f"({condition})" for condition in conditions) + ")"
+
+	def get_cursor_page(self, result):
+		"""Trim the extra row fetched to detect the next page and remove the cursor columns."""
+		next_cursor = None
+		size = len(self.cursor_order)
+
+		if self.limit_page_length and len(result) > self.limit_page_length:
+			result = result[: self.limit_page_length]
+			last_row = result[-1]
+			if self.as_list:
+				values = list(last_row[-size:])
+			else:
+				values = [last_row.get(f"_cursor_{idx}") for idx in range(size)]
+			next_cursor = encode_cursor(self.cursor_order, values)
+
+		if self.as_list:
+			rows = [row[:-size] for row in result]
+		else:
+			rows = result
+			for row in rows:
+				for idx in range(size):
+					row.pop(f"_cursor_{idx}", None)
+
+		return CursorPage(rows, next_cursor)
 
 	def prepare_args(self):
 		self.parse_args()
-		self.sanitize_fields()
-		self.extract_tables()
+		self.compile_fields()
 		self.set_optional_columns()
 		self.build_conditions()
 
@@ -298,6 +466,37 @@ class DatabaseQuery(object):
 					filters.append(make_filter_tuple(self.doctype, key, value))
 			setattr(self, filter_name, filters)
 
+	def compile_fields(self):
+		"""Sanitize fields and extract tables from them.
+
+		The result only depends on the fields and the doctype, so it is cached on the
+		(process-wide) `Meta` object and reused by all queries selecting the same fields.
+		Permissions on the extracted tables are still checked for every query."""
+		if not all(isinstance(f, str) for f in self.fields):
+			self.sanitize_fields()
+			self.extract_tables()
+			return
+
+		meta = vmraid.get_meta(self.doctype)
+		key = (tuple(self.fields), self.strict)
+		plan = meta._query_plans.get(key)
+
+		if plan:
+			fields, tables = plan
+			self.fields = list(fields)
+			self.tables = [tables[0]]
+			for table in tables[1:]:
+				self.append_table(table)
+			return
+
+		self.sanitize_fields()
+		self.extract_tables()
+
+		if len(meta._query_plans) >= MAX_QUERY_PLANS_PER_DOCTYPE:
+			meta._query_plans.clear()
+
+		meta._query_plans[key] = (tuple(self.fields), tuple(self.tables))
+
 	def sanitize_fields(self):
 		"""
 		regex : ^.*[,();].*
@@ -708,44 +907,24 @@ class DatabaseQuery(object):
 
 	def build_match_conditions(self, as_condition=True):
 		"""add match conditions if applicable"""
-		self.match_filters = []
-		self.match_conditions = []
-		only_if_shared = False
 		if not self.user:
 			self.user = vmraid.session.user
 
 		if not self.tables:
 			self.extract_tables()
 
-		meta = vmraid.get_meta(self.doctype)
-		role_permissions = vmraid.permissions.get_role_permissions(meta, user=self.user)
-		self.shared = vmraid.share.get_shared(self.doctype, self.user)
+		permissions = self.get_compiled_permissions()
+		self.shared = permissions.shared
+		self.match_conditions = list(permissions.match_conditions)
+		self.match_filters = copy.deepcopy(permissions.match_filters)
+		only_if_shared = permissions.only_if_shared
 
-		if (
-			not meta.istable
-			and not (role_permissions.get("select") or role_permissions.get("read"))
-			and not self.flags.ignore_permissions
-			and not has_any_user_permission_for_doctype(self.doctype, self.user, self.reference_doctype)
-		):
-			only_if_shared = True
+		if only_if_shared:
 			if not self.shared:
 				vmraid.throw(_("No permission to read {0}").format(self.doctype), vmraid.PermissionError)
 			else:
 				self.conditions.append(self.get_share_condition())
 
-		else:
-			# skip user perm check if owner constraint is required
-			if requires_owner_constraint(role_permissions):
-				self.match_conditions.append(
-					f"`tab{self.doctype}`.`owner` = {vmraid.db.escape(self.user, percent=False)}"
-				)
-
-			# add user permission only if role has read perm
-			elif role_permissions.get("read") or role_permissions.get("select"):
-				# get user permissions
-				user_permissions = vmraid.permissions.get_user_permissions(self.user)
-				self.add_user_permissions(user_permissions)
-
 		if as_condition:
 			conditions = ""
 			if self.match_conditions:
@@ -765,6 +944,64 @@ class DatabaseQuery(object):
 		else:
 			return self.match_filters
 
+	def get_compiled_permissions(self):
+		"""Returns role permission, user permission and share based match conditions of the user.
+
+		These only change with DocPerms, roles, user permissions and shares, so they are cached
+		per user (see `permission_match_conditions` in `vmraid.cache_manager.user_cache_keys`).
+		Conditions from hooks and server scripts are not cached."""
+		key = (
+			self.doctype,
+			self.reference_doctype,
+			bool(self.flags.ignore_permissions),
+			cint(vmraid.get_system_settings("apply_strict_user_permissions")),
+		)
+
+		cache = vmraid.cache()
+		compiled_permissions = cache.hget("permission_match_conditions", self.user) or {}
+		if key not in compiled_permissions:
+			compiled_permissions[key] = self.compile_permissions()
+			cache.hset("permission_match_conditions", self.user, compiled_permissions)
+
+		return compiled_permissions[key]
+
+	def compile_permissions(self):
+		self.match_filters = []
+		self.match_conditions = []
+		only_if_shared = False
+
+		meta = vmraid.get_meta(self.doctype)
+		role_permissions = vmraid.permissions.get_role_permissions(meta, user=self.user)
+		shared = vmraid.share.get_shared(self.doctype, self.user)
+
+		if (
+			not meta.istable
+			and not (role_permissions.get("select") or role_permissions.get("read"))
+			and not self.flags.ignore_permissions
+			and not has_any_user_permission_for_doctype(self.doctype, self.user, self.reference_doctype)
+		):
+			only_if_shared = True
+
+		else:
+			# skip user perm check if owner constraint is required
+			if requires_owner_constraint(role_permissions):
+				self.match_conditions.append(
+					f"`tab{self.doctype}`.`owner` = {vmraid.db.escape(self.user, percent=False)}"
+				)
+
+			# add user permission only if role has read perm
+			elif role_permissions.get("read") or role_permissions.get("select"):
+				# get user permissions
+				user_permissions = vmraid.permissions.get_user_permissions(self.user)
+				self.add_user_permissions(user_permissions)
+
+		return vmraid._dict(
+			only_if_shared=only_if_shared,
+			shared=shared,
+			match_conditions=self.match_conditions,
+			match_filters=self.match_filters,
+		)
+
 	def get_share_condition(self):
 		return f"`tab{self.doctype}`.name in ({', '.join(vmraid.db.escape(s, percent=False) for s in self.shared)})"
 
@@ -906,11 +1143,21 @@ class DatabaseQuery(object):
 					vmraid.throw(_("Please select atleast 1 column from {0} to sort/group").format(tbl))
 
 	def add_limit(self):
-		if self.limit_page_length:
+		if self.limit_page_length and self.cursor is not None:
+			# one extra row to find out if there is a next page
+			return "limit %s" % (self.limit_page_length + 1)
+		elif self.limit_page_length:
 			return "limit %s offset %s" % (self.limit_page_length, self.limit_start)
 		else:
 			return ""
 
+	def iter_result(self, result, with_comment_count=False, pluck=None):
+		for row in result:
+			if with_comment_count:
+				self.add_comment_count((row,))
+
+			yield row[pluck] if pluck else row
+
 	def add_comment_count(self, result):
 		for r in result:
 			if not r.name:
@@ -949,6 +1196,26 @@ def check_parent_permission(parent, child_doctype):
 	raise vmraid.PermissionError
 
 
+def encode_cursor(cursor_order, values):
+	"""Returns opaque continuation token for the row with sort column `values`."""
+	cursor = json.dumps([cursor_order, values], default=str, separators=(",", ":"))
+	return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_cursor(cursor, cursor_order):
+	"""Returns sort column values from the token, validating it against the current sort order."""
+	try:
+		token_order, values = json.loads(base64.urlsafe_b64decode(cstr(cursor).encode()))
+		token_order = [tuple(o) for o in token_order]
+	except (ValueError, TypeError):
+		vmraid.throw(_("Invalid cursor"), vmraid.ValidationError)
+
+	if token_order != cursor_order or len(values) != len(cursor_order):
+		vmraid.throw(_("Cursor does not match the sort order of the query"), vmraid.ValidationError)
+
+	return values
+
+
 def get_order_by(doctype, meta):
 	order_by = ""
 
@@ -17,7 +17,7 @@ from vmraid.model.base_document import BaseDocument, get_controller
 from vmraid.model.docstatus import DocStatus
 from vmraid.model.naming import set_new_name, validate_name
 from vmraid.model.workflow import set_workflow_state_on_action, validate_workflow
-from vmraid.utils import cstr, date_diff, file_lock, flt, get_datetime_str, now
+from vmraid.utils import create_batch, cstr, date_diff, file_lock, flt, get_datetime_str, now
 from vmraid.utils.data import get_absolute_url
 from vmraid.utils.global_search import update_global_search
 
@@ -76,6 +76,158 @@ def get_doc(*args, **kwargs):
 	raise ImportError(doctype)
 
 
+def get_docs(doctype, names, for_update=False, batch_size=500):
+	"""Returns a list of `Document` objects for the given names, in the same order.
+
+	Parents are fetched with one `name in (...)` query and every child table with one
+	query grouped by `parent`, per batch of `batch_size` names. Loaded documents are
+	also set in `vmraid.local.document_cache`.
+
+	Single, virtual and doctypes with a custom `load_from_db` are loaded one by one.
+
+	:param doctype: DocType name.
+	:param names: List of document names.
+	:param for_update: [optional] select documents for update."""
+	names = list(dict.fromkeys(names))
+	controller = get_controller(doctype)
+	meta = vmraid.get_meta(doctype)
+
+	if meta.issingle or meta.get("is_virtual") or controller.load_from_db is not Document.load_from_db:
+		out = [get_doc(doctype, name, for_update=for_update) for name in names]
+		for name, doc in zip(names, out):
+			vmraid.local.document_cache[vmraid.get_document_cache_key(doctype, name)] = doc
+
+		return out
+
+	docs = {}
+	table_fields = meta.get_table_fields()
+
+	for i in range(0, len(names), batch_size):
+		batch = names[i : i + batch_size]
+		parents = vmraid.db.get_values(
+			doctype, {"name": ("in", batch)}, "*", as_dict=True, for_update=for_update
+		)
+
+		children = {}
+		for df in table_fields:
+			for child in vmraid.db.get_values(
+				df.options,
+				{"parent": ("in", batch), "parenttype": doctype, "parentfield": df.fieldname},
+				"*",
+				as_dict=True,
+				order_by="idx asc",
+			):
+				children.setdefault((cstr(child.parent), df.fieldname), []).append(child)
+
+		for d in parents:
+			doc = controller.__new__(controller)
+			doc.doctype = doctype
+			doc.flags = vmraid._dict(for_update=for_update)
+			BaseDocument.__init__(doc, d)
+
+			for df in table_fields:
+				doc.set(df.fieldname, children.get((cstr(doc.name), df.fieldname), []))
+
+			# sometimes __setup__ can depend on child values, hence calling again at the end
+			if hasattr(doc, "__setup__"):
+				doc.__setup__()
+
+			docs[cstr(doc.name).casefold()] = doc
+
+	out = []
+	for name in names:
+		doc = docs.get(cstr(name).casefold())
+		if not doc:
+			vmraid.throw(_("{0} {1} not found").format(_(doctype), name), vmraid.DoesNotExistError)
+
+		vmraid.local.document_cache[vmraid.get_document_cache_key(doctype, name)] = doc
+		out.append(doc)
+
+	return out
+
+
+def insert_many(
+	docs,
+	ignore_permissions=None,
+	ignore_links=None,
+	ignore_if_duplicate=False,
+	ignore_mandatory=None,
+	chunk_size=500,
+):
+	"""Insert many new documents, writing parents and child rows with multi-row INSERT statements.
+
+	Every document is named, validated and goes through the same hooks as `Document.insert`,
+	only the database writes are batched in chunks of `chunk_size` rows. Returns the
+	inserted `Document` objects.
+
+	:param docs: List of document dicts or `Document` objects.
+	:param ignore_permissions: Do not check permissions if True.
+	:param ignore_if_duplicate: Skip parents whose name already exists, as `Document.insert`."""
+	docs = [get_doc(d) for d in docs]
+
+	for doc in docs:
+		doc._validate_for_insert(
+			ignore_permissions=ignore_permissions,
+			ignore_links=ignore_links,
+			ignore_mandatory=ignore_mandatory,
+		)
+
+	# parents first, a parent renamed on a hash collision passes its new name to its children
+	insert_rows(
+		[doc for doc in docs if not getattr(doc.meta, "issingle", 0)],
+		chunk_size,
+		ignore_if_duplicate=ignore_if_duplicate,
+	)
+
+	for doc in docs:
+		if getattr(doc.meta, "issingle", 0):
+			doc.update_single(doc.get_valid_dict())
+		doc.set_parent_in_children()
+
+	insert_rows([d for doc in docs for d in doc.get_all_children()], chunk_size)
+
+	for doc in docs:
+		for d in [doc] + doc.get_all_children():
+			d.set("__islocal", False)
+
+		doc._run_after_insert()
+
+	return docs
+
+
+def insert_rows(records, chunk_size, ignore_if_duplicate=False):
+	"""INSERT `records` with multi-row statements, grouped by doctype and columns.
+
+	If a statement fails with a duplicate name or unique value, its rows are inserted one by
+	one with `db_insert`, which renames documents named by hash and retries, and raises
+	`DuplicateEntryError` or `UniqueValidationError` like `Document.insert`."""
+	from vmraid.model.base_document import DOCTYPES_FOR_DOCTYPE
+
+	rows = {}
+	for d in records:
+		values = d.get_valid_dict(
+			convert_dates_to_str=True,
+			ignore_nulls=d.doctype in DOCTYPES_FOR_DOCTYPE,
+			ignore_virtual=True,
+		)
+		rows.setdefault((d.doctype, tuple(values)), []).append((d, tuple(values.values())))
+
+	for (doctype, columns), doc_rows in rows.items():
+		for chunk in create_batch(doc_rows, chunk_size):
+			vmraid.db.savepoint("insert_many")
+			try:
+				vmraid.db.bulk_insert(doctype, columns, [row[1] for row in chunk], chunk_size)
+			except Exception as e:
+				if not (vmraid.db.is_primary_key_violation(e) or vmraid.db.is_unique_key_violation(e)):
+					raise
+
+				vmraid.db.rollback(save_point="insert_many")
+				for d, _values in chunk:
+					d.db_insert(ignore_if_duplicate=ignore_if_duplicate)
+			else:
+				vmraid.db.release_savepoint("insert_many")
+
+
 class Document(BaseDocument):
 	"""All controllers inherit from `Document`."""
 
@@ -219,6 +371,36 @@ class Document(BaseDocument):
 		if self.flags.in_print:
 			return
 
+		self._validate_for_insert(
+			ignore_permissions=ignore_permissions,
+			ignore_links=ignore_links,
+			ignore_mandatory=ignore_mandatory,
+			set_name=set_name,
+			set_child_names=set_child_names,
+		)
+
+		# parent
+		if getattr(self.meta, "issingle", 0):
+			self.update_single(self.get_valid_dict())
+		else:
+			self.db_insert(ignore_if_duplicate=ignore_if_duplicate)
+
+		# children
+		for d in self.get_all_children():
+			d.db_insert()
+
+		self._run_after_insert()
+		return self
+
+	def _validate_for_insert(
+		self,
+		ignore_permissions=None,
+		ignore_links=None,
+		ignore_mandatory=None,
+		set_name=None,
+		set_child_names=True,
+	):
+		"""Set defaults, name and run all validations and hooks before the document is written"""
 		self.flags.notifications_executed = []
 
 		if ignore_permissions is not None:
@@ -249,18 +431,8 @@ class Document(BaseDocument):
 		self.set_docstatus()
 		self.flags.in_insert = False
 
-		# run validate, on update etc.
-
-		# parent
-		if getattr(self.meta, "issingle", 0):
-			self.update_single(self.get_valid_dict())
-		else:
-			self.db_insert(ignore_if_duplicate=ignore_if_duplicate)
-
-		# children
-		for d in self.get_all_children():
-			d.db_insert()
-
+	def _run_after_insert(self):
+		"""Run `after_insert` and post save methods once the document is written"""
 		self.run_method("after_insert")
 		self.flags.in_insert = True
 
@@ -286,7 +458,6 @@ class Document(BaseDocument):
 		):
 			if vmraid.get_cached_value("User", vmraid.session.user, "follow_created_documents"):
 				follow_document(self.doctype, self.name, vmraid.session.user)
-		return self
 
 	def save(self, *args, **kwargs):
 		"""Wrapper for _save"""
@@ -14,11 +14,16 @@ Example:
 
 
 """
+import copy
 import json
 import os
+import random
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
 import click
+import redis
 
 import vmraid
 from vmraid import _
@@ -36,22 +41,138 @@ from vmraid.model.workflow import get_workflow_name
 from vmraid.modules import load_doctype_module
 from vmraid.utils import cast, cint, cstr
 
+# compiled `Meta` objects kept across requests, keyed by (site, doctype)
+# and validated against the per-doctype version counter in redis, every
+# request gets its own copy, see `copy_meta`
+process_meta_cache = OrderedDict()
+process_meta_cache_lock = threading.Lock()
+PROCESS_META_CACHE_SIZE = 1000
+
+META_VERSION_KEY = "meta_version"
+GLOBAL_META_VERSION = "__global"
+
+# built lazily from the child rows of a `Meta`, rebuilt by copies
+DERIVED_META_ATTRIBUTES = (
+	"_fields",
+	"_dynamic_link_fields",
+	"_set_only_once_fields",
+	"_table_fields",
+)
 
-def get_meta(doctype, cached=True):
-	if cached:
-		if not vmraid.local.meta_cache.get(doctype):
-			meta = vmraid.cache().hget("meta", doctype)
-			if meta:
-				meta = Meta(meta)
-			else:
-				meta = Meta(doctype)
-				vmraid.cache().hset("meta", doctype, meta.as_dict())
-			vmraid.local.meta_cache[doctype] = meta
 
-		return vmraid.local.meta_cache[doctype]
-	else:
+def get_meta(doctype, cached=True):
+	if not cached:
 		return load_meta(doctype)
 
+	if meta := vmraid.local.meta_cache.get(doctype):
+		return meta
+
+	version = get_meta_version(doctype)
+	meta = get_meta_from_process_cache(doctype, version)
+
+	if not meta:
+		cached_meta = vmraid.cache().hget("meta", doctype)
+		if isinstance(cached_meta, tuple) and version is not None and cached_meta[0] == version:
+			meta = Meta(cached_meta[1])
+		else:
+			meta = Meta(doctype)
+			vmraid.cache().hset("meta", doctype, (version, meta.as_dict()))
+
+		set_meta_in_process_cache(doctype, version, meta)
+
+	# callers may change the meta, never hand out the shared object
+	meta = copy_meta(meta)
+	vmraid.local.meta_cache[doctype] = meta
+	return meta
+
+
+def copy_meta(meta):
+	"""Returns a copy of `meta` that can be changed without affecting other requests.
+
+	Child rows (fields, permissions etc.) are copied, `_query_plans` is shared since it
+	only depends on the version of the meta."""
+	meta_copy = object.__new__(Meta)
+	for key, value in meta.__dict__.items():
+		if key in DERIVED_META_ATTRIBUTES:
+			continue
+
+		if isinstance(value, list):
+			value = [
+				copy_child_row(d, meta_copy) if isinstance(d, BaseDocument) else d for d in value
+			]
+		elif isinstance(value, dict) and key != "_query_plans":
+			value = copy.copy(value)
+
+		meta_copy.__dict__[key] = value
+
+	meta_copy._fields = {}
+	return meta_copy
+
+
+def copy_child_row(doc, parent):
+	row = object.__new__(type(doc))
+	row.__dict__.update(doc.__dict__)
+	if "parent_doc" in row.__dict__:
+		row.parent_doc = parent
+
+	return row
+
+
+def get_meta_version(doctype):
+	"""Returns `(global version, doctype version)` of the cached meta, None if redis is down."""
+	cache = vmraid.cache()
+	key = cache.make_key(META_VERSION_KEY)
+	try:
+		versions = cache.hmget(key, [GLOBAL_META_VERSION, doctype])
+		if versions[0] is None:
+			seed_meta_version(cache, key)
+			versions = cache.hmget(key, [GLOBAL_META_VERSION, doctype])
+	except redis.exceptions.ConnectionError:
+		return None
+
+	return tuple(cint(v) for v in versions)
+
+
+def bump_meta_version(doctype=None):
+	"""Invalidate cached meta of `doctype` (or all doctypes) in all processes."""
+	cache = vmraid.cache()
+	key = cache.make_key(META_VERSION_KEY)
+	try:
+		if not doctype:
+			seed_meta_version(cache, key)
+		cache.hincrby(key, doctype or GLOBAL_META_VERSION, 1)
+	except redis.exceptions.ConnectionError:
+		pass
+
+
+def seed_meta_version(cache, key):
+	"""Start the global version from a random epoch if it is missing. Versions are lost when
+	redis is flushed or restarted, counting from 0 again would match meta cached before."""
+	cache.hsetnx(key, GLOBAL_META_VERSION, random.randint(1, 1 << 31))
+
+
+def get_meta_from_process_cache(doctype, version):
+	if version is None:
+		return
+
+	key = (vmraid.local.site, doctype)
+	cached = process_meta_cache.get(key)
+	if cached and cached[0] == version:
+		return cached[1]
+
+
+def set_meta_in_process_cache(doctype, version, meta):
+	if version is None:
+		return
+
+	key = (vmraid.local.site, doctype)
+	with process_meta_cache_lock:
+		process_meta_cache[key] = (version, meta)
+		process_meta_cache.move_to_end(key)
+
+		while len(process_meta_cache) > PROCESS_META_CACHE_SIZE:
+			process_meta_cache.popitem(last=False)
+
 
 def load_meta(doctype):
 	return Meta(doctype)
@@ -98,6 +219,8 @@ class Meta(Document):
 
 	def __init__(self, doctype):
 		self._fields = {}
+		# compiled fields and tables of `DatabaseQuery`, shared by all copies of this meta
+		self._query_plans = {}
 		if isinstance(doctype, dict):
 			super(Meta, self).__init__(doctype)
 
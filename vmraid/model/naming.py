@@ -2,6 +2,7 @@
 # License: MIT. See LICENSE
 
 import re
+from contextlib import contextmanager
 from typing import TYPE_CHECKING, Optional, Union
 
 import vmraid
@@ -244,6 +245,10 @@ def determine_consecutive_week_number(datetime):
 
 
 def getseries(key, digits):
+	reservations = getattr(vmraid.local, "series_reservations", None)
+	if reservations is not None:
+		return ("%0" + str(digits) + "d") % get_reserved_series_number(key, reservations)
+
 	# series created ?
 	# Using vmraid.qb as vmraid.get_values does not allow order_by=None
 	series = DocType("Series")
@@ -261,6 +266,72 @@ def getseries(key, digits):
 	return ("%0" + str(digits) + "d") % current
 
 
+@contextmanager
+def series_reservation(size):
+	"""Reserve `size` numbers of a series at a time in `getseries`, so that bulk inserts
+	update `tabSeries` once for `size` documents instead of once per document.
+
+	Reserved numbers that are not used are released at the end of the block if no one
+	else has taken numbers from the series since. When rolling back to a savepoint, restore
+	the reservations made before the savepoint with `restore_series_reservations`, as the
+	rollback undoes the reservations made after it."""
+	vmraid.local.series_reservations = {}
+	vmraid.local.series_reservation_size = size
+
+	try:
+		yield
+		release_series_reservations()
+	finally:
+		vmraid.local.series_reservations = None
+
+
+def get_reserved_series_number(key, reservations):
+	current, last = reservations.get(key, (0, 0))
+	if current >= last:
+		size = vmraid.local.series_reservation_size
+		current = reserve_series(key, size) - 1
+		last = current + size
+
+	current += 1
+	reservations[key] = (current, last)
+	return current
+
+
+def reserve_series(key, size):
+	"""Returns the first of `size` numbers reserved in the series."""
+	series = DocType("Series")
+	current = (vmraid.qb.from_(series).where(series.name == key).for_update().select("current")).run()
+
+	if current and current[0][0] is not None:
+		vmraid.db.sql("UPDATE `tabSeries` SET `current` = `current` + %s WHERE `name`=%s", (size, key))
+		return cint(current[0][0]) + 1
+
+	vmraid.db.sql("INSERT INTO `tabSeries` (`name`, `current`) VALUES (%s, %s)", (key, size))
+	return 1
+
+
+def release_series_reservations():
+	for key, (current, last) in (vmraid.local.series_reservations or {}).items():
+		if current < last:
+			vmraid.db.sql(
+				"UPDATE `tabSeries` SET `current` = %s WHERE `name`=%s AND `current` = %s",
+				(current, key, last),
+			)
+
+
+def get_series_reservations():
+	"""Returns a copy of the current reservations, see `restore_series_reservations`."""
+	return dict(getattr(vmraid.local, "series_reservations", None) or {})
+
+
+def restore_series_reservations(reservations):
+	"""Restore reservations returned by `get_series_reservations` before a savepoint, after
+	rolling back to it. Numbers used in the rolled back savepoint are used again."""
+	if getattr(vmraid.local, "series_reservations", None) is not None:
+		vmraid.local.series_reservations.clear()
+		vmraid.local.series_reservations.update(reservations)
+
+
 def revert_series_if_last(key, name, doc=None):
 	"""
 	Reverts the series for particular naming series:
@@ -4,17 +4,36 @@
 
 import json
 import os
+import re
 import traceback
 import uuid
+from collections import deque
 from datetime import datetime
 
+import redis
 import rq
 
 import vmraid
+from vmraid.utils.process_buffer import ProcessBuffer, get_process_buffer
 
 MONITOR_REDIS_KEY = "monitor-transactions"
 MONITOR_MAX_ENTRIES = 1000000
 
+# transactions are buffered in memory by each process and pushed to Redis in batches,
+# once this many are buffered or every few seconds; the oldest are dropped when full
+MONITOR_BUFFER_SIZE = 10000
+MONITOR_BUFFER_FLUSH_SIZE = 100
+MONITOR_BUFFER_FLUSH_INTERVAL = 5
+
+# transactions written to the log file at a time
+MONITOR_FLUSH_CHUNK_SIZE = 1000
+
+# literals are replaced in query fingerprints, so that queries differing only in values match
+QUOTED_STRING_PATTERN = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+NUMBER_PATTERN = re.compile(r"(?<![\w`])-?\d+(?:\.\d+)?\b")
+VALUE_LIST_PATTERN = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))+\s*\)")
+MAX_FINGERPRINT_LENGTH = 1000
+
 
 def start(transaction_type="request", method=None, kwargs=None):
 	if vmraid.conf.monitor:
@@ -25,13 +44,35 @@ def stop(response=None):
 	if hasattr(vmraid.local, "monitor"):
 		vmraid.local.monitor.dump(response)
 
+		# job processes may exit before the buffer is flushed in the background
+		if vmraid.local.monitor.transaction_type == "job":
+			get_buffer().flush()
+
 
 def log_file():
 	return os.path.join(vmraid.utils.get_chair_path(), "logs", "monitor.json.log")
 
 
+def get_query_fingerprint(query):
+	"""Returns query with literal values replaced by `?` and value lists collapsed to `(?+)`."""
+	query = QUOTED_STRING_PATTERN.sub("?", str(query))
+	query = NUMBER_PATTERN.sub("?", query)
+	query = VALUE_LIST_PATTERN.sub("(?+)", query)
+	return query[:MAX_FINGERPRINT_LENGTH]
+
+
 class Monitor:
 	def __init__(self, transaction_type, method, kwargs):
+		self.transaction_type = transaction_type
+
+		# counted by `Database.sql` and `RedisWrapper` while the transaction runs
+		self.query_count = 0
+		self.db_time = 0
+		self.slowest_query = None
+		self.slowest_query_time = 0
+		self.redis_calls = 0
+		self.redis_time = 0
+
 		try:
 			self.data = vmraid._dict(
 				{
@@ -70,11 +111,42 @@ class Monitor:
 			waitdiff = self.data.timestamp - job.enqueued_at
 			self.data.job.wait = int(waitdiff.total_seconds() * 1000000)
 
+	def add_query(self, query, duration):
+		self.query_count += 1
+		self.db_time += duration
+		if duration >= self.slowest_query_time:
+			self.slowest_query = query
+			self.slowest_query_time = duration
+
+	def add_redis_call(self, duration):
+		self.redis_calls += 1
+		self.redis_time += duration
+
+	def collect_profile(self):
+		# durations in microseconds, like the transaction duration
+		self.data.db = vmraid._dict(
+			{
+				"queries": self.query_count,
+				"time": int(self.db_time * 1000000),
+			}
+		)
+		if self.slowest_query:
+			self.data.db.slowest_query = get_query_fingerprint(self.slowest_query)
+			self.data.db.slowest_query_time = int(self.slowest_query_time * 1000000)
+
+		self.data.redis = vmraid._dict(
+			{
+				"calls": self.redis_calls,
+				"time": int(self.redis_time * 1000000),
+			}
+		)
+
 	def dump(self, response=None):
 		try:
 			timediff = datetime.utcnow() - self.data.timestamp
 			# Obtain duration in microseconds
 			self.data.duration = int(timediff.total_seconds() * 1000000)
+			self.collect_profile()
 
 			if self.data.transaction_type == "request":
 				self.data.request.status_code = response.status_code
@@ -91,22 +163,79 @@ class Monitor:
 			traceback.print_exc()
 
 	def store(self):
-		if vmraid.cache().llen(MONITOR_REDIS_KEY) > MONITOR_MAX_ENTRIES:
-			vmraid.cache().ltrim(MONITOR_REDIS_KEY, 1, -1)
 		serialized = json.dumps(self.data, sort_keys=True, default=str)
-		vmraid.cache().rpush(MONITOR_REDIS_KEY, serialized)
+		cache = vmraid.cache()
+		get_buffer().append(cache.make_key(MONITOR_REDIS_KEY), serialized, cache.connection_pool)
+
+
+def get_buffer():
+	return get_process_buffer(MonitorBuffer)
+
+
+class MonitorBuffer(ProcessBuffer):
+	"""Ring buffer of serialized transactions, pushed to Redis in one pipeline by a
+	background thread, so that requests never wait for Redis."""
+
+	flush_interval = MONITOR_BUFFER_FLUSH_INTERVAL
+	thread_name = "vmraid-monitor"
+
+	def __init__(self):
+		super().__init__()
+		self.entries = deque(maxlen=MONITOR_BUFFER_SIZE)
+
+	def append(self, key, entry, connection_pool):
+		self.connection_pool = connection_pool
+		with self.lock:
+			self.entries.append((key, entry))
+
+		self.ensure_flusher()
+		if len(self.entries) >= MONITOR_BUFFER_FLUSH_SIZE:
+			self.wakeup.set()
+
+	def flush(self):
+		"""Push buffered entries to Redis, entries are kept for the next flush if Redis is not
+		reachable. The oldest entries are dropped once the buffer is full."""
+		with self.lock:
+			entries = [self.entries.popleft() for i in range(len(self.entries))]
+
+		if not entries or not self.connection_pool:
+			return
+
+		entries_by_key = {}
+		for key, entry in entries:
+			entries_by_key.setdefault(key, []).append(entry)
+
+		try:
+			pipe = redis.Redis(connection_pool=self.connection_pool).pipeline(transaction=False)
+			for key, values in entries_by_key.items():
+				pipe.rpush(key, *values)
+				pipe.ltrim(key, -MONITOR_MAX_ENTRIES, -1)
+			pipe.execute()
+		except redis.exceptions.RedisError:
+			with self.lock:
+				# a bounded deque drops entries from the left, i.e. the oldest ones
+				self.entries = deque(entries + list(self.entries), maxlen=MONITOR_BUFFER_SIZE)
 
 
 def flush():
+	"""Move transactions from Redis to the log file, one chunk at a time."""
 	try:
-		# Fetch all the logs without removing from cache
-		logs = vmraid.cache().lrange(MONITOR_REDIS_KEY, 0, -1)
-		if logs:
-			logs = list(map(vmraid.safe_decode, logs))
-			with open(log_file(), "a", os.O_NONBLOCK) as f:
-				f.write("\n".join(logs))
+		get_buffer().flush()
+
+		cache = vmraid.cache()
+		with open(log_file(), "a", os.O_NONBLOCK) as f:
+			while True:
+				logs = cache.lrange(MONITOR_REDIS_KEY, 0, MONITOR_FLUSH_CHUNK_SIZE - 1)
+				if not logs:
+					break
+
+				f.write("\n".join(map(vmraid.safe_decode, logs)))
 				f.write("\n")
-			# Remove fetched entries from cache
-			vmraid.cache().ltrim(MONITOR_REDIS_KEY, len(logs) - 1, -1)
+				f.flush()
+
+				# Remove written entries from cache
+				cache.ltrim(MONITOR_REDIS_KEY, len(logs), -1)
+				if len(logs) < MONITOR_FLUSH_CHUNK_SIZE:
+					break
 	except Exception:
 		traceback.print_exc()
@@ -0,0 +1,265 @@
+# Copyright (c) 2022, VMRaid and Contributors
+# License: MIT. See LICENSE
+"""
+Sampling profiler for requests and background jobs.
+
+While a profiled transaction runs, a background thread looks at the stack of the
+thread running it every `profiler_interval` milliseconds (default 10) and counts
+how often each stack was seen. Since stacks are sampled by wall clock, time spent
+waiting on the database or Redis shows up as well as time spent in Python.
+
+Counts are aggregated in Redis per request route (labelled like in metrics) or job
+method as collapsed stacks, one `outer;inner;leaf count` line per stack, which is the
+input format of flamegraph.pl and speedscope.
+
+Enable in site config:
+
+- `profile_requests`: 1 to profile all requests, or a list of path prefixes
+- `profile_jobs`: 1 to profile all jobs, or a list of job methods and Scheduled Job Types
+"""
+
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from functools import lru_cache
+
+import vmraid
+import vmraid.metrics
+from vmraid.utils import cint
+from vmraid.utils.redis_wrapper import SCAN_COUNT
+
+PROFILER_INDEX_KEY = "profiler-profiles"
+PROFILER_STACKS_KEY = "profiler-stacks"
+PROFILER_META_KEY = "profiler-meta"
+PROFILER_EXPIRY = 7 * 24 * 60 * 60
+
+DEFAULT_INTERVAL = 10
+# only the innermost frames of deeper stacks are kept, below this root label
+MAX_STACK_DEPTH = 200
+TRUNCATED_LABEL = "(truncated)"
+
+
+def start(transaction_type="request", method=None, kwargs=None):
+	name = get_profile_name(transaction_type, method, kwargs)
+	if name and should_profile(transaction_type, name):
+		vmraid.local.profiler = Profiler(transaction_type, name)
+
+
+def stop():
+	if hasattr(vmraid.local, "profiler"):
+		vmraid.local.profiler.dump()
+		del vmraid.local.profiler
+
+
+def set_method(method):
+	"""Name the request profile after `method`, called once a whitelisted method is resolved."""
+	if hasattr(vmraid.local, "profiler"):
+		vmraid.local.profiler.method = method
+
+
+def get_profile_name(transaction_type, method=None, kwargs=None):
+	if transaction_type == "request":
+		request = getattr(vmraid.local, "request", None)
+		return request and request.path
+
+	# all scheduled jobs run through `run_scheduled_job`
+	if method and "run_scheduled_job" in method and kwargs:
+		return kwargs.get("job_type")
+
+	return method
+
+
+def should_profile(transaction_type, name):
+	if transaction_type == "request":
+		setting = vmraid.conf.profile_requests
+	else:
+		setting = vmraid.conf.profile_jobs
+
+	if not setting:
+		return False
+
+	if not isinstance(setting, (list, tuple)):
+		return True
+
+	if transaction_type == "request":
+		return any(name.startswith(prefix) for prefix in setting)
+
+	return name in setting
+
+
+class Profiler:
+	def __init__(self, transaction_type, name):
+		self.transaction_type = transaction_type
+		self.name = name
+		self.method = None
+		self.start_time = time.monotonic()
+		self.sampler = Sampler(
+			threading.get_ident(), (cint(vmraid.conf.profiler_interval) or DEFAULT_INTERVAL) / 1000
+		)
+		self.sampler.start()
+
+	def dump(self):
+		self.sampler.stop()
+		duration = time.monotonic() - self.start_time
+
+		try:
+			# paths come from clients, requests are stored under their route like in metrics
+			name = self.name
+			if self.transaction_type == "request":
+				name = vmraid.metrics.get_route(self.method)
+
+			store_stacks(self.transaction_type, name, self.sampler.stacks, duration)
+		except Exception:
+			traceback.print_exc()
+
+
+class Sampler(threading.Thread):
+	"""Counts collapsed stacks of the thread `thread_id`, once every `interval` seconds.
+
+	Signal based sampling would only work in the main thread, which is not where
+	gunicorn's threaded workers run requests."""
+
+	def __init__(self, thread_id, interval):
+		super().__init__(name="vmraid-profiler", daemon=True)
+		self.thread_id = thread_id
+		self.interval = interval
+		self.stacks = Counter()
+		self.stopped = threading.Event()
+
+	def run(self):
+		while not self.stopped.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			if frame is None:
+				# profiled thread is gone
+				return
+
+			self.stacks[collapse_stack(frame)] += 1
+			del frame
+
+	def stop(self):
+		self.stopped.set()
+		self.join()
+
+
+def collapse_stack(frame):
+	"""Returns `outer;...;inner` labels of the frame and its callers. Only the innermost
+	`MAX_STACK_DEPTH` frames of deeper stacks are kept, below a `TRUNCATED_LABEL` root."""
+	labels = []
+	while frame is not None and len(labels) < MAX_STACK_DEPTH:
+		labels.append(get_frame_label(frame.f_code))
+		frame = frame.f_back
+
+	if frame is not None:
+		labels.append(TRUNCATED_LABEL)
+
+	labels.reverse()
+	return ";".join(labels)
+
+
+@lru_cache(maxsize=4096)
+def get_frame_label(code):
+	return f"{code.co_name} ({get_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def get_short_path(filename):
+	for marker in ("/apps/", "/site-packages/", "/lib/python"):
+		if marker in filename:
+			return filename.rsplit(marker, 1)[1]
+
+	return os.path.basename(filename)
+
+
+def store_stacks(transaction_type, name, stacks, duration):
+	cache = vmraid.cache()
+	stacks_key = cache.make_key(f"{PROFILER_STACKS_KEY}|{name}")
+	meta_key = cache.make_key(f"{PROFILER_META_KEY}|{name}")
+
+	pipe = cache.pipeline(transaction=False)
+	pipe.sadd(cache.make_key(PROFILER_INDEX_KEY), name)
+	pipe.hset(meta_key, "transaction_type", transaction_type)
+	pipe.hset(meta_key, "last_profiled", vmraid.utils.now())
+	pipe.hincrby(meta_key, "transactions", 1)
+	pipe.hincrby(meta_key, "samples", sum(stacks.values()))
+	# milliseconds
+	pipe.hincrby(meta_key, "duration", int(duration * 1000))
+	for stack, count in stacks.items():
+		pipe.hincrby(stacks_key, stack, count)
+
+	for key in (meta_key, stacks_key, cache.make_key(PROFILER_INDEX_KEY)):
+		pipe.expire(key, PROFILER_EXPIRY)
+
+	pipe.execute()
+
+
+def get_profiles():
+	"""Returns profiled routes and job methods, most sampled first."""
+	cache = vmraid.cache()
+	names = sorted(vmraid.safe_decode(name) for name in cache.smembers(PROFILER_INDEX_KEY))
+
+	pipe = cache.pipeline(transaction=False)
+	for name in names:
+		pipe.hgetall(cache.make_key(f"{PROFILER_META_KEY}|{name}"))
+
+	profiles = []
+	for name, meta in zip(names, pipe.execute()):
+		if not meta:
+			# expired
+			continue
+
+		meta = {vmraid.safe_decode(key): vmraid.safe_decode(value) for key, value in meta.items()}
+		profiles.append(
+			{
+				"name": name,
+				"transaction_type": meta.get("transaction_type"),
+				"last_profiled": meta.get("last_profiled"),
+				"transactions": cint(meta.get("transactions")),
+				"samples": cint(meta.get("samples")),
+				"duration": cint(meta.get("duration")),
+			}
+		)
+
+	return sorted(profiles, key=lambda profile: profile["samples"], reverse=True)
+
+
+def get_stacks(name):
+	"""Returns {collapsed stack: samples} of a profile."""
+	cache = vmraid.cache()
+	stacks = cache.hscan_iter(cache.make_key(f"{PROFILER_STACKS_KEY}|{name}"), count=SCAN_COUNT)
+	return {vmraid.safe_decode(stack): cint(count) for stack, count in stacks}
+
+
+def get_functions(stacks):
+	"""Returns samples spent in (self) and under (total) each function, most expensive first."""
+	own, total = Counter(), Counter()
+	for stack, count in stacks.items():
+		labels = stack.split(";")
+		own[labels[-1]] += count
+		# recursive functions are counted once per stack
+		for label in set(labels):
+			total[label] += count
+
+	functions = [
+		{"function": label, "self": own[label], "total": count} for label, count in total.items()
+	]
+	return sorted(functions, key=lambda row: (row["self"], row["total"]), reverse=True)
+
+
+def to_collapsed(stacks):
+	return "\n".join(f"{stack} {count}" for stack, count in stacks.items())
+
+
+def delete_profiles(name=None):
+	cache = vmraid.cache()
+	names = [name] if name else [vmraid.safe_decode(n) for n in cache.smembers(PROFILER_INDEX_KEY)]
+	if not names:
+		return
+
+	keys = []
+	for profile in names:
+		keys.extend((f"{PROFILER_STACKS_KEY}|{profile}", f"{PROFILER_META_KEY}|{profile}"))
+
+	cache.delete_value(keys)
+	cache.srem(PROFILER_INDEX_KEY, *names)
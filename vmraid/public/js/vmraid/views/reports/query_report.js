@@ -588,6 +588,7 @@ vmraid.views.QueryReport = class QueryReport extends vmraid.views.BaseList {
 			let data = r.message;
 			this.hide_status();
 			clearInterval(this.interval);
+			this.partial_result = null;
 
 			this.execution_time = data.execution_time || 0.1;
 
@@ -607,6 +608,9 @@ vmraid.views.QueryReport = class QueryReport extends vmraid.views.BaseList {
 						}
 					});
 				}
+				if (data.partial) {
+					this.setup_partial_result(data);
+				}
 				this.add_prepared_report_buttons(data.doc);
 			}
 
@@ -639,6 +643,9 @@ vmraid.views.QueryReport = class QueryReport extends vmraid.views.BaseList {
 					}
 				}
 				this.render_datatable();
+				if (this.partial_result && data.add_total_row) {
+					this.load_partial_result_totals();
+				}
 				this.add_chart_buttons_to_toolbar(true);
 				this.add_card_button_to_toolbar();
 				this.$report.show();
@@ -678,19 +685,8 @@ vmraid.views.QueryReport = class QueryReport extends vmraid.views.BaseList {
 						+"dn="+encodeURIComponent(doc.name)));
 			});
 
-			const part1 = __('This report was generated {0}.', [vmraid.datetime.comment_when(doc.report_end_time)]);
-			const part2 = __('To get the updated report, click on {0}.', [__('Rebuild')]);
-			const part3 = __('See all past reports.');
-
-			this.show_status(`
-				<div class="indicator orange">
-					<span>
-						${part1}
-						${part2}
-						<a href="/app/List/Prepared%20Report?report_name=${this.report_name}"> ${part3}</a>
-					</span>
-				</div>
-			`);
+			this.prepared_report_doc = doc;
+			this.show_prepared_report_status();
 		};
 
 		// Three cases
@@ -823,6 +819,166 @@ vmraid.views.QueryReport = class QueryReport extends vmraid.views.BaseList {
 		}
 	}
 
+	show_prepared_report_status() {
+		const doc = this.prepared_report_doc;
+		const part1 = __('This report was generated {0}.', [vmraid.datetime.comment_when(doc.report_end_time)]);
+		const part2 = __('To get the updated report, click on {0}.', [__('Rebuild')]);
+		const part3 = __('See all past reports.');
+		// large results are loaded page by page
+		const partial = this.partial_result;
+		const part4 = partial && partial.loaded < partial.row_count
+			? `${__('Showing {0} of {1} rows.',
+				[format_number(partial.loaded, null, 0), format_number(partial.row_count, null, 0)])}
+				<a class="load-more-rows">${__('Load More')}</a>`
+			: '';
+
+		this.show_status(`
+			<div class="indicator orange">
+				<span>
+					${part1}
+					${part2}
+					<a href="/app/List/Prepared%20Report?report_name=${this.report_name}"> ${part3}</a>
+					${part4}
+				</span>
+			</div>
+		`);
+	}
+
+	setup_partial_result(data) {
+		// only the first rows of large prepared report results are loaded, sorting, filtering,
+		// totals and further pages are served from the result file by `get_result_rows`
+		this.partial_result = {
+			dn: data.doc.name,
+			page_length: data.result.length,
+			loaded: data.result.length,
+			// the last row of the result file is the total row
+			row_count: data.add_total_row ? data.row_count - 1 : data.row_count,
+			skip_total_row: data.add_total_row ? 1 : 0,
+			list_rows: Array.isArray(data.result[0]),
+			order_by: null,
+			descending: 0,
+			filters: [],
+			totals: null,
+		};
+	}
+
+	fetch_partial_result(start, page_length) {
+		const partial = this.partial_result;
+		return vmraid.xcall("vmraid.core.doctype.prepared_report.prepared_report.get_result_rows", {
+			dn: partial.dn,
+			start: start,
+			page_length: page_length,
+			order_by: partial.order_by,
+			descending: partial.descending,
+			filters: partial.filters,
+			skip_total_row: partial.skip_total_row,
+			total_columns: this.raw_data.add_total_row ? this.get_total_column_keys() : null,
+		});
+	}
+
+	load_partial_result(append) {
+		const partial = this.partial_result;
+		return this.fetch_partial_result(append ? partial.loaded : 0, partial.page_length).then(r => {
+			const rows = this.prepare_data(r.result);
+			this.data = append ? this.data.concat(rows) : rows;
+			partial.loaded = this.data.length;
+			partial.row_count = r.row_count;
+			partial.totals = r.totals || null;
+			this.refresh_partial_result();
+		});
+	}
+
+	load_partial_result_totals() {
+		return this.fetch_partial_result(0, 0).then(r => {
+			this.partial_result.totals = r.totals || null;
+			this.refresh_partial_result();
+		});
+	}
+
+	refresh_partial_result() {
+		const filter_values = {};
+		this.$report.find(".dt-filter").each((i, input) => {
+			filter_values[input.dataset.colIndex] = input.value;
+		});
+
+		this.datatable.refresh(this.data, this.columns.filter(col => !col.hidden));
+
+		// restore the inline filters if the header is rendered again
+		if (Object.values(filter_values).some(Boolean)) {
+			this.datatable.columnmanager.toggleFilter(true);
+			this.$report.find(".dt-filter").each((i, input) => {
+				input.value = filter_values[input.dataset.colIndex] || "";
+			});
+		}
+		this.show_prepared_report_status();
+	}
+
+	sort_partial_result(column) {
+		if (!this.partial_result) return;
+
+		const sort_order = column.sortOrder;
+		this.partial_result.order_by = sort_order === "none" ? null : this.get_result_key(column);
+		this.partial_result.descending = sort_order === "desc" ? 1 : 0;
+		this.load_partial_result();
+	}
+
+	filter_partial_result() {
+		if (!this.partial_result) return;
+
+		const filters = [];
+		this.$report.find(".dt-filter").each((i, input) => {
+			const keyword = input.value.trim();
+			const column = keyword ? this.datatable.getColumn(input.dataset.colIndex) : null;
+			const key = column ? this.get_result_key(column) : null;
+			if (key !== null) {
+				filters.push([key, ...this.parse_filter_keyword(keyword)]);
+			}
+		});
+
+		if (JSON.stringify(filters) !== JSON.stringify(this.partial_result.filters)) {
+			this.partial_result.filters = filters;
+			this.load_partial_result();
+		}
+	}
+
+	parse_filter_keyword(keyword) {
+		// same syntax as the inline filters of the datatable, e.g. ">100" or "!=Open"
+		for (const operator of [">=", "<=", "!=", ">", "<", "="]) {
+			if (keyword.startsWith(operator)) {
+				const value = keyword.slice(operator.length).trim();
+				return [operator, value === "" || isNaN(value) ? value : flt(value)];
+			}
+		}
+		return ["like", keyword];
+	}
+
+	get_result_key(column) {
+		// rows are stored as returned by the report, keyed by fieldname or column index
+		const index = this.columns.findIndex(col => col.id === column.id);
+		if (index === -1) return null;
+		return this.partial_result.list_rows ? index : column.id;
+	}
+
+	get_total_column_keys() {
+		return this.columns
+			.filter(col => !col.disable_total && vmraid.model.is_numeric_field(col.fieldtype))
+			.map(col => this.get_result_key(col));
+	}
+
+	get_column_total(values, column, type) {
+		// totals of partially loaded results are computed over all rows by `get_result_rows`
+		const totals = this.partial_result && this.partial_result.totals;
+		const key = totals ? this.get_result_key(column.column) : null;
+		if (key === null || !(key in totals)) {
+			return vmraid.utils.report_column_total(values, column, type);
+		}
+
+		if (column.column.fieldtype == "Percent" || type === "mean") {
+			return totals[key] / (this.partial_result.row_count || 1);
+		}
+		return totals[key];
+	}
+
 	prepare_report_data(data) {
 		this.raw_data = data;
 		this.columns = this.prepare_columns(data.columns);
@@ -836,7 +992,8 @@ vmraid.views.QueryReport = class QueryReport extends vmraid.views.BaseList {
 		let data = this.data;
 		let columns = this.columns.filter((col) => !col.hidden);
 
-		if (this.raw_data.add_total_row && !this.report_settings.tree) {
+		// the total row is not loaded with partial results
+		if (this.raw_data.add_total_row && !this.report_settings.tree && !this.partial_result) {
 			data = data.slice();
 			data.splice(-1, 1);
 		}
@@ -858,8 +1015,11 @@ vmraid.views.QueryReport = class QueryReport extends vmraid.views.BaseList {
 				cellHeight: 33,
 				showTotalRow: this.raw_data.add_total_row && !this.report_settings.tree,
 				direction: vmraid.utils.is_rtl() ? 'rtl' : 'ltr',
+				events: {
+					onSortColumn: column => this.sort_partial_result(column)
+				},
 				hooks: {
-					columnTotal: vmraid.utils.report_column_total
+					columnTotal: (values, column, type) => this.get_column_total(values, column, type)
 				}
 			};
 
@@ -1372,6 +1532,15 @@ vmraid.views.QueryReport = class QueryReport extends vmraid.views.BaseList {
 					include_indentation,
 				};
 
+				if (this.partial_result) {
+					// export all rows of the result file with the sort and filters of the view
+					Object.assign(args, {
+						result_order_by: this.partial_result.order_by || "",
+						result_descending: this.partial_result.descending ? 1 : 0,
+						result_filters: this.partial_result.filters,
+					});
+				}
+
 				open_url_post(vmraid.request.url, args);
 			}
 		}, __('Export Report: {0}', [this.report_name]), __('Download'));
@@ -1699,6 +1868,7 @@ vmraid.views.QueryReport = class QueryReport extends vmraid.views.BaseList {
 		let page_form = this.page.main.find('.page-form');
 		this.$status = $(`<div class="form-message text-muted small"></div>`)
 			.hide().insertAfter(page_form);
+		this.$status.on("click", ".load-more-rows", () => this.load_partial_result(true));
 
 		this.$summary = $(`<div class="report-summary"></div>`)
 			.hide().appendTo(this.page.main);
@@ -1707,6 +1877,8 @@ vmraid.views.QueryReport = class QueryReport extends vmraid.views.BaseList {
 
 		this.$loading = $(this.message_div('')).hide().appendTo(this.page.main);
 		this.$report = $('<div class="report-wrapper">').appendTo(this.page.main);
+		this.$report.on("keyup", ".dt-filter",
+			vmraid.utils.debounce(() => this.filter_partial_result(), 500));
 		this.$message = $(this.message_div('')).hide().appendTo(this.page.main);
 	}
 
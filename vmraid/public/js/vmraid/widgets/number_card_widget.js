@@ -105,7 +105,7 @@ export default class NumberCardWidget extends Widget {
 		});
 	}
 
-	get_settings(type) {
+	get_settings(type, refresh) {
 		this.filters = this.get_filters();
 		const settings_map = {
 			'Custom': {
@@ -129,6 +129,7 @@ export default class NumberCardWidget extends Widget {
 				args: {
 					doc: this.card_doc,
 					filters: this.filters,
+					refresh: refresh ? 1 : 0,
 				},
 				get_number: res => this.get_number_for_doctype_card(res),
 			}
@@ -141,7 +142,7 @@ export default class NumberCardWidget extends Widget {
 		return filters;
 	}
 
-	render_card() {
+	render_card(refresh) {
 		this.prepare_actions();
 		this.set_title();
 		this.set_loading_state();
@@ -150,7 +151,7 @@ export default class NumberCardWidget extends Widget {
 			this.card_doc.type = 'Document Type';
 		}
 
-		this.settings = this.get_settings(this.card_doc.type);
+		this.settings = this.get_settings(this.card_doc.type, refresh);
 
 		vmraid.run_serially([
 			() => this.render_number(),
@@ -294,7 +295,7 @@ export default class NumberCardWidget extends Widget {
 				label: __('Refresh'),
 				action: 'action-refresh',
 				handler: () => {
-					this.render_card();
+					this.render_card(true);
 				}
 			},
 			{
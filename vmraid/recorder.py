@@ -4,18 +4,27 @@
 import datetime
 import inspect
 import json
+import random
 import re
+import sys
 import time
+import traceback
 from collections import Counter
 
 import sqlparse
 
 import vmraid
 from vmraid import _
+from vmraid.utils import cint, flt
 
 RECORDER_INTERCEPT_FLAG = "recorder-intercept"
 RECORDER_REQUEST_SPARSE_HASH = "recorder-requests-sparse"
 RECORDER_REQUEST_HASH = "recorder-requests"
+# uuids of recorded requests, oldest first
+RECORDER_REQUEST_INDEX = "recorder-requests-index"
+RECORDER_MAX_REQUESTS = 1000
+
+EXPLAINABLE_QUERY_TYPES = ("select", "update", "delete")
 
 
 def sql(*args, **kwargs):
@@ -23,17 +32,29 @@ def sql(*args, **kwargs):
 	result = vmraid.db._sql(*args, **kwargs)
 	end_time = time.time()
 
-	stack = list(get_current_stack_frames())
-
 	if vmraid.db.db_type == "postgres":
 		query = vmraid.db._cursor.query
 	else:
 		query = vmraid.db._cursor._executed
 
-	query = sqlparse.format(query.strip(), keyword_case="upper", reindent=True)
+	if vmraid.local._recorder.sampling:
+		# stack is formatted and query explained only if the request is kept, see `Recorder.dump`
+		vmraid.local._recorder.register(
+			{
+				"query": query,
+				"stack": get_stack_summary(),
+				"time": start_time,
+				"duration": float("{:.3f}".format((end_time - start_time) * 1000)),
+			}
+		)
+		return result
+
+	stack = list(get_current_stack_frames())
+
+	query = format_query(query)
 
 	# Collect EXPLAIN for executed query
-	if query.lower().strip().split()[0] in ("select", "update", "delete"):
+	if is_explainable(query):
 		# Only SELECT/UPDATE/DELETE queries can be "EXPLAIN"ed
 		explain_result = vmraid.db._sql("EXPLAIN {}".format(query), as_dict=True)
 	else:
@@ -66,10 +87,43 @@ def get_current_stack_frames():
 		pass
 
 
+def get_stack_summary():
+	"""Returns frames of the current stack (without `sql`) without reading their source lines."""
+	return traceback.StackSummary.extract(traceback.walk_stack(sys._getframe(2)), lookup_lines=False)
+
+
+def format_stack_summary(stack):
+	"""Returns frames like `get_current_stack_frames`, outermost first."""
+	return [
+		{
+			"filename": re.sub(".*/apps/", "", frame.filename),
+			"lineno": frame.lineno,
+			"function": frame.name,
+		}
+		for frame in reversed(stack)
+		if "/apps/" in frame.filename
+	]
+
+
+def format_query(query):
+	return sqlparse.format(vmraid.safe_decode(query).strip(), keyword_case="upper", reindent=True)
+
+
+def is_explainable(query):
+	return query.lower().strip().split()[0] in EXPLAINABLE_QUERY_TYPES
+
+
 def record():
 	if __debug__:
-		if vmraid.cache().get_value(RECORDER_INTERCEPT_FLAG):
-			vmraid.local._recorder = Recorder()
+		config = vmraid.cache().get_value(RECORDER_INTERCEPT_FLAG)
+		if config and is_sampled(config):
+			vmraid.local._recorder = Recorder(config)
+
+
+def is_sampled(config):
+	"""Record 1 in `sample_rate` requests, if set."""
+	sample_rate = cint(config.get("sample_rate")) if isinstance(config, dict) else 0
+	return sample_rate <= 1 or random.randrange(sample_rate) == 0
 
 
 def dump():
@@ -79,7 +133,13 @@ def dump():
 
 
 class Recorder:
-	def __init__(self):
+	def __init__(self, config=None):
+		"""
+		:param config: Recording options (see `start`), requests are recorded in sampling mode
+		        if set. In sampling mode, queries are explained in a background job and only
+		        requests slower than `slow_request_threshold` are kept."""
+		self.config = config if isinstance(config, dict) else {}
+		self.sampling = bool(self.config)
 		self.uuid = vmraid.generate_hash(length=10)
 		self.time = datetime.datetime.now()
 		self.calls = []
@@ -94,6 +154,16 @@ class Recorder:
 		self.calls.append(data)
 
 	def dump(self):
+		duration = (datetime.datetime.now() - self.time).total_seconds() * 1000
+		if self.sampling:
+			if duration < flt(self.config.get("slow_request_threshold")):
+				return
+
+			for call in self.calls:
+				call["query"] = format_query(call["query"])
+				call["stack"] = format_stack_summary(call["stack"])
+				call["explain_result"] = []
+
 		request_data = {
 			"uuid": self.uuid,
 			"path": self.path,
@@ -101,9 +171,7 @@ class Recorder:
 			"time": self.time,
 			"queries": len(self.calls),
 			"time_queries": float("{:0.3f}".format(sum(call["duration"] for call in self.calls))),
-			"duration": float(
-				"{:0.3f}".format((datetime.datetime.now() - self.time).total_seconds() * 1000)
-			),
+			"duration": float("{:0.3f}".format(duration)),
 			"method": self.method,
 		}
 		vmraid.cache().hset(RECORDER_REQUEST_SPARSE_HASH, self.uuid, request_data)
@@ -118,6 +186,11 @@ class Recorder:
 		request_data["form_dict"] = self.form_dict
 		vmraid.cache().hset(RECORDER_REQUEST_HASH, self.uuid, request_data)
 
+		trim_requests(cint(self.config.get("max_requests")) or RECORDER_MAX_REQUESTS, self.uuid)
+
+		if self.sampling:
+			vmraid.enqueue(explain_request, queue="short", uuid=self.uuid)
+
 	def mark_duplicates(self):
 		counts = Counter([call["query"] for call in self.calls])
 		for index, call in enumerate(self.calls):
@@ -125,9 +198,45 @@ class Recorder:
 			call["exact_copies"] = counts[call["query"]]
 
 
+def trim_requests(max_requests, uuid):
+	"""Add `uuid` to recorded requests, drop the oldest requests beyond `max_requests`."""
+	cache = vmraid.cache()
+	cache.rpush(RECORDER_REQUEST_INDEX, uuid)
+
+	for i in range(cache.llen(RECORDER_REQUEST_INDEX) - max_requests):
+		dropped = vmraid.safe_decode(cache.lpop(RECORDER_REQUEST_INDEX))
+		cache.hdel(RECORDER_REQUEST_SPARSE_HASH, dropped)
+		cache.hdel(RECORDER_REQUEST_HASH, dropped)
+
+
+def explain_request(uuid):
+	"""Add `EXPLAIN` results to the queries of a request recorded in sampling mode."""
+	request_data = vmraid.cache().hget(RECORDER_REQUEST_HASH, uuid)
+	if not request_data:
+		# dropped already
+		return
+
+	explain_results = {}
+	for call in request_data["calls"]:
+		query = call["query"]
+		if query not in explain_results:
+			explain_results[query] = []
+			if is_explainable(query):
+				try:
+					explain_results[query] = vmraid.db.sql("EXPLAIN {}".format(query), as_dict=True)
+				except Exception:
+					# e.g. temporary tables of the request
+					vmraid.db.rollback()
+
+		call["explain_result"] = explain_results[query]
+
+	vmraid.cache().hset(RECORDER_REQUEST_HASH, uuid, request_data)
+
+
 def _patch():
-	vmraid.db._sql = vmraid.db.sql
-	vmraid.db.sql = sql
+	if vmraid.db.sql is not sql:
+		vmraid.db._sql = vmraid.db.sql
+		vmraid.db.sql = sql
 
 
 def do_not_record(function):
@@ -159,8 +268,24 @@ def status(*args, **kwargs):
 @vmraid.whitelist()
 @do_not_record
 @administrator_only
-def start(*args, **kwargs):
-	vmraid.cache().set_value(RECORDER_INTERCEPT_FLAG, 1)
+def start(sample_rate=None, slow_request_threshold=None, max_requests=None, *args, **kwargs):
+	"""Start recording requests.
+
+	Requests are recorded in a low overhead sampling mode if any of these are set:
+
+	:param sample_rate: Record 1 in `sample_rate` requests.
+	:param slow_request_threshold: Keep only requests slower than this (in milliseconds).
+	:param max_requests: Keep only the latest `max_requests` requests."""
+	config = {
+		key: value
+		for key, value in {
+			"sample_rate": cint(sample_rate),
+			"slow_request_threshold": flt(slow_request_threshold),
+			"max_requests": cint(max_requests),
+		}.items()
+		if value
+	}
+	vmraid.cache().set_value(RECORDER_INTERCEPT_FLAG, config or 1)
 
 
 @vmraid.whitelist()
@@ -192,5 +317,6 @@ def export_data(*args, **kwargs):
 @do_not_record
 @administrator_only
 def delete(*args, **kwargs):
-	vmraid.cache().delete_value(RECORDER_REQUEST_SPARSE_HASH)
-	vmraid.cache().delete_value(RECORDER_REQUEST_HASH)
+	vmraid.cache().delete_value(
+		[RECORDER_REQUEST_SPARSE_HASH, RECORDER_REQUEST_HASH, RECORDER_REQUEST_INDEX]
+	)
@@ -10,7 +10,7 @@ from unittest.mock import patch
 import vmraid
 from vmraid.custom.doctype.custom_field.custom_field import create_custom_field
 from vmraid.database import savepoint
-from vmraid.database.database import Database
+from vmraid.database.database import Database, normalize_query
 from vmraid.query_builder import Field
 from vmraid.query_builder.functions import Concat_ws
 from vmraid.tests.test_query_builder import db_type_is, run_only_if
@@ -390,6 +390,25 @@ class TestDB(unittest.TestCase):
 		for d in created_docs:
 			self.assertTrue(vmraid.db.exists("ToDo", d))
 
+	def test_commit_queues(self):
+		from vmraid.database.database import get_commit_queues, restore_commit_queues
+
+		vmraid.db.rollback()
+		vmraid.local.realtime_log = []
+		vmraid.flags.enqueue_after_commit = []
+		vmraid.publish_realtime("kept_event", after_commit=True)
+		queues = get_commit_queues()
+
+		vmraid.db.savepoint("queued")
+		vmraid.publish_realtime("rolled_back_event", after_commit=True)
+		vmraid.enqueue("vmraid.ping", enqueue_after_commit=True)
+		vmraid.db.rollback(save_point="queued")
+		restore_commit_queues(queues)
+
+		self.assertEqual([args[0] for args in vmraid.local.realtime_log], ["kept_event"])
+		self.assertFalse(vmraid.flags.enqueue_after_commit)
+		vmraid.local.realtime_log = []
+
 	def test_transaction_writes_error(self):
 		from vmraid.database.database import Database
 
@@ -433,6 +452,52 @@ class TestDB(unittest.TestCase):
 			# recover transaction to continue other tests
 			raise Exception
 
+	def test_normalize_query(self):
+		self.assertEqual(
+			normalize_query("  select IFNULL(name, '') from tabUser\n"),
+			("select coalesce(name, '') from tabUser", "select"),
+		)
+		self.assertEqual(normalize_query("UPDATE `tabUser` set name='x'")[1], "update")
+		self.assertEqual(normalize_query("")[1], "")
+
+	def test_bulk_insert(self):
+		names = [vmraid.generate_hash(length=10) for _ in range(7)]
+		vmraid.db.bulk_insert(
+			"ToDo", fields=["name", "description"], values=[(n, "bulk insert") for n in names], chunk_size=3
+		)
+		self.assertEqual(
+			vmraid.db.count("ToDo", {"name": ("in", names), "description": "bulk insert"}), len(names)
+		)
+
+	def test_sql_iter(self):
+		query = "select name, module from tabDocType order by name"
+		expected = vmraid.db.sql(query, as_dict=True)
+
+		result = vmraid.db.sql_iter(query, as_dict=True, batch_size=10)
+		self.assertFalse(isinstance(result, list))
+		self.assertEqual(list(result), expected)
+
+		self.assertEqual(list(vmraid.db.sql_iter(query, pluck=True)), [d.name for d in expected])
+
+		batches = list(vmraid.db.sql_iter(query, batch_size=10, as_batches=True))
+		self.assertTrue(all(len(batch) <= 10 for batch in batches))
+		self.assertEqual(sum(len(batch) for batch in batches), len(expected))
+
+		# abandoning the iterator early leaves the connection usable
+		next(vmraid.db.sql_iter(query))
+		self.assertEqual(vmraid.db.sql("select 1")[0][0], 1)
+
+		self.assertEqual(
+			list(vmraid.get_all("DocType", order_by="name", pluck="name", as_iterator=True)),
+			vmraid.get_all("DocType", order_by="name", pluck="name"),
+		)
+
+	def test_sql_iter_reads_uncommitted_writes(self):
+		todo = vmraid.get_doc({"doctype": "ToDo", "description": "sql_iter"}).insert()
+		query = "select name from tabToDo where name = %s"
+		self.assertEqual(list(vmraid.db.sql_iter(query, todo.name, pluck=True)), [todo.name])
+		vmraid.db.rollback()
+
 	def test_exists(self):
 		dt, dn = "User", "Administrator"
 		self.assertEqual(vmraid.db.exists(dt, dn, cache=True), dn)
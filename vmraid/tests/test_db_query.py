@@ -35,6 +35,48 @@ class TestReportview(unittest.TestCase):
 
 		clear_custom_fields("DocType")
 
+	def test_compiled_fields_are_reused(self):
+		fields = ["name", "`tabDocField`.fieldname"]
+		first = vmraid.get_all("DocType", fields=fields, filters={"name": "User"})
+
+		meta = vmraid.get_meta("DocType")
+		self.assertIn((tuple(fields), True), meta._query_plans)
+		self.assertEqual(vmraid.get_all("DocType", fields=fields, filters={"name": "User"}), first)
+
+		# rejected fields are not cached, the same fields are rejected again
+		rejected = ["name", "version()"]
+		self.assertRaises(vmraid.DataError, vmraid.get_all, "DocType", fields=rejected)
+		self.assertNotIn((tuple(rejected), True), meta._query_plans)
+		self.assertRaises(vmraid.DataError, vmraid.get_all, "DocType", fields=rejected)
+
+	def test_cursor_pagination(self):
+		filters = {"module": "Core"}
+		expected = vmraid.get_all("DocType", filters=filters, order_by="modified desc, name desc")
+
+		names, cursor = [], ""
+		while cursor is not None:
+			page = vmraid.get_all(
+				"DocType", filters=filters, order_by="modified desc", limit=7, cursor=cursor
+			)
+			self.assertLessEqual(len(page), 7)
+			self.assertNotIn("_cursor_0", page[0])
+			names.extend(page)
+			cursor = page.next_cursor
+
+		self.assertEqual(names, expected)
+
+		# cursor is bound to the sort order
+		page = vmraid.get_all("DocType", order_by="modified desc", limit=2, cursor="")
+		self.assertRaises(
+			vmraid.ValidationError,
+			vmraid.get_all,
+			"DocType",
+			order_by="creation asc",
+			limit=2,
+			cursor=page.next_cursor,
+		)
+		self.assertRaises(vmraid.ValidationError, vmraid.get_all, "DocType", cursor="invalid", limit=2)
+
 	def test_build_match_conditions(self):
 		clear_user_permissions_for_doctype("Blog Post", "test2@example.com")
 
@@ -68,6 +110,23 @@ class TestReportview(unittest.TestCase):
 
 		vmraid.set_user("Administrator")
 
+	def test_compiled_permissions_cache(self):
+		clear_user_permissions_for_doctype("Blog Post", "test2@example.com")
+		vmraid.get_doc("User", "test2@example.com").add_roles("Blogger")
+		vmraid.set_user("test2@example.com")
+
+		self.assertEqual(DatabaseQuery("Blog Post").build_match_conditions(), "")
+		self.assertTrue(vmraid.cache().hget("permission_match_conditions", "test2@example.com"))
+
+		# user permission changes invalidate the cached conditions
+		add_user_permission("Blog Post", "-test-blog-post", "test2@example.com", True)
+		self.assertIn("-test-blog-post", DatabaseQuery("Blog Post").build_match_conditions())
+
+		clear_user_permissions_for_doctype("Blog Post", "test2@example.com")
+		self.assertEqual(DatabaseQuery("Blog Post").build_match_conditions(), "")
+
+		vmraid.set_user("Administrator")
+
 	def test_fields(self):
 		self.assertTrue(
 			{"name": "DocType", "issingle": 0}
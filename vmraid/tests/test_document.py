@@ -6,6 +6,7 @@ from datetime import timedelta
 from unittest.mock import patch
 
 import vmraid
+from vmraid.core.doctype.doctype.test_doctype import new_doctype
 from vmraid.desk.doctype.note.note import Note
 from vmraid.model.naming import make_autoname, parse_naming_series, revert_series_if_last
 from vmraid.utils import cint, now_datetime
@@ -31,6 +32,21 @@ class TestDocument(unittest.TestCase):
 		self.assertTrue(isinstance(d.permissions, list))
 		self.assertTrue(filter(lambda d: d.fieldname == "email", d.fields))
 
+	def test_get_docs(self):
+		names = ["User", "Role", "ToDo"]
+		docs = vmraid.get_docs("DocType", names)
+
+		self.assertEqual([d.name for d in docs], names)
+		for doc in docs:
+			self.assertEqual(doc.as_dict(), vmraid.get_doc("DocType", doc.name).as_dict())
+
+		self.assertRaises(vmraid.DoesNotExistError, vmraid.get_docs, "DocType", ["User", "_NotExists"])
+
+		# singles are loaded one by one and cached like batched documents
+		settings = vmraid.get_docs("Website Settings", ["Website Settings"])[0]
+		cache_key = vmraid.get_document_cache_key("Website Settings", "Website Settings")
+		self.assertIs(vmraid.local.document_cache[cache_key], settings)
+
 	def test_load_single(self):
 		d = vmraid.get_doc("Website Settings", "Website Settings")
 		self.assertEqual(d.name, "Website Settings")
@@ -67,6 +83,58 @@ class TestDocument(unittest.TestCase):
 		self.assertTrue(d.name.startswith("EV"))
 		self.assertEqual(vmraid.db.get_value("Event", d.name, "subject"), "test-doc-test-event 2")
 
+	def test_insert_many(self):
+		docs = vmraid.insert_many(
+			[{"doctype": "ToDo", "description": f"test-insert-many {i}"} for i in range(5)]
+		)
+
+		self.assertEqual(len(docs), 5)
+		for doc in docs:
+			self.assertFalse(doc.get("__islocal"))
+			self.assertEqual(vmraid.db.get_value("ToDo", doc.name, "description"), doc.description)
+			# defaults are set
+			self.assertEqual(vmraid.db.get_value("ToDo", doc.name, "status"), "Open")
+
+	def test_insert_many_hash_collision(self):
+		existing = vmraid.get_doc({"doctype": "ToDo", "description": "test-insert-many"}).insert()
+
+		# the first new document gets the name of an existing one
+		names = iter([existing.name])
+		generate_hash = vmraid.generate_hash
+
+		def colliding_hash(*args, **kwargs):
+			return next(names, None) or generate_hash(*args, **kwargs)
+
+		with patch("vmraid.generate_hash", side_effect=colliding_hash):
+			docs = vmraid.insert_many(
+				[{"doctype": "ToDo", "description": f"test-insert-many {i}"} for i in range(2)]
+			)
+
+		self.assertNotEqual(docs[0].name, existing.name)
+		for doc in docs:
+			self.assertEqual(vmraid.db.get_value("ToDo", doc.name, "description"), doc.description)
+		description = vmraid.db.get_value("ToDo", existing.name, "description")
+		self.assertEqual(description, "test-insert-many")
+
+	def test_insert_many_duplicates(self):
+		if not vmraid.db.exists("DocType", "Test Insert Many Unique"):
+			new_doctype("Test Insert Many Unique", unique=1).insert()
+
+		value = vmraid.generate_hash(length=10)
+		vmraid.insert_many([{"doctype": "Test Insert Many Unique", "some_fieldname": value}])
+		self.assertRaises(
+			vmraid.UniqueValidationError,
+			vmraid.insert_many,
+			[{"doctype": "Test Insert Many Unique", "some_fieldname": value}],
+		)
+
+		role = vmraid.get_doc(doctype="Role", role_name=f"_Test Role {value}", desk_access=0).insert()
+		duplicate = {"doctype": "Role", "role_name": role.name, "desk_access": 1}
+		self.assertRaises(vmraid.DuplicateEntryError, vmraid.insert_many, [duplicate])
+
+		vmraid.insert_many([duplicate], ignore_if_duplicate=True)
+		self.assertEqual(vmraid.db.get_value("Role", role.name, "desk_access"), 0)
+
 	def test_update(self):
 		d = self.test_insert()
 		d.subject = "subject changed"
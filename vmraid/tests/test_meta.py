@@ -0,0 +1,49 @@
+# Copyright (c) 2022, VMRaid and Contributors
+# License: MIT. See LICENSE
+import unittest
+
+import vmraid
+from vmraid.model.meta import META_VERSION_KEY, get_meta_from_process_cache, get_meta_version
+
+
+class TestMetaCache(unittest.TestCase):
+	def test_meta_reused_across_requests(self):
+		vmraid.get_meta("ToDo")
+		compiled = get_meta_from_process_cache("ToDo", get_meta_version("ToDo"))
+		self.assertTrue(compiled)
+
+		# simulate a new request
+		vmraid.local.meta_cache = {}
+		meta = vmraid.get_meta("ToDo")
+		self.assertIs(get_meta_from_process_cache("ToDo", get_meta_version("ToDo")), compiled)
+		self.assertIsNot(meta, compiled)
+		self.assertEqual(meta.as_dict(), compiled.as_dict())
+		self.assertIs(meta._query_plans, compiled._query_plans)
+
+	def test_meta_changes_not_shared_across_requests(self):
+		meta = vmraid.get_meta("ToDo")
+		meta.get_field("description").label = "Changed Label"
+		meta.fields.append(vmraid.get_doc({"doctype": "DocField", "fieldname": "test_meta_field"}))
+		field_count = len(meta.fields)
+
+		# simulate a new request
+		vmraid.local.meta_cache = {}
+		meta = vmraid.get_meta("ToDo")
+		self.assertNotEqual(meta.get_field("description").label, "Changed Label")
+		self.assertEqual(len(meta.fields), field_count - 1)
+
+	def test_clear_cache_bumps_meta_version(self):
+		meta = vmraid.get_meta("ToDo")
+		version = get_meta_version("ToDo")
+
+		vmraid.clear_cache(doctype="ToDo")
+		self.assertNotEqual(get_meta_version("ToDo"), version)
+
+		vmraid.local.meta_cache = {}
+		self.assertIsNot(vmraid.get_meta("ToDo"), meta)
+
+	def test_meta_version_after_redis_flush(self):
+		vmraid.cache().delete_value(META_VERSION_KEY)
+		global_version, doctype_version = get_meta_version("ToDo")
+		self.assertNotEqual(global_version, 0)
+		self.assertEqual(get_meta_version("ToDo"), (global_version, doctype_version))
@@ -0,0 +1,145 @@
+# Copyright (c) 2022, VMRaid and Contributors
+# License: MIT. See LICENSE
+
+import unittest
+from datetime import timedelta
+
+import vmraid
+import vmraid.metrics
+import vmraid.monitor
+from vmraid.handler import execute_cmd
+from vmraid.metrics import METRICS_GAUGES_REDIS_KEY, METRICS_REDIS_KEY
+from vmraid.utils import now_datetime, set_request
+from vmraid.utils.scheduler import set_scheduler_lag
+
+REQUEST_LABELS = '{route="/api/method/vmraid.ping",method="GET"}'
+
+
+class TestMetrics(unittest.TestCase):
+	def setUp(self):
+		vmraid.conf.metrics = 1
+		vmraid.cache().delete_value([METRICS_REDIS_KEY, METRICS_GAUGES_REDIS_KEY])
+
+	def tearDown(self):
+		vmraid.conf.metrics = None
+
+	def test_request_metrics(self):
+		set_request(method="GET", path="/api/method/vmraid.ping")
+
+		vmraid.metrics.start()
+		execute_cmd("vmraid.ping")
+		vmraid.db.sql("select 1")
+		vmraid.cache().set_value("test_metrics", 1)
+		vmraid.cache().get_value("test_metrics")
+		vmraid.metrics.stop()
+		vmraid.cache().delete_value("test_metrics")
+
+		samples = vmraid.metrics.get_samples()
+		self.assertEqual(samples[f"vmraid_http_request_duration_seconds_count{REQUEST_LABELS}"], 1)
+		self.assertEqual(
+			samples['vmraid_http_request_duration_seconds_bucket{route="/api/method/vmraid.ping",'
+			'method="GET",le="+Inf"}'],
+			1,
+		)
+		self.assertTrue(samples[f"vmraid_http_request_duration_seconds_sum{REQUEST_LABELS}"] > 0)
+		self.assertTrue(samples['vmraid_db_query_duration_seconds_count{type="select"}'] >= 1)
+		self.assertTrue(samples['vmraid_cache_lookups_total{tier="local"}'] >= 1)
+
+	def test_job_metrics(self):
+		vmraid.metrics.start("job", "vmraid.ping")
+		try:
+			raise ValueError
+		except ValueError:
+			pass
+		finally:
+			vmraid.metrics.stop()
+
+		try:
+			vmraid.metrics.start("job", "vmraid.ping")
+			raise ValueError
+		except ValueError:
+			vmraid.metrics.stop()
+
+		samples = vmraid.metrics.get_samples()
+		labels = '{queue="",method="vmraid.ping"}'
+		self.assertEqual(samples[f"vmraid_job_duration_seconds_count{labels}"], 2)
+		self.assertEqual(samples[f"vmraid_job_failures_total{labels}"], 1)
+
+	def test_route(self):
+		set_request(method="GET", path="/api/resource/ToDo/abc123")
+		self.assertEqual(vmraid.metrics.get_route(), "/api/resource/ToDo")
+
+		set_request(method="GET", path="/api/resource/Not A DocType/abc123")
+		self.assertEqual(vmraid.metrics.get_route(), "/api/resource")
+
+		set_request(method="GET", path="/api/method/not.a.method")
+		self.assertEqual(vmraid.metrics.get_route(), "/api/method")
+
+		set_request(method="GET", path="/app/todo/abc123")
+		self.assertEqual(vmraid.metrics.get_route(), "/app")
+
+		set_request(method="GET", path="/random-page-123")
+		self.assertEqual(vmraid.metrics.get_route(), "other")
+
+		set_request(method="GET", path="/api/method/vmraid.ping")
+		vmraid.metrics.start()
+		execute_cmd("vmraid.ping")
+		self.assertEqual(vmraid.metrics.get_route(), "/api/method/vmraid.ping")
+		vmraid.metrics.stop()
+
+		set_request(method="PURGE", path="/app")
+		self.assertEqual(vmraid.metrics.get_http_method(), "other")
+
+	def test_buffer(self):
+		buffer = vmraid.metrics.get_buffer()
+		self.assertIs(vmraid.metrics.get_buffer(), buffer)
+		self.assertIsNot(vmraid.monitor.get_buffer(), buffer)
+
+		cache = vmraid.cache()
+		series = {"vmraid_job_failures_total": 2}
+		buffer.add(cache.make_key(METRICS_REDIS_KEY), series, cache.connection_pool)
+		self.assertTrue(buffer.flusher.is_alive())
+
+		buffer.flush()
+		self.assertEqual(vmraid.metrics.get_samples()["vmraid_job_failures_total"], 2)
+
+	def test_gauges(self):
+		vmraid.metrics.set_gauge("vmraid_email_queue_backlog", 2.5, queue='a"b')
+
+		samples = vmraid.metrics.get_samples()
+		self.assertEqual(samples['vmraid_email_queue_backlog{queue="a\\"b"}'], 2.5)
+
+	def test_scheduler_lag(self):
+		job_type = vmraid.get_last_doc("Scheduled Job Type", filters={"frequency": "Hourly"})
+		last_execution = now_datetime() - timedelta(hours=3)
+		job_type.db_set("last_execution", last_execution, update_modified=False)
+		job_type.db_set("stopped", 0, update_modified=False)
+
+		# set by the scheduler on every tick
+		set_scheduler_lag(job_type, now_datetime())
+		vmraid.db.rollback()
+
+		samples = vmraid.metrics.get_samples()
+		lag = samples[f'vmraid_scheduler_lag_seconds{{job_type="{job_type.name}"}}']
+		self.assertTrue(float(lag) > 3600)
+
+	def test_render(self):
+		output = vmraid.metrics.render(
+			{
+				'vmraid_job_duration_seconds_bucket{queue="long",method="x",le="10"}': 2.0,
+				'vmraid_job_duration_seconds_bucket{queue="long",method="x",le="5"}': 1.0,
+				'vmraid_job_duration_seconds_sum{queue="long",method="x"}': 7.5,
+				"vmraid_email_queue_backlog": 3,
+				"vmraid_unknown": 1,
+			}
+		)
+		lines = output.splitlines()
+
+		self.assertIn("# TYPE vmraid_job_duration_seconds histogram", lines)
+		self.assertIn('vmraid_job_duration_seconds_sum{queue="long",method="x"} 7.5', lines)
+		self.assertIn("vmraid_email_queue_backlog 3", lines)
+		self.assertNotIn("vmraid_unknown 1", lines)
+		self.assertLess(
+			lines.index('vmraid_job_duration_seconds_bucket{queue="long",method="x",le="5"} 1'),
+			lines.index('vmraid_job_duration_seconds_bucket{queue="long",method="x",le="10"} 2'),
+		)
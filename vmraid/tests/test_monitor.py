@@ -2,7 +2,11 @@
 # Copyright (c) 2020, VMRaid and Contributors
 # License: MIT. See LICENSE
 
+import json
 import unittest
+from unittest.mock import patch
+
+import redis
 
 import vmraid
 import vmraid.monitor
@@ -23,7 +27,7 @@ class TestMonitor(unittest.TestCase):
 		vmraid.monitor.start()
 		vmraid.monitor.stop(response)
 
-		logs = vmraid.cache().lrange(MONITOR_REDIS_KEY, 0, -1)
+		logs = get_logs()
 		self.assertEqual(len(logs), 1)
 
 		log = vmraid.parse_json(logs[0].decode())
@@ -35,6 +39,71 @@ class TestMonitor(unittest.TestCase):
 		self.assertEqual(log.transaction_type, "request")
 		self.assertEqual(log.request["method"], "GET")
 
+	def test_query_and_redis_counters(self):
+		set_request(method="GET", path="/api/method/vmraid.ping")
+		response = build_response("json")
+
+		vmraid.monitor.start()
+		vmraid.db.sql("select name from tabDocType where name = 'User'")
+		vmraid.db.sql("select name from tabDocType where name in (%s, %s)", ("User", "Role"))
+		list(vmraid.db.sql_iter("select name from tabDocType where name = 'Role'"))
+		vmraid.cache().get("monitor-test-key")
+		vmraid.monitor.stop(response)
+
+		logs = get_logs()
+		log = vmraid.parse_json(logs[0].decode())
+		self.assertGreaterEqual(log.db["queries"], 3)
+		self.assertGreaterEqual(log.redis["calls"], 1)
+		self.assertIn("slowest_query", log.db)
+
+	def test_query_fingerprint(self):
+		self.assertEqual(
+			vmraid.monitor.get_query_fingerprint(
+				"select name from tabItem where item_group = 'Products' and qty > 10.5 and idx in (1, 2, 3)"
+			),
+			"select name from tabItem where item_group = ? and qty > ? and idx in (?+)",
+		)
+
+	def test_buffer_flush(self):
+		cache = vmraid.cache()
+		buffer = vmraid.monitor.MonitorBuffer()
+		buffer.connection_pool = cache.connection_pool
+		for i in range(3):
+			buffer.entries.append((cache.make_key(MONITOR_REDIS_KEY), json.dumps({"index": i})))
+
+		buffer.flush()
+
+		self.assertEqual(len(buffer.entries), 0)
+		logs = cache.lrange(MONITOR_REDIS_KEY, 0, -1)
+		self.assertEqual([json.loads(log)["index"] for log in logs], [0, 1, 2])
+
+	def test_buffer_flush_without_redis(self):
+		buffer = vmraid.monitor.MonitorBuffer()
+		buffer.connection_pool = redis.ConnectionPool(port=1, socket_connect_timeout=0.1)
+		buffer.entries.append((MONITOR_REDIS_KEY, json.dumps({"index": 0})))
+
+		buffer.flush()
+
+		self.assertEqual(len(buffer.entries), 1)
+
+	@patch("vmraid.monitor.MONITOR_BUFFER_SIZE", 3)
+	def test_buffer_drops_oldest_entries(self):
+		buffer = vmraid.monitor.MonitorBuffer()
+		buffer.connection_pool = vmraid.cache().connection_pool
+		for i in range(2):
+			buffer.append(MONITOR_REDIS_KEY, json.dumps({"index": i}), buffer.connection_pool)
+
+		def execute(pipe):
+			# entries appended while the failed flush is running
+			for i in range(2, 4):
+				buffer.append(MONITOR_REDIS_KEY, json.dumps({"index": i}), buffer.connection_pool)
+			raise redis.exceptions.ConnectionError
+
+		with patch.object(redis.client.Pipeline, "execute", execute):
+			buffer.flush()
+
+		self.assertEqual([json.loads(entry)["index"] for key, entry in buffer.entries], [1, 2, 3])
+
 	def test_job(self):
 		vmraid.utils.background_jobs.execute_job(
 			vmraid.local.site, "vmraid.ping", None, None, {}, is_async=False
@@ -68,3 +137,8 @@ class TestMonitor(unittest.TestCase):
 	def tearDown(self):
 		vmraid.conf.monitor = 0
 		vmraid.cache().delete_value(MONITOR_REDIS_KEY)
+
+
+def get_logs():
+	vmraid.monitor.get_buffer().flush()
+	return vmraid.cache().lrange(MONITOR_REDIS_KEY, 0, -1)
@@ -0,0 +1,48 @@
+# Copyright (c) 2022, VMRaid and Contributors
+# License: MIT. See LICENSE
+import pickle
+import unittest
+
+from vmraid.utils.process_cache import (
+	ProcessCache,
+	make_invalidation_message,
+	make_prefix_invalidation_message,
+)
+
+
+class TestProcessCache(unittest.TestCase):
+	def setUp(self):
+		self.cache = ProcessCache(maxsize=2)
+		self.cache.subscribed.set()
+
+	def test_lru_eviction(self):
+		self.cache.set(b"site|a", pickle.dumps(1))
+		self.cache.set(b"site|b", pickle.dumps(2))
+		self.cache.get(b"site|a")
+		self.cache.set(b"site|c", pickle.dumps(3))
+
+		self.assertIsNotNone(self.cache.get(b"site|a"))
+		self.assertIsNone(self.cache.get(b"site|b"))
+		self.assertIsNotNone(self.cache.get(b"site|c"))
+
+	def test_bypassed_when_not_subscribed(self):
+		self.cache.set(b"site|a", pickle.dumps(1))
+		self.cache.subscribed.clear()
+		self.assertIsNone(self.cache.get(b"site|a"))
+
+	def test_invalidation_messages(self):
+		self.cache.set(b"site|meta", pickle.dumps({}), field="ToDo")
+		self.cache.set(b"site|meta", pickle.dumps({}), field="Note")
+
+		self.cache.process_message(make_invalidation_message(b"site|meta", "ToDo"))
+		self.assertIsNone(self.cache.get(b"site|meta", "ToDo"))
+		self.assertIsNotNone(self.cache.get(b"site|meta", "Note"))
+
+		self.cache.process_message(make_prefix_invalidation_message(b"site|"))
+		self.assertIsNone(self.cache.get(b"site|meta", "Note"))
+
+	def test_stale_value_not_stored(self):
+		generation = self.cache.generation
+		self.cache.evict(b"site|a")
+		self.cache.set(b"site|a", pickle.dumps(1), generation=generation)
+		self.assertIsNone(self.cache.get(b"site|a"))
@@ -0,0 +1,101 @@
+# Copyright (c) 2022, VMRaid and Contributors
+# License: MIT. See LICENSE
+
+import sys
+import time
+import unittest
+
+import vmraid
+import vmraid.profiler
+from vmraid.utils import set_request
+
+JOB_METHOD = "vmraid.tests.test_profiler.busy_loop"
+
+
+def busy_loop(seconds):
+	end = time.monotonic() + seconds
+	while time.monotonic() < end:
+		pass
+
+
+class TestProfiler(unittest.TestCase):
+	def setUp(self):
+		vmraid.conf.profile_requests = ["/api/method/vmraid.ping"]
+		vmraid.conf.profile_jobs = [JOB_METHOD]
+		vmraid.profiler.delete_profiles()
+
+	def tearDown(self):
+		vmraid.conf.profile_requests = None
+		vmraid.conf.profile_jobs = None
+		vmraid.profiler.delete_profiles()
+
+	def test_should_profile(self):
+		self.assertTrue(vmraid.profiler.should_profile("request", "/api/method/vmraid.ping"))
+		self.assertFalse(vmraid.profiler.should_profile("request", "/app/todo"))
+		self.assertTrue(vmraid.profiler.should_profile("job", JOB_METHOD))
+		self.assertFalse(vmraid.profiler.should_profile("job", "vmraid.utils.ping"))
+
+		vmraid.conf.profile_jobs = 1
+		self.assertTrue(vmraid.profiler.should_profile("job", "vmraid.utils.ping"))
+
+		method = "vmraid.core.doctype.scheduled_job_type.scheduled_job_type.run_scheduled_job"
+		name = vmraid.profiler.get_profile_name("job", method, {"job_type": "todo.daily"})
+		self.assertEqual(name, "todo.daily")
+
+	def test_profile_request(self):
+		set_request(method="GET", path="/api/method/vmraid.ping")
+
+		vmraid.profiler.start()
+		vmraid.profiler.set_method("vmraid.ping")
+		busy_loop(0.2)
+		vmraid.profiler.stop()
+
+		profiles = vmraid.profiler.get_profiles()
+		self.assertEqual(len(profiles), 1)
+		self.assertEqual(profiles[0]["name"], "/api/method/vmraid.ping")
+		self.assertEqual(profiles[0]["transactions"], 1)
+		self.assertTrue(profiles[0]["samples"])
+
+		stacks = vmraid.profiler.get_stacks("/api/method/vmraid.ping")
+		self.assertEqual(sum(stacks.values()), profiles[0]["samples"])
+		self.assertTrue(any("busy_loop (" in stack for stack in stacks))
+
+		functions = vmraid.profiler.get_functions(stacks)
+		self.assertTrue(functions[0]["total"] >= functions[0]["self"])
+
+		vmraid.profiler.delete_profiles("/api/method/vmraid.ping")
+		self.assertFalse(vmraid.profiler.get_profiles())
+
+	def test_profile_name(self):
+		# paths of requests are normalized like metric routes
+		vmraid.conf.profile_requests = 1
+		set_request(method="GET", path="/app/todo/abc123")
+		vmraid.profiler.start()
+		vmraid.profiler.stop()
+
+		self.assertEqual([profile["name"] for profile in vmraid.profiler.get_profiles()], ["/app"])
+
+	def test_request_not_profiled(self):
+		set_request(method="GET", path="/app/todo")
+		vmraid.profiler.start()
+		self.assertFalse(hasattr(vmraid.local, "profiler"))
+
+	def test_collapse_stack(self):
+		def inner():
+			return vmraid.profiler.collapse_stack(sys._getframe())
+
+		labels = inner().split(";")
+		self.assertTrue(labels[-1].startswith("inner ("))
+		self.assertIn("test_profiler.py:", labels[-1])
+		self.assertTrue(labels[-2].startswith("test_collapse_stack ("))
+
+	def test_collapse_deep_stack(self):
+		def recurse(depth):
+			if depth:
+				return recurse(depth - 1)
+			return vmraid.profiler.collapse_stack(sys._getframe())
+
+		labels = recurse(vmraid.profiler.MAX_STACK_DEPTH).split(";")
+		self.assertEqual(len(labels), vmraid.profiler.MAX_STACK_DEPTH + 1)
+		self.assertEqual(labels[0], vmraid.profiler.TRUNCATED_LABEL)
+		self.assertTrue(all(label.startswith("recurse (") for label in labels[1:]))
@@ -5,7 +5,7 @@ import unittest
 
 import vmraid
 import vmraid.utils
-from vmraid.desk.query_report import build_xlsx_data
+from vmraid.desk.query_report import build_xlsx_data, make_xlsx_file
 
 
 class TestQueryReport(unittest.TestCase):
@@ -39,3 +39,21 @@ class TestQueryReport(unittest.TestCase):
 
 		for row in xlsx_data:
 			self.assertEqual(type(row), list)
+
+	def test_make_xlsx_file(self):
+		from openpyxl import load_workbook
+
+		data = vmraid._dict()
+		data.columns = [
+			vmraid._dict({"label": "Name", "fieldname": "name", "fieldtype": "Data"}),
+			vmraid._dict({"label": "Duration", "fieldname": "duration", "fieldtype": "Duration"}),
+		]
+		# rows can be any iterable, e.g. rows read from a prepared report result file
+		data.result = ({"name": f"row-{i}", "duration": 60} for i in range(100))
+
+		xlsx_file = make_xlsx_file(data, [], 0, ignore_visible_idx=True)
+		rows = list(load_workbook(xlsx_file).active.values)
+
+		self.assertEqual(len(rows), 101)
+		self.assertEqual(rows[0], ("Name", "Duration"))
+		self.assertEqual(rows[1], ("row-0", "1m"))
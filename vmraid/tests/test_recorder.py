@@ -123,6 +123,34 @@ class TestRecorder(unittest.TestCase):
 		for query, call in zip(queries, request["calls"]):
 			self.assertEqual(call["exact_copies"], query[1])
 
+	def test_sampling_mode(self):
+		vmraid.recorder.start(max_requests=2)
+		for i in range(3):
+			vmraid.recorder.record()
+			vmraid.db.sql("SELECT * FROM tabDocType")
+			vmraid.recorder.dump()
+
+		requests = vmraid.recorder.get()
+		self.assertEqual(len(requests), 2)
+
+		request = vmraid.recorder.get(requests[0]["uuid"])
+		call = request["calls"][0]
+		self.assertEqual(call["explain_result"], [])
+		self.assertTrue(all("function" in frame for frame in call["stack"]))
+
+		vmraid.recorder.explain_request(request["uuid"])
+		vmraid.local.cache = {}
+		request = vmraid.recorder.get(request["uuid"])
+		self.assertEqual(len(request["calls"][0]["explain_result"]), 1)
+
+	def test_slow_request_threshold(self):
+		vmraid.recorder.start(slow_request_threshold=60 * 1000)
+		vmraid.recorder.record()
+		vmraid.db.sql("SELECT * FROM tabDocType")
+		vmraid.recorder.dump()
+
+		self.assertEqual(len(vmraid.recorder.get()), 0)
+
 	def test_error_page_rendering(self):
 		content = get_response_content("error")
 		self.assertIn("Error", content)
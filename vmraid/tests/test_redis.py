@@ -1,4 +1,5 @@
 import functools
+import pickle
 import unittest
 
 import redis
@@ -71,3 +72,53 @@ class TestRedisAuth(unittest.TestCase):
 
 		vmraid.conf.update({"chair_id": chair_id})
 		conn.acl_deluser(username)
+
+
+class TestRedisWrapper(unittest.TestCase):
+	def setUp(self):
+		self.cache = vmraid.cache()
+		vmraid.local.cache = {}
+
+	def test_get_and_set_values(self):
+		self.cache.set_values({"test_key_1": 1, "test_key_2": {"a": 2}})
+		vmraid.local.cache = {}
+
+		self.assertEqual(
+			self.cache.get_values(["test_key_1", "test_key_2", "test_key_3"]),
+			{"test_key_1": 1, "test_key_2": {"a": 2}, "test_key_3": None},
+		)
+		self.cache.delete_value(["test_key_1", "test_key_2"])
+		vmraid.local.cache = {}
+		self.assertEqual(self.cache.get_values(["test_key_1"]), {"test_key_1": None})
+
+	def test_expiring_keys_not_process_cached(self):
+		self.cache.set_value("test_expiring_key", 1, expires_in_sec=60)
+		self.cache.set_value("test_key", 2)
+		keys = [self.cache.make_key("test_expiring_key"), self.cache.make_key("test_key")]
+
+		values, cacheable = self.cache.get_for_process_cache(keys)
+		self.assertEqual([pickle.loads(value) for value in values], [1, 2])
+		self.assertEqual(cacheable, [False, True])
+
+		self.cache.delete_value(["test_expiring_key", "test_key"])
+
+	def test_hget_many(self):
+		self.cache.hset("test_hash", "a", 1)
+		self.cache.hset("test_hash", "b", [2])
+		vmraid.local.cache = {}
+
+		self.assertEqual(
+			self.cache.hget_many("test_hash", ["a", "b", "c"]), {"a": 1, "b": [2], "c": None}
+		)
+
+		self.cache.hdel_many("test_hash", ["a", "b"])
+		vmraid.local.cache = {}
+		self.assertEqual(self.cache.hget_many("test_hash", ["a", "b"]), {"a": None, "b": None})
+
+	def test_delete_keys(self):
+		self.cache.set_values({f"test_wildcard_{i}": i for i in range(5)})
+		self.assertEqual(len(self.cache.get_keys("test_wildcard_")), 5)
+
+		self.cache.delete_keys("test_wildcard_")
+		self.assertEqual(self.cache.get_keys("test_wildcard_"), [])
+		self.assertEqual(self.cache.get_value("test_wildcard_1"), None)
@@ -0,0 +1,86 @@
+# Copyright (c) 2022, VMRaid and Contributors
+# License: MIT. See LICENSE
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+import vmraid
+from vmraid.database import replica
+from vmraid.utils import set_request
+
+
+class TestReplica(unittest.TestCase):
+	def setUp(self):
+		vmraid.conf.route_reads_to_replica = 1
+		vmraid.conf.replica_host = "replica"
+		vmraid.local.flags.replica_eligible = None
+		vmraid.db.rollback()
+		set_request(method="GET", path="/api/method/vmraid.client.get_list")
+		vmraid.cache().delete_value("replica_lag")
+		vmraid.cache().delete_keys("replica_sticky_primary")
+		vmraid.set_user("Administrator")
+
+	def tearDown(self):
+		vmraid.conf.route_reads_to_replica = None
+		vmraid.conf.replica_host = None
+		vmraid.local.flags.replica_eligible = None
+		vmraid.cache().delete_value("replica_lag")
+		vmraid.cache().delete_keys("replica_sticky_primary")
+		vmraid.local.request = None
+
+	def test_can_route_to_replica(self):
+		with patch_replication_lag(0):
+			self.assertTrue(replica.can_route_to_replica())
+
+	def test_route_only_reads(self):
+		with patch_replication_lag(0):
+			set_request(method="POST", path="/api/method/vmraid.client.get_list")
+			self.assertFalse(replica.can_route_to_replica())
+
+			set_request(method="GET", path="/api/method/vmraid.client.get_list")
+			vmraid.db.sql("update `tabToDo` set description = description where name = 'x'")
+			self.assertFalse(replica.can_route_to_replica())
+
+			vmraid.conf.route_reads_to_replica = None
+			vmraid.db.rollback()
+			self.assertFalse(replica.can_route_to_replica())
+
+	def test_sticky_primary(self):
+		replica.mark_primary_sticky()
+
+		with patch_replication_lag(0):
+			self.assertTrue(replica.is_primary_sticky())
+			self.assertFalse(replica.can_route_to_replica())
+
+			# other users still read from the replica
+			vmraid.local.flags.replica_eligible = None
+			vmraid.set_user("Guest")
+			self.assertFalse(replica.is_primary_sticky())
+			self.assertTrue(replica.can_route_to_replica())
+
+	def test_replication_lag(self):
+		vmraid.conf.replica_max_lag = 5
+		try:
+			with patch_replication_lag(10):
+				self.assertTrue(replica.is_replica_lagging())
+
+			vmraid.cache().delete_value("replica_lag")
+			with patch_replication_lag(2):
+				self.assertFalse(replica.is_replica_lagging())
+
+			# unknown lag and errors are treated as lagging
+			vmraid.cache().delete_value("replica_lag")
+			with patch_replication_lag(None):
+				self.assertTrue(replica.is_replica_lagging())
+
+			vmraid.cache().delete_value("replica_lag")
+			with patch_replication_lag(side_effect=vmraid.PermissionError):
+				self.assertTrue(replica.is_replica_lagging())
+		finally:
+			vmraid.conf.replica_max_lag = None
+
+
+def patch_replication_lag(lag=None, side_effect=None):
+	replica_db = MagicMock()
+	replica_db.get_replication_lag = MagicMock(return_value=lag, side_effect=side_effect)
+	return patch("vmraid.database.replica.connect_replica_db", return_value=replica_db)
@@ -13,7 +13,9 @@ from rq.logutils import setup_loghandlers
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_fixed
 
 import vmraid
+import vmraid.metrics
 import vmraid.monitor
+import vmraid.profiler
 from vmraid import _
 from vmraid.utils import cstr, get_chair_id
 from vmraid.utils.commands import log
@@ -140,6 +142,8 @@ def execute_job(site, method, event, job_name, kwargs, user=None, is_async=True,
 		method_name = cstr(method.__name__)
 
 	vmraid.monitor.start("job", method_name, kwargs)
+	vmraid.metrics.start("job", method_name, kwargs)
+	vmraid.profiler.start("job", method_name, kwargs)
 	try:
 		method(**kwargs)
 
@@ -154,6 +158,7 @@ def execute_job(site, method, event, job_name, kwargs, user=None, is_async=True,
 			# 1213 = deadlock
 			# 1205 = lock wait timeout
 			# or RetryBackgroundJobError is explicitly raised
+			vmraid.profiler.stop()
 			vmraid.destroy()
 			time.sleep(retry + 1)
 
@@ -174,6 +179,8 @@ def execute_job(site, method, event, job_name, kwargs, user=None, is_async=True,
 		vmraid.db.commit()
 
 	finally:
+		vmraid.profiler.stop()
+		vmraid.metrics.stop()
 		vmraid.monitor.stop()
 		if is_async:
 			vmraid.destroy()
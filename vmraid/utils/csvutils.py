@@ -1,6 +1,8 @@
 # Copyright (c) 2015, VMRaid and Contributors
 # License: MIT. See LICENSE
+import codecs
 import csv
+import io
 import json
 from io import StringIO
 
@@ -10,6 +12,8 @@ import vmraid
 from vmraid import _, msgprint
 from vmraid.utils import cint, comma_or, cstr, flt
 
+CSV_ENCODINGS = ("utf-8", "windows-1250", "windows-1252")
+
 
 def read_csv_content_from_attached_file(doc):
 	fileid = vmraid.get_all(
@@ -37,11 +41,9 @@ def read_csv_content_from_attached_file(doc):
 
 
 def read_csv_content(fcontent, ignore_encoding=False):
-	rows = []
-
 	if not isinstance(fcontent, str):
 		decoded = False
-		for encoding in ["utf-8", "windows-1250", "windows-1252"]:
+		for encoding in CSV_ENCODINGS:
 			try:
 				fcontent = str(fcontent, encoding)
 				decoded = True
@@ -60,28 +62,51 @@ def read_csv_content(fcontent, ignore_encoding=False):
 		content.append(vmraid.safe_decode(line))
 
 	try:
-		rows = []
-		for row in csv.reader(content):
-			r = []
-			for val in row:
-				# decode everything
-				val = val.strip()
+		return [clean_csv_row(row) for row in csv.reader(content)]
+
+	except Exception:
+		vmraid.msgprint(_("Not a valid Comma Separated Value (CSV File)"))
+		raise
 
-				if val == "":
-					# reason: in maraidb strict config, one cannot have blank strings for non string datatypes
-					r.append(None)
-				else:
-					r.append(val)
 
-			rows.append(r)
+def read_csv_file(fileobj):
+	"""Yields rows of a CSV file opened in binary mode, like `read_csv_content` but
+	without reading the whole file in memory."""
+	encoding = guess_csv_encoding(fileobj)
+	fileobj.seek(0)
 
-		return rows
+	try:
+		for row in csv.reader(io.TextIOWrapper(fileobj, encoding=encoding, newline="")):
+			yield clean_csv_row(row)
 
-	except Exception:
+	except csv.Error:
 		vmraid.msgprint(_("Not a valid Comma Separated Value (CSV File)"))
 		raise
 
 
+def guess_csv_encoding(fileobj, block_size=1024 * 1024):
+	"""Returns the first of `CSV_ENCODINGS` that decodes the whole file, decoding one block at a time."""
+	for encoding in CSV_ENCODINGS:
+		fileobj.seek(0)
+		decoder = codecs.getincrementaldecoder(encoding)()
+		try:
+			while block := fileobj.read(block_size):
+				decoder.decode(block)
+			decoder.decode(b"", final=True)
+			return encoding
+		except UnicodeDecodeError:
+			continue
+
+	vmraid.msgprint(
+		_("Unknown file encoding. Tried utf-8, windows-1250, windows-1252."), raise_exception=True
+	)
+
+
+def clean_csv_row(row):
+	# reason: in maraidb strict config, one cannot have blank strings for non string datatypes
+	return [val.strip() or None for val in row]
+
+
 @vmraid.whitelist()
 def send_csv_to_client(args):
 	if isinstance(args, str):
@@ -102,6 +127,17 @@ def to_csv(data):
 	return writer.getvalue()
 
 
+def write_csv(data, fileobj, quoting=csv.QUOTE_MINIMAL):
+	"""Write rows to a binary file object as UTF-8 CSV, one row at a time.
+
+	`data` can be any iterable of rows, e.g. a generator reading from the database."""
+	text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+	csv.writer(text, quoting=quoting).writerows(data)
+	text.flush()
+	# leave `fileobj` open
+	text.detach()
+
+
 def build_csv_response(data, filename):
 	vmraid.response["result"] = cstr(to_csv(data))
 	vmraid.response["doctype"] = filename
@@ -1,14 +1,25 @@
 # Copyright (c) 2019, VMRaid and Contributors
 # License: MIT. See LICENSE
+import hashlib
+import json
 import os
+import time
 from functools import wraps
 from os.path import join
 
+import redis
+
 import vmraid
 from vmraid import _
 from vmraid.modules.import_file import import_file_by_path
 from vmraid.utils import add_to_date, cint, get_link_to_form
 
+# results are served from cache for `dashboard_cache_ttl` seconds, after that stale results
+# are served for `dashboard_cache_stale_ttl` seconds while they are refreshed in background
+DEFAULT_CACHE_TTL = 10 * 60
+DEFAULT_CACHE_STALE_TTL = 24 * 60 * 60
+REFRESH_LOCK_SECONDS = 5 * 60
+
 
 def cache_source(function):
 	@wraps(function)
@@ -20,33 +31,34 @@ def cache_source(function):
 		no_cache = kwargs.get("no_cache")
 		if no_cache:
 			return function(chart=chart, no_cache=no_cache)
-		chart_name = vmraid.parse_json(chart).name
-		cache_key = "chart-data:{}".format(chart_name)
-		if int(kwargs.get("refresh") or 0):
-			results = generate_and_cache_results(kwargs, function, cache_key, chart)
-		else:
-			cached_results = vmraid.cache().get_value(cache_key)
-			if cached_results:
-				results = vmraid.parse_json(vmraid.safe_decode(cached_results))
-			else:
-				results = generate_and_cache_results(kwargs, function, cache_key, chart)
-		return results
+		chart = vmraid.parse_json(chart)
+		args = vmraid._dict(kwargs)
+		return get_cached_result(
+			chart.name,
+			"vmraid.utils.dashboard.generate_chart_results",
+			dict(
+				source=f"{function.__module__}.{function.__name__}",
+				chart_name=args.chart_name,
+				filters=args.filters or None,
+				from_date=args.from_date or None,
+				to_date=args.to_date or None,
+				time_interval=args.time_interval or None,
+				timespan=args.timespan or None,
+				heatmap_year=args.heatmap_year or None,
+			),
+			doctype=chart.document_type,
+			refresh=cint(args.refresh),
+		)
 
 	return wrapper
 
 
-def generate_and_cache_results(args, function, cache_key, chart):
+def generate_chart_results(source, chart_name=None, **args):
+	function = vmraid.get_attr(source)
+	function = getattr(function, "__wrapped__", function)
+
 	try:
-		args = vmraid._dict(args)
-		results = function(
-			chart_name=args.chart_name,
-			filters=args.filters or None,
-			from_date=args.from_date or None,
-			to_date=args.to_date or None,
-			time_interval=args.time_interval or None,
-			timespan=args.timespan or None,
-			heatmap_year=args.heatmap_year or None,
-		)
+		results = function(chart_name=chart_name, **args)
 	except TypeError as e:
 		if str(e) == "'NoneType' object is not iterable":
 			# Probably because of invalid link filter
@@ -56,7 +68,7 @@ def generate_and_cache_results(args, function, cache_key, chart):
 			# ref: https://github.com/vmraid/vmraid/pull/9403
 			vmraid.throw(
 				_("Please check the filter values set for Dashboard Chart: {}").format(
-					get_link_to_form(chart.doctype, chart.name)
+					get_link_to_form("Dashboard Chart", chart_name)
 				),
 				title=_("Invalid Filter Value"),
 			)
@@ -65,11 +77,129 @@ def generate_and_cache_results(args, function, cache_key, chart):
 			raise
 
 	vmraid.db.set_value(
-		"Dashboard Chart", args.chart_name, "last_synced_on", vmraid.utils.now(), update_modified=False
+		"Dashboard Chart", chart_name, "last_synced_on", vmraid.utils.now(), update_modified=False
 	)
 	return results
 
 
+def get_cached_result(name, method, args, doctype=None, refresh=False):
+	"""Returns result of `method(**args)` from the dashboard result cache.
+
+	Results are shared by all users with the same permissions on `doctype` (all users if
+	the result does not depend on permissions). Stale results are returned as is and
+	refreshed in background.
+
+	:param name: Name of the chart / card, used to clear its results on update.
+	:param method: Path of the method that generates the result.
+	:param args: Arguments of `method`, part of the cache key.
+	:param doctype: DocType queried by `method`.
+	:param refresh: Regenerate the result, ignoring the cached value."""
+	cache_key = get_cache_key(name, method, args, doctype)
+
+	if not refresh:
+		cached = vmraid.cache().get_value(cache_key, expires=True)
+		if cached:
+			if time.time() - cached["generated_on"] > get_cache_ttl():
+				enqueue_refresh(cache_key, method, args)
+			return cached["result"]
+
+	return generate_and_cache_result(cache_key, method, args)
+
+
+def generate_and_cache_result(cache_key, method, args):
+	result = vmraid.get_attr(method)(**args)
+	stale_ttl = cint(vmraid.conf.get("dashboard_cache_stale_ttl", DEFAULT_CACHE_STALE_TTL))
+	vmraid.cache().set_value(
+		cache_key,
+		{"result": result, "generated_on": time.time()},
+		expires_in_sec=get_cache_ttl() + stale_ttl,
+	)
+	return result
+
+
+def enqueue_refresh(cache_key, method, args):
+	cache = vmraid.cache()
+
+	# only one refresh job per result
+	try:
+		if not cache.set(cache.make_key(f"{cache_key}:refresh"), 1, nx=True, ex=REFRESH_LOCK_SECONDS):
+			return
+	except redis.exceptions.ConnectionError:
+		return
+
+	vmraid.enqueue(
+		"vmraid.utils.dashboard.refresh_cached_result",
+		queue="short",
+		cache_key=cache_key,
+		method=method,
+		args=args,
+		user=vmraid.session.user,
+	)
+
+
+def refresh_cached_result(cache_key, method, args, user):
+	vmraid.set_user(user)
+	try:
+		generate_and_cache_result(cache_key, method, args)
+	finally:
+		vmraid.cache().delete_value(f"{cache_key}:refresh")
+
+
+def get_cache_key(name, method, args, doctype=None):
+	args = dict(args)
+	if isinstance(args.get("filters"), (str, list, dict)):
+		args["filters"] = normalize_filters(args["filters"])
+
+	key = json.dumps(
+		[method, args, get_permission_signature(doctype)], sort_keys=True, default=str
+	)
+	return f"dashboard_result:{name}:{hashlib.sha1(key.encode()).hexdigest()}"
+
+
+def clear_cached_results(name):
+	vmraid.cache().delete_keys(f"dashboard_result:{name}:")
+
+
+def normalize_filters(filters):
+	"""Filters in a stable order, so that equivalent filters share cache entries."""
+	filters = vmraid.parse_json(filters)
+	if isinstance(filters, list):
+		filters = sorted(filters, key=lambda f: json.dumps(f, sort_keys=True, default=str))
+	return filters
+
+
+def get_permission_signature(doctype=None):
+	"""Returns the permission conditions of the user on `doctype`, users seeing the same records
+	have the same signature. Falls back to the user if the conditions can't be determined."""
+	if not doctype:
+		return vmraid.session.user
+
+	try:
+		return get_permission_conditions(doctype)
+	except vmraid.PermissionError:
+		return vmraid.session.user
+
+
+def get_permission_conditions(doctype):
+	"""Returns the conditions on the records of `doctype` the user can read, an empty string if
+	the user can read all records. Raises `vmraid.PermissionError` if the user can't read any."""
+	from vmraid.model.db_query import DatabaseQuery
+
+	if not vmraid.has_permission(doctype):
+		raise vmraid.PermissionError
+
+	db_query = DatabaseQuery(doctype)
+	match_conditions = db_query.build_match_conditions()
+
+	# for users who can only read shared records, the share condition is added to the
+	# query conditions instead of the match conditions
+	return " and ".join(filter(None, db_query.conditions + [match_conditions]))
+
+
+def get_cache_ttl():
+	return cint(vmraid.conf.get("dashboard_cache_ttl", DEFAULT_CACHE_TTL))
+
+
 def get_dashboards_with_link(docname, doctype):
 	dashboards = []
 	links = []
@@ -0,0 +1,64 @@
+# Copyright (c) 2022, VMRaid and Contributors
+# License: MIT. See LICENSE
+"""
+Per-process buffers pushed to Redis by a background thread.
+
+Requests and jobs add to the buffer of their process instead of writing to Redis,
+so that they never wait for Redis. A daemon thread of the process flushes the
+buffer every `flush_interval` seconds, or as soon as it is woken up, and the
+buffer is flushed once more when the process exits.
+"""
+
+import atexit
+import os
+import threading
+import traceback
+
+_buffers = {}
+
+
+def get_process_buffer(buffer_class):
+	"""Returns the `buffer_class` instance of this process, (re)created after a fork."""
+	buffer = _buffers.get(buffer_class)
+	if not buffer or buffer.pid != os.getpid():
+		buffer = _buffers[buffer_class] = buffer_class()
+		atexit.register(buffer.flush)
+
+	return buffer
+
+
+class ProcessBuffer:
+	"""Base class of buffers, subclasses add values under `lock` and implement `flush`."""
+
+	flush_interval = 5
+	thread_name = "vmraid-buffer"
+
+	def __init__(self):
+		self.pid = os.getpid()
+		self.connection_pool = None
+		self.lock = threading.Lock()
+		self.wakeup = threading.Event()
+		self.flusher = None
+
+	def ensure_flusher(self):
+		if self.flusher and self.flusher.is_alive():
+			return
+
+		with self.lock:
+			if self.flusher and self.flusher.is_alive():
+				return
+
+			self.flusher = threading.Thread(target=self.run, name=self.thread_name, daemon=True)
+			self.flusher.start()
+
+	def run(self):
+		while True:
+			self.wakeup.wait(self.flush_interval)
+			self.wakeup.clear()
+			try:
+				self.flush()
+			except Exception:
+				traceback.print_exc()
+
+	def flush(self):
+		raise NotImplementedError
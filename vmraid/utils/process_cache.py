@@ -0,0 +1,195 @@
+# Copyright (c) 2022, VMRaid and Contributors
+# License: MIT. See LICENSE
+"""
+Process-wide LRU tier between `vmraid.local.cache` and Redis.
+
+`vmraid.local.cache` is thrown away at the end of every request, so hot keys
+like `app_hooks` and `meta` are fetched from Redis again on every request.
+This tier keeps the pickled values of recently used keys for the lifetime of
+the worker process. Values are kept pickled so that callers never share
+mutable objects across requests.
+
+Every process subscribes to a Redis pub/sub channel. Whenever a key is set or
+deleted through `RedisWrapper`, an invalidation message is published and every
+subscribed process evicts that key. If the subscription is lost, the tier is
+cleared and bypassed until it is re-established. Values are never expired, so
+keys which have an expiry in Redis are not stored.
+
+Enable by setting `process_cache_size` (max number of keys) in site config.
+"""
+
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+INVALIDATION_CHANNEL = "process_cache_invalidation"
+
+# seconds to wait before re-subscribing after the subscription is lost
+RESUBSCRIBE_INTERVAL = 30
+
+# message types
+EVICT_KEY = 0
+EVICT_PREFIX = 1
+
+_process_cache = None
+
+
+def get_process_cache(maxsize):
+	"""Returns the `ProcessCache` of this process, (re)created after a fork."""
+	global _process_cache
+
+	if not _process_cache or _process_cache.pid != os.getpid():
+		_process_cache = ProcessCache(maxsize)
+
+	_process_cache.maxsize = maxsize
+	return _process_cache
+
+
+class ProcessCache:
+	"""Size-bounded LRU of pickled values keyed by Redis key (and hash field).
+
+	A plain key is stored as `(key, None)` and a hash field as `(name, field)`.
+	"""
+
+	def __init__(self, maxsize):
+		self.maxsize = maxsize
+		self.pid = os.getpid()
+		self.data = OrderedDict()
+		self.lock = threading.RLock()
+		self.listener = None
+		self.last_subscribe_attempt = 0
+		self.subscribed = threading.Event()
+
+		# bumped on every eviction, values read from Redis are stored only if
+		# no invalidation was processed while they were being fetched
+		self.generation = 0
+
+	@property
+	def active(self):
+		return self.subscribed.is_set()
+
+	def get(self, key, field=None):
+		"""Returns pickled value or None."""
+		if not self.active:
+			return None
+
+		key = as_bytes(key)
+		with self.lock:
+			try:
+				self.data.move_to_end((key, field))
+			except KeyError:
+				return None
+			return self.data[(key, field)]
+
+	def set(self, key, value, field=None, generation=None):
+		if not self.active or value is None:
+			return
+
+		key = as_bytes(key)
+		with self.lock:
+			if generation is not None and generation != self.generation:
+				return
+
+			self.data[(key, field)] = value
+			self.data.move_to_end((key, field))
+			while len(self.data) > self.maxsize:
+				self.data.popitem(last=False)
+
+	def evict(self, key, field=None):
+		"""Evict a key; if `field` is None, evict the key and all its hash fields."""
+		key = as_bytes(key)
+		with self.lock:
+			self.generation += 1
+			if field is not None:
+				self.data.pop((key, field), None)
+				return
+
+			for cache_key in [k for k in self.data if k[0] == key]:
+				del self.data[cache_key]
+
+	def evict_prefix(self, prefix):
+		prefix = as_bytes(prefix)
+		with self.lock:
+			self.generation += 1
+			for cache_key in [k for k in self.data if k[0].startswith(prefix)]:
+				del self.data[cache_key]
+
+	def clear(self):
+		with self.lock:
+			self.generation += 1
+			self.data.clear()
+
+	def ensure_listener(self, connection):
+		"""Start the invalidation subscriber thread if it is not running."""
+		if self.listener and self.listener.is_alive():
+			return
+
+		with self.lock:
+			if self.listener and self.listener.is_alive():
+				return
+
+			if time.monotonic() - self.last_subscribe_attempt < RESUBSCRIBE_INTERVAL:
+				return
+
+			self.last_subscribe_attempt = time.monotonic()
+			self.listener = threading.Thread(
+				target=self.listen,
+				args=(connection.connection_pool.connection_kwargs.copy(),),
+				name="vmraid-process-cache",
+				daemon=True,
+			)
+			self.listener.start()
+
+	def listen(self, connection_kwargs):
+		try:
+			pubsub = redis.Redis(**connection_kwargs).pubsub()
+			pubsub.subscribe(INVALIDATION_CHANNEL)
+
+			# wait for the subscription to be confirmed before serving values,
+			# anything cached before this point may have missed invalidations
+			confirmation = pubsub.get_message(timeout=5)
+			if not confirmation or confirmation["type"] != "subscribe":
+				return
+
+			self.clear()
+			self.subscribed.set()
+
+			for message in pubsub.listen():
+				if message["type"] == "message":
+					self.process_message(message["data"])
+
+		except redis.exceptions.RedisError:
+			pass
+
+		finally:
+			self.subscribed.clear()
+			self.clear()
+
+	def process_message(self, data):
+		try:
+			message_type, key, field = pickle.loads(data)
+		except Exception:
+			# unknown message, play safe
+			self.clear()
+			return
+
+		if message_type == EVICT_PREFIX:
+			self.evict_prefix(key)
+		else:
+			self.evict(key, field)
+
+
+def make_invalidation_message(key, field=None):
+	return pickle.dumps((EVICT_KEY, key, field))
+
+
+def make_prefix_invalidation_message(prefix):
+	return pickle.dumps((EVICT_PREFIX, prefix, None))
+
+
+def as_bytes(key):
+	return key if isinstance(key, bytes) else str(key).encode("utf-8")
@@ -2,16 +2,48 @@
 # License: MIT. See LICENSE
 import pickle
 import re
+from time import time
 
 import redis
 
 import vmraid
-from vmraid.utils import cstr
+from vmraid.utils import cint, create_batch, cstr
+from vmraid.utils.process_cache import (
+	INVALIDATION_CHANNEL,
+	get_process_cache,
+	make_invalidation_message,
+	make_prefix_invalidation_message,
+)
+
+# keys walked per SCAN call and deleted per UNLINK call
+SCAN_COUNT = 1000
+DELETE_BATCH_SIZE = 1000
 
 
 class RedisWrapper(redis.Redis):
 	"""Redis client that will automatically prefix conf.db_name"""
 
+	def execute_command(self, *args, **options):
+		# call count and time of the transaction, see `vmraid.monitor`
+		monitor = getattr(vmraid.local, "monitor", None)
+		if not monitor:
+			return super(RedisWrapper, self).execute_command(*args, **options)
+
+		start = time()
+		try:
+			return super(RedisWrapper, self).execute_command(*args, **options)
+		finally:
+			monitor.add_redis_call(time() - start)
+
+	def add_cache_lookup(self, tier):
+		# cache hit ratio of the transaction, see `vmraid.metrics`
+		metrics = getattr(vmraid.local, "metrics", None)
+		if metrics:
+			metrics.add_cache_lookup(tier)
+
+	def pipeline(self, transaction=True, shard_hint=None):
+		return MonitoredPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
 	def connected(self):
 		try:
 			self.ping()
@@ -30,6 +62,61 @@ class RedisWrapper(redis.Redis):
 
 		return "{0}|{1}".format(vmraid.conf.db_name, key).encode("utf-8")
 
+	def get_process_cache_size(self):
+		conf = getattr(vmraid.local, "conf", None)
+		return cint(conf and conf.get("process_cache_size"))
+
+	def get_process_cache(self):
+		"""Returns the process-wide LRU tier if it is enabled and in sync with Redis."""
+		size = self.get_process_cache_size()
+		if not size:
+			return None
+
+		process_cache = get_process_cache(size)
+		process_cache.ensure_listener(self)
+		return process_cache if process_cache.active else None
+
+	def invalidate_process_cache(self, keys):
+		"""Evict `(key, hash field)` pairs from the process cache of every worker."""
+		if not keys or not self.get_process_cache_size():
+			return
+
+		process_cache = get_process_cache(self.get_process_cache_size())
+		for key, field in keys:
+			process_cache.evict(key, field)
+
+		try:
+			pipe = self.pipeline(transaction=False)
+			for key, field in keys:
+				pipe.publish(INVALIDATION_CHANNEL, make_invalidation_message(key, field))
+			pipe.execute()
+		except redis.exceptions.ConnectionError:
+			pass
+
+	def clear_process_cache(self):
+		"""Evict all keys of the current site from the process cache of every worker."""
+		if not self.get_process_cache_size():
+			return
+
+		prefix = self.make_key("")
+		get_process_cache(self.get_process_cache_size()).evict_prefix(prefix)
+
+		try:
+			self.publish(INVALIDATION_CHANNEL, make_prefix_invalidation_message(prefix))
+		except redis.exceptions.ConnectionError:
+			pass
+
+	def get_for_process_cache(self, keys):
+		"""Returns values of `keys` and whether each of them may be stored in the process
+		cache, which never expires values, so keys with an expiry (`setex`) are not stored."""
+		pipe = self.pipeline(transaction=False)
+		pipe.mget(keys)
+		for key in keys:
+			pipe.pttl(key)
+
+		values, *ttls = pipe.execute()
+		return values, [ttl == -1 for ttl in ttls]
+
 	def set_value(self, key, val, user=None, expires_in_sec=None, shared=False):
 		"""Sets cache value.
 
@@ -52,6 +139,8 @@ class RedisWrapper(redis.Redis):
 		except redis.exceptions.ConnectionError:
 			return None
 
+		self.invalidate_process_cache([(key, None)])
+
 	def get_value(self, key, generator=None, user=None, expires=False, shared=False):
 		"""Returns cache value. If not found and generator function is
 		        given, it will call the generator.
@@ -65,13 +154,29 @@ class RedisWrapper(redis.Redis):
 
 		if key in vmraid.local.cache:
 			val = vmraid.local.cache[key]
+			self.add_cache_lookup("local")
 
 		else:
 			val = None
-			try:
-				val = self.get(key)
-			except redis.exceptions.ConnectionError:
-				pass
+			process_cache = None if expires else self.get_process_cache()
+			if process_cache:
+				val = process_cache.get(key)
+
+			if val is None:
+				generation = process_cache and process_cache.generation
+				try:
+					if process_cache:
+						[val], [cacheable] = self.get_for_process_cache([key])
+						if cacheable:
+							process_cache.set(key, val, generation=generation)
+					else:
+						val = self.get(key)
+				except redis.exceptions.ConnectionError:
+					pass
+
+				self.add_cache_lookup("miss" if val is None else "redis")
+			else:
+				self.add_cache_lookup("process")
 
 			if val is not None:
 				val = pickle.loads(val)
@@ -86,18 +191,89 @@ class RedisWrapper(redis.Redis):
 
 		return val
 
-	def get_all(self, key):
-		ret = {}
-		for k in self.get_keys(key):
-			ret[key] = self.get_value(k)
+	def get_values(self, keys, user=None, shared=False):
+		"""Returns dict of cache values of `keys`, None for keys which are not cached.
+
+		Keys which are not in the local or process cache are fetched with a single `MGET`."""
+		redis_keys = {key: self.make_key(key, user, shared) for key in keys}
+		process_cache = self.get_process_cache()
+		values = {}
+		missing = []
+
+		for redis_key in redis_keys.values():
+			if redis_key in vmraid.local.cache:
+				values[redis_key] = vmraid.local.cache[redis_key]
+				continue
+
+			value = process_cache.get(redis_key) if process_cache else None
+			if value is None:
+				missing.append(redis_key)
+			else:
+				values[redis_key] = vmraid.local.cache[redis_key] = pickle.loads(value)
+
+		if missing:
+			generation = process_cache and process_cache.generation
+			cacheable = [False] * len(missing)
+			try:
+				if process_cache:
+					fetched, cacheable = self.get_for_process_cache(missing)
+				else:
+					fetched = self.mget(missing)
+			except redis.exceptions.ConnectionError:
+				fetched = [None] * len(missing)
+
+			for redis_key, value, can_cache in zip(missing, fetched, cacheable):
+				if can_cache:
+					process_cache.set(redis_key, value, generation=generation)
+
+				if value is not None:
+					value = pickle.loads(value)
+				values[redis_key] = vmraid.local.cache[redis_key] = value
+
+		return {key: values[redis_key] for key, redis_key in redis_keys.items()}
+
+	def set_values(self, mapping, user=None, expires_in_sec=None, shared=False):
+		"""Sets cache values of all keys in `mapping` in a single round trip.
 
-		return ret
+		:param mapping: Dict of cache key and value
+		:param user: Prepends keys with User
+		:param expires_in_sec: Expire values in X seconds
+		"""
+		mapping = {self.make_key(key, user, shared): val for key, val in mapping.items()}
+		if not mapping:
+			return
+
+		if not expires_in_sec:
+			vmraid.local.cache.update(mapping)
+
+		try:
+			if expires_in_sec:
+				pipe = self.pipeline(transaction=False)
+				for key, val in mapping.items():
+					pipe.setex(name=key, time=expires_in_sec, value=pickle.dumps(val))
+				pipe.execute()
+			else:
+				self.mset({key: pickle.dumps(val) for key, val in mapping.items()})
+
+		except redis.exceptions.ConnectionError:
+			return None
+
+		self.invalidate_process_cache([(key, None) for key in mapping])
+
+	def get_all(self, key):
+		"""Returns dict of cache values of keys starting with `key`."""
+		keys = self.get_keys(key)
+		values = self.get_values(keys, shared=True)
+		return {k: values[k] for k in keys}
 
 	def get_keys(self, key):
-		"""Return keys starting with `key`."""
+		"""Return keys starting with `key`.
+
+		Keys are found with `SCAN`, which unlike `KEYS` does not block the server while
+		walking all keys."""
 		try:
 			key = self.make_key(key + "*")
-			return self.keys(key)
+			return list(dict.fromkeys(self.scan_iter(match=key, count=SCAN_COUNT)))
 
 		except redis.exceptions.ConnectionError:
 			regex = re.compile(cstr(key).replace("|", r"\|").replace("*", r"[\w]*"))
@@ -114,21 +290,25 @@ class RedisWrapper(redis.Redis):
 		self.delete_value(*args, **kwargs)
 
 	def delete_value(self, keys, user=None, make_keys=True, shared=False):
-		"""Delete value, list of values."""
+		"""Delete value, list of values.
+
+		Values are unlinked in batches, Redis frees their memory in the background."""
 		if not isinstance(keys, (list, tuple)):
 			keys = (keys,)
 
+		if make_keys:
+			keys = [self.make_key(key, shared=shared) for key in keys]
+
 		for key in keys:
-			if make_keys:
-				key = self.make_key(key, shared=shared)
+			vmraid.local.cache.pop(key, None)
 
-			if key in vmraid.local.cache:
-				del vmraid.local.cache[key]
+		try:
+			for batch in create_batch(keys, DELETE_BATCH_SIZE):
+				self.unlink(*batch)
+		except redis.exceptions.ConnectionError:
+			pass
 
-			try:
-				self.delete(key)
-			except redis.exceptions.ConnectionError:
-				pass
+		self.invalidate_process_cache([(key, None) for key in keys])
 
 	def lpush(self, key, value):
 		super(RedisWrapper, self).lpush(self.make_key(key), value)
@@ -166,7 +346,9 @@ class RedisWrapper(redis.Redis):
 		try:
 			super(RedisWrapper, self).hset(_name, key, pickle.dumps(value))
 		except redis.exceptions.ConnectionError:
-			pass
+			return
+
+		self.invalidate_process_cache([(_name, key)])
 
 	def hgetall(self, name):
 		value = super(RedisWrapper, self).hgetall(self.make_key(name))
@@ -181,13 +363,27 @@ class RedisWrapper(redis.Redis):
 			return None
 
 		if key in vmraid.local.cache[_name]:
+			self.add_cache_lookup("local")
 			return vmraid.local.cache[_name][key]
 
 		value = None
-		try:
-			value = super(RedisWrapper, self).hget(_name, key)
-		except redis.exceptions.ConnectionError:
-			pass
+		process_cache = self.get_process_cache()
+		if process_cache:
+			value = process_cache.get(_name, key)
+
+		if value is None:
+			generation = process_cache and process_cache.generation
+			try:
+				value = super(RedisWrapper, self).hget(_name, key)
+			except redis.exceptions.ConnectionError:
+				pass
+
+			if process_cache:
+				process_cache.set(_name, value, field=key, generation=generation)
+
+			self.add_cache_lookup("miss" if value is None else "redis")
+		else:
+			self.add_cache_lookup("process")
 
 		if value:
 			value = pickle.loads(value)
@@ -200,6 +396,47 @@ class RedisWrapper(redis.Redis):
 				pass
 		return value
 
+	def hget_many(self, name, keys, shared=False):
+		"""Returns dict of values of hash fields `keys`, None for fields which are not set.
+
+		Fields which are not in the local or process cache are fetched with a single `HMGET`."""
+		_name = self.make_key(name, shared=shared)
+		local_cache = vmraid.local.cache.setdefault(_name, {})
+		process_cache = self.get_process_cache()
+		values = {}
+		missing = []
+
+		for key in keys:
+			if not key:
+				continue
+
+			if key in local_cache:
+				values[key] = local_cache[key]
+				continue
+
+			value = process_cache.get(_name, key) if process_cache else None
+			if value is None:
+				missing.append(key)
+			else:
+				values[key] = local_cache[key] = pickle.loads(value)
+
+		if missing:
+			generation = process_cache and process_cache.generation
+			try:
+				fetched = super(RedisWrapper, self).hmget(_name, missing)
+			except redis.exceptions.ConnectionError:
+				fetched = [None] * len(missing)
+
+			for key, value in zip(missing, fetched):
+				if process_cache:
+					process_cache.set(_name, value, field=key, generation=generation)
+
+				values[key] = None
+				if value:
+					values[key] = local_cache[key] = pickle.loads(value)
+
+		return values
+
 	def hdel(self, name, key, shared=False):
 		_name = self.make_key(name, shared=shared)
 
@@ -211,6 +448,45 @@ class RedisWrapper(redis.Redis):
 		except redis.exceptions.ConnectionError:
 			pass
 
+		self.invalidate_process_cache([(_name, key)])
+
+	def hdel_many(self, name, keys, shared=False):
+		"""Delete hash fields `keys` of `name` in a single round trip."""
+		_name = self.make_key(name, shared=shared)
+		keys = [key for key in keys if key]
+		if not keys:
+			return
+
+		local_cache = vmraid.local.cache.get(_name) or {}
+		for key in keys:
+			local_cache.pop(key, None)
+
+		try:
+			super(RedisWrapper, self).hdel(_name, *keys)
+		except redis.exceptions.ConnectionError:
+			pass
+
+		self.invalidate_process_cache([(_name, key) for key in keys])
+
+	def hdel_names(self, names, key, shared=False):
+		"""Delete hash field `key` from each of the hashes `names` in a single round trip."""
+		if not key:
+			return
+
+		names = [self.make_key(name, shared=shared) for name in names]
+		for _name in names:
+			(vmraid.local.cache.get(_name) or {}).pop(key, None)
+
+		try:
+			pipe = self.pipeline(transaction=False)
+			for _name in names:
+				pipe.hdel(_name, key)
+			pipe.execute()
+		except redis.exceptions.ConnectionError:
+			pass
+
+		self.invalidate_process_cache([(_name, key) for _name in names])
+
 	def hdel_keys(self, name_starts_with, key):
 		"""Delete hash names with wildcard `*` and key"""
 		for name in vmraid.cache().get_keys(name_starts_with):
@@ -246,3 +522,18 @@ class RedisWrapper(redis.Redis):
 	def smembers(self, name):
 		"""Return all members of the set"""
 		return super(RedisWrapper, self).smembers(self.make_key(name))
+
+
+class MonitoredPipeline(redis.client.Pipeline):
+	"""Pipeline counted as a single call by `vmraid.monitor`"""
+
+	def execute(self, raise_on_error=True):
+		monitor = getattr(vmraid.local, "monitor", None)
+		if not monitor:
+			return super(MonitoredPipeline, self).execute(raise_on_error)
+
+		start = time()
+		try:
+			return super(MonitoredPipeline, self).execute(raise_on_error)
+		finally:
+			monitor.add_redis_call(time() - start)
@@ -56,6 +56,7 @@ def build_response(response_type=None):
 		"page": as_page,
 		"redirect": redirect,
 		"binary": as_binary,
+		"file": as_file,
 	}
 
 	return response_type_map[vmraid.response.get("type") or response_type]()
@@ -132,6 +133,24 @@ def as_binary():
 	return response
 
 
+def as_file():
+	"""Stream `fileobj` (e.g. a temporary file with a large export) to the client
+	in chunks instead of reading it into memory. The file is closed when sent."""
+	fileobj = vmraid.response["fileobj"]
+	filename = vmraid.response["filename"]
+	fileobj.seek(0, os.SEEK_END)
+	content_length = fileobj.tell()
+	fileobj.seek(0)
+
+	response = Response(wrap_file(vmraid.local.request.environ, fileobj), direct_passthrough=True)
+	response.mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+	response.content_length = content_length
+	response.headers["Content-Disposition"] = (
+		'attachment; filename="%s"' % filename.replace(" ", "_")
+	).encode("utf-8")
+	return response
+
+
 def make_logs(response=None):
 	"""make strings for msgprint and errprint"""
 	if not response:
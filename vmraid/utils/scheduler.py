@@ -17,6 +17,7 @@ import schedule
 
 # imports - module imports
 import vmraid
+import vmraid.metrics
 from vmraid.installer import update_site_config
 from vmraid.utils import get_sites, now_datetime
 from vmraid.utils.background_jobs import get_jobs
@@ -86,10 +87,23 @@ def enqueue_events(site):
 	if schedule_jobs_based_on_activity():
 		vmraid.flags.enqueued_jobs = []
 		queued_jobs = get_jobs(site=site, key="job_type").get(site) or []
+		now = now_datetime()
 		for job_type in vmraid.get_all("Scheduled Job Type", ("name", "method"), dict(stopped=0)):
+			doc = vmraid.get_doc("Scheduled Job Type", job_type.name)
+			set_scheduler_lag(doc, now)
 			if not job_type.method in queued_jobs:
 				# don't add it to queue if still pending
-				vmraid.get_doc("Scheduled Job Type", job_type.name).enqueue()
+				doc.enqueue()
+
+
+def set_scheduler_lag(job_type, now):
+	"""Set the time since `job_type` was due without being started, on every tick so that
+	the lag keeps growing while its jobs are not run."""
+	if not job_type.last_execution:
+		return
+
+	lag = max((now - job_type.get_next_execution()).total_seconds(), 0)
+	vmraid.metrics.set_gauge("vmraid_scheduler_lag_seconds", lag, job_type=job_type.name)
 
 
 def is_scheduler_inactive():
@@ -17,6 +17,16 @@ ILLEGAL_CHARACTERS_RE = re.compile(r"[\000-\010]|[\013-\014]|[\016-\037]")
 
 # return xlsx file object
 def make_xlsx(data, sheet_name, wb=None, column_widths=None):
+	xlsx_file = BytesIO()
+	write_xlsx(data, sheet_name, xlsx_file, wb=wb, column_widths=column_widths)
+	return xlsx_file
+
+
+def write_xlsx(data, sheet_name, fileobj, wb=None, column_widths=None):
+	"""Write rows to `fileobj` in xlsx format.
+
+	`data` can be any iterable of rows, e.g. a generator reading from the database.
+	The workbook is write only, so rows are not kept in memory."""
 	column_widths = column_widths or []
 	if wb is None:
 		wb = openpyxl.Workbook(write_only=True)
@@ -46,9 +56,7 @@ def make_xlsx(data, sheet_name, wb=None, column_widths=None):
 
 		ws.append(clean_row)
 
-	xlsx_file = BytesIO()
-	wb.save(xlsx_file)
-	return xlsx_file
+	wb.save(fileobj)
 
 
 def handle_html(data):
@@ -90,15 +98,19 @@ def read_xlsx_file_from_attached_file(file_url=None, fcontent=None, filepath=Non
 	else:
 		return
 
-	rows = []
-	wb1 = load_workbook(filename=filename, read_only=True, data_only=True)
-	ws1 = wb1.active
-	for row in ws1.iter_rows():
-		tmp_list = []
-		for cell in row:
-			tmp_list.append(cell.value)
-		rows.append(tmp_list)
-	return rows
+	return list(read_xlsx_rows(filename))
+
+
+def read_xlsx_rows(filename):
+	"""Yields rows of the active sheet, without loading the whole sheet in memory.
+
+	:param filename: Path or file object of the workbook."""
+	wb = load_workbook(filename=filename, read_only=True, data_only=True)
+	try:
+		for row in wb.active.iter_rows(values_only=True):
+			yield list(row)
+	finally:
+		wb.close()
 
 
 def read_xls_file_from_attached_file(content):